@@ -2,14 +2,18 @@ from .screenwriter import Screenwriter
 from .storyboard_artist import StoryboardArtist
 from .camera_image_generator import CameraImageGenerator
 from .character_extractor import CharacterExtractor
+from .environment_extractor import EnvironmentExtractor
 from .character_portraits_generator import CharacterPortraitsGenerator
 from .reference_image_selector import ReferenceImageSelector
+from .best_image_selector import BestImageSelector
 
 __all__ = [
     "Screenwriter",
     "StoryboardArtist",
     "CameraImageGenerator",
     "CharacterExtractor",
+    "EnvironmentExtractor",
     "CharacterPortraitsGenerator",
     "ReferenceImageSelector",
+    "BestImageSelector",
 ]
\ No newline at end of file
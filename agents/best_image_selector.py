@@ -4,7 +4,6 @@ from pydantic import BaseModel, Field
 from tenacity import retry, stop_after_attempt
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain.chat_models import init_chat_model
 from utils.image import image_path_to_b64
 
 
@@ -61,17 +60,10 @@ class BestImageResponse(BaseModel):
 class BestImageSelector:
     def __init__(
         self,
-        base_url: str,
-        api_key: str,
-        chat_model: str,
+        chat_model,
     ):
-        
-        self.chat_model = init_chat_model(
-            model=chat_model,
-            model_provider="openai",
-            base_url=base_url,
-            api_key=api_key,
-        )
+
+        self.chat_model = chat_model
 
 
     @retry(
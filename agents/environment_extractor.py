@@ -0,0 +1,64 @@
+from langchain_core.output_parsers import PydanticOutputParser
+from tenacity import retry, stop_after_attempt
+from interfaces.environment import EnvironmentInScene
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from utils.retry import after_func
+
+
+system_prompt_template_extract_environment = \
+"""
+[Role]
+You are a top-tier movie script analysis expert.
+
+[Task]
+Your task is to analyze the provided scene of a script and extract the environment (the setting) the scene takes place in.
+
+[Input]
+You will receive one scene of a script enclosed within <SCRIPT> and </SCRIPT>.
+
+[Output]
+{format_instructions}
+
+[Guidelines]
+- Ensure that the language of the description matches that used in the script. The slugline is always written in the standard screenplay format, e.g. "INT. COFFEE SHOP - NIGHT".
+- Name the location in the slugline the same way every time it appears, so that scenes at the same location and time of day get the same slugline. Prefer the general name of the place (e.g., "INT. LIN'S APARTMENT - LIVING ROOM - NIGHT") to details that change between scenes.
+- If the scene takes place in several locations, choose the one where most of it takes place.
+- In the description, describe only the setting: architecture, furniture, props, lighting, weather and colors. Don't describe any characters or actions.
+- If the setting is not described or only partially outlined in the script, design plausible details based on the context, so that the description can be visualized.
+"""
+
+human_prompt_template_extract_environment = \
+"""
+<SCRIPT>
+{script}
+</SCRIPT>
+"""
+
+
+
+class EnvironmentExtractor:
+    def __init__(
+        self,
+        chat_model,
+    ):
+        self.chat_model = chat_model
+
+    @retry(
+        stop=stop_after_attempt(3),
+        after=after_func,
+    )
+    async def extract_environment(self, script: str) -> EnvironmentInScene:
+
+        parser = PydanticOutputParser(pydantic_object=EnvironmentInScene)
+
+        messages = [
+            SystemMessage(content=system_prompt_template_extract_environment.format(format_instructions=parser.get_format_instructions())),
+            HumanMessage(content=human_prompt_template_extract_environment.format(script=script)),
+        ]
+
+        chain = self.chat_model | parser
+
+        environment: EnvironmentInScene = await chain.ainvoke(messages)
+
+        return environment
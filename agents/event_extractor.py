@@ -1,10 +1,11 @@
 import os
 import logging
 import asyncio
-from typing import List
+from typing import Callable, List, Optional, Tuple
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain.chat_models import init_chat_model
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pydantic import BaseModel, Field
 from tenacity import retry, stop_after_attempt
 
@@ -74,6 +75,57 @@ human_prompt_template_extract_next_event = \
 <EXTRACTED_EVENTS_END>
 """
 
+human_prompt_template_extract_next_event_in_window = \
+"""
+The novel is too long to be processed at once, so it is split into {num_windows} consecutive segments that overlap with their neighbors. The text below is segment {window_idx} (counting from 0). The extracted events are those of this segment only; number events from 0 within the segment.
+Only extract events that begin within this segment. An event that begins within the segment but continues past its end should be described as far as the segment tells it. Set is_last to true for the last event that begins within this segment.
+
+<NOVEL_TEXT_START>
+{novel_text}
+<NOVEL_TEXT_END>
+
+<EXTRACTED_EVENTS_START>
+{extracted_events}
+<EXTRACTED_EVENTS_END>
+"""
+
+
+system_prompt_template_reconcile_boundary = \
+"""
+You are a highly skilled Literary Analyst AI. Events were extracted from two consecutive, overlapping segments of a novel, so the same event may have been extracted from both segments.
+
+**TASK**
+Determine how many of the first events of the later segment describe the same events as the last events of the earlier segment.
+
+**INPUT**
+1. The last events extracted from the earlier segment (in order), enclosed within <EARLIER_EVENTS_START> and <EARLIER_EVENTS_END> tags.
+2. The first events extracted from the later segment (in order), enclosed within <LATER_EVENTS_START> and <LATER_EVENTS_END> tags.
+
+**OUTPUT**
+{format_instructions}
+
+**GUIDELINES**
+1. Two events are the same if they describe the same happening of the story, even if they are worded differently or one of them is described only partially because it was cut at a segment boundary.
+2. Duplicates can only be a suffix of the earlier events matching a prefix of the later events, in the same order. Return the length of that overlap, or 0 if the later segment starts with a new event.
+"""
+
+human_prompt_template_reconcile_boundary = \
+"""
+<EARLIER_EVENTS_START>
+{earlier_events}
+<EARLIER_EVENTS_END>
+
+<LATER_EVENTS_START>
+{later_events}
+<LATER_EVENTS_END>
+"""
+
+
+class ReconcileBoundaryResponse(BaseModel):
+    num_duplicated_events: int = Field(
+        description="The number of events at the beginning of the later segment that are duplicates of the events at the end of the earlier segment.",
+    )
+
 
 
 class EventExtractor:
@@ -82,7 +134,20 @@ class EventExtractor:
         api_key: str,
         base_url: str,
         chat_model: str,
+        window_size: Optional[int] = None,
+        window_overlap: int = 4096,
+        max_concurrent_windows: int = 5,
     ):
+        """
+        Args:
+            window_size:
+            The segment length (in characters) of the windowed extraction. None (or a novel that fits in one
+            window) extracts the events of the whole novel one after another, resending the whole novel each time.
+
+            window_overlap:
+            How many characters consecutive windows share, so that an event cut at a window boundary is
+            seen whole by one of them. Duplicates at the boundaries are removed by `reconcile_windows`.
+        """
         self.chat_model = init_chat_model(
             model=chat_model,
             model_provider="openai",
@@ -91,6 +156,15 @@ class EventExtractor:
         )
         self.parser = PydanticOutputParser(pydantic_object=Event)
 
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        self.max_concurrent_windows = max_concurrent_windows
+        if window_size is not None:
+            self.splitter = RecursiveCharacterTextSplitter(
+                chunk_size=window_size,
+                chunk_overlap=window_overlap,
+            )
+
 
     def __call__(
         self,
@@ -110,30 +184,49 @@ class EventExtractor:
         return events
 
 
-    @retry(
-        stop=stop_after_attempt(3),
-        after=lambda retry_state: logging.warning(f"Retrying extract_next_event due to error: {retry_state.outcome.exception()}"),
-    )
-    def extract_next_event(
+    def _build_messages(
         self,
         novel_text: str,
-        extracted_events: List[Event]
-    ) -> Event:
-        
+        extracted_events: List[Event],
+        window: Optional[Tuple[int, int]] = None,
+    ):
         extracted_events_str = "\n\n".join([str(e) for e in extracted_events])
 
-        messages = [
+        if window is None:
+            human_prompt = human_prompt_template_extract_next_event.format(
+                novel_text=novel_text,
+                extracted_events=extracted_events_str,
+            )
+        else:
+            human_prompt = human_prompt_template_extract_next_event_in_window.format(
+                window_idx=window[0],
+                num_windows=window[1],
+                novel_text=novel_text,
+                extracted_events=extracted_events_str,
+            )
+
+        return [
             SystemMessage(
                 content=system_prompt_template_extract_events.format(format_instructions=self.parser.get_format_instructions()),
             ),
             HumanMessage(
-                content=human_prompt_template_extract_next_event.format(
-                    novel_text=novel_text,
-                    extracted_events=extracted_events_str,
-                )
+                content=human_prompt,
             )
         ]
 
+
+    @retry(
+        stop=stop_after_attempt(3),
+        after=lambda retry_state: logging.warning(f"Retrying extract_next_event due to error: {retry_state.outcome.exception()}"),
+    )
+    def extract_next_event(
+        self,
+        novel_text: str,
+        extracted_events: List[Event]
+    ) -> Event:
+        
+        messages = self._build_messages(novel_text, extracted_events)
+
         chain = self.chat_model | self.parser
 
         event: Event = chain.invoke(messages)
@@ -143,4 +236,147 @@ class EventExtractor:
         return event
 
 
+    @retry(
+        stop=stop_after_attempt(3),
+        after=lambda retry_state: logging.warning(f"Retrying aextract_next_event due to error: {retry_state.outcome.exception()}"),
+    )
+    async def aextract_next_event(
+        self,
+        novel_text: str,
+        extracted_events: List[Event],
+        window: Optional[Tuple[int, int]] = None,
+    ) -> Event:
+        """
+        The async version of `extract_next_event`.
+
+        Args:
+            window:
+            (window_idx, num_windows) if `novel_text` is one window of the novel; `extracted_events` are then those of the window.
+        """
+        messages = self._build_messages(novel_text, extracted_events, window)
+
+        chain = self.chat_model | self.parser
+
+        event: Event = await chain.ainvoke(messages)
+
+        assert event.index == len(extracted_events), f"Extracted event index {event.index} does not match the expected index {len(extracted_events)}"
+
+        return event
+
+
+    def split_windows(
+        self,
+        novel_text: str,
+    ) -> List[str]:
+        """Split the novel into overlapping windows. A single window means the windowed extraction is not needed."""
+        if self.window_size is None or len(novel_text) <= self.window_size:
+            return [novel_text]
+        return self.splitter.split_text(novel_text)
+
 
+    async def extract_events_in_window(
+        self,
+        semaphore: asyncio.Semaphore,
+        window_idx: int,
+        windows: List[str],
+        extracted_events: Optional[List[Event]] = None,
+        on_event: Optional[Callable[[int, Event], None]] = None,
+    ) -> Tuple[int, List[Event]]:
+        """
+        Extract the events of one window until the one marked `is_last`, continuing after `extracted_events`
+        (the events of the window extracted by a previous run). `on_event(window_idx, event)` is called after
+        each extracted event, e.g. to save it.
+        """
+        events = list(extracted_events or [])
+        async with semaphore:
+            while len(events) == 0 or not events[-1].is_last:
+                event = await self.aextract_next_event(
+                    novel_text=windows[window_idx],
+                    extracted_events=events,
+                    window=(window_idx, len(windows)) if len(windows) > 1 else None,
+                )
+                events.append(event)
+                if on_event is not None:
+                    on_event(window_idx, event)
+        return window_idx, events
+
+
+    @retry(
+        stop=stop_after_attempt(3),
+        after=lambda retry_state: logging.warning(f"Retrying reconcile_boundary due to error: {retry_state.outcome.exception()}"),
+    )
+    async def reconcile_boundary(
+        self,
+        earlier_events: List[Event],
+        later_events: List[Event],
+    ) -> int:
+        """Return how many of the first `later_events` duplicate the last `earlier_events`."""
+        if not earlier_events or not later_events:
+            return 0
+
+        parser = PydanticOutputParser(pydantic_object=ReconcileBoundaryResponse)
+        messages = [
+            SystemMessage(
+                content=system_prompt_template_reconcile_boundary.format(format_instructions=parser.get_format_instructions()),
+            ),
+            HumanMessage(
+                content=human_prompt_template_reconcile_boundary.format(
+                    earlier_events="\n\n".join([str(e) for e in earlier_events]),
+                    later_events="\n\n".join([str(e) for e in later_events]),
+                )
+            ),
+        ]
+        chain = self.chat_model | parser
+        response: ReconcileBoundaryResponse = await chain.ainvoke(messages)
+        return max(0, min(response.num_duplicated_events, len(earlier_events), len(later_events)))
+
+
+    async def reconcile_windows(
+        self,
+        window_events: List[List[Event]],
+        boundary_events: int = 3,
+    ) -> List[Event]:
+        """
+        Merge the events of consecutive windows into the events of the novel: duplicates extracted from both
+        sides of a window boundary are kept once (the version with the longer process chain, as the other one
+        was likely cut by the boundary), then events are renumbered from 0 and only the last is marked `is_last`.
+
+        Args:
+            boundary_events:
+            How many events on each side of a boundary are compared. The window overlap rarely holds more.
+        """
+        num_duplicated = await asyncio.gather(*[
+            self.reconcile_boundary(window_events[i][-boundary_events:], window_events[i + 1][:boundary_events])
+            for i in range(len(window_events) - 1)
+        ])
+
+        merged: List[Event] = list(window_events[0])
+        for later_events, num in zip(window_events[1:], num_duplicated):
+            later_events = list(later_events)
+            for k in range(num):
+                earlier_idx = len(merged) - num + k
+                if len(later_events[k].process_chain) > len(merged[earlier_idx].process_chain):
+                    merged[earlier_idx] = later_events[k]
+            merged.extend(later_events[num:])
+
+        return [
+            event.model_copy(update={"index": index, "is_last": index == len(merged) - 1})
+            for index, event in enumerate(merged)
+        ]
+
+
+    async def aextract_events(
+        self,
+        novel_text: str,
+    ) -> List[Event]:
+        """Extract the events of the whole novel, window by window concurrently if it is longer than `window_size`."""
+        windows = self.split_windows(novel_text)
+        sem = asyncio.Semaphore(self.max_concurrent_windows)
+        task_outputs = await asyncio.gather(*[
+            self.extract_events_in_window(sem, window_idx, windows)
+            for window_idx in range(len(windows))
+        ])
+        window_events = [events for _, events in sorted(task_outputs, key=lambda pair: pair[0])]
+        if len(windows) == 1:
+            return window_events[0]
+        return await self.reconcile_windows(window_events)
@@ -1,4 +1,9 @@
 import os
+import re
+import json
+import math
+import hashlib
+import difflib
 import logging
 import asyncio
 from typing import List, Tuple, Dict, Optional
@@ -9,6 +14,7 @@ from langchain.output_parsers import PydanticOutputParser
 from interfaces import Event, Scene
 from interfaces import CharacterInScene, CharacterInEvent, CharacterInNovel
 from tenacity import retry, stop_after_attempt
+from utils.artifacts import atomic_open, prepare_checkpoint_dir
 
 
 system_prompt_template_merge_characters_across_scenes_in_event = \
@@ -272,6 +278,230 @@ class GlobalInformationPlanner:
         return existing_characters_in_novel
 
 
+    @staticmethod
+    def characters_in_novel_from_event(
+        event_idx: int,
+        characters_in_event: List[CharacterInEvent],
+    ) -> List[CharacterInNovel]:
+        """The characters of a single event as novel-level characters, the leaves of `merge_characters_in_novel_tree`."""
+        return [
+            CharacterInNovel(
+                index=index,
+                identifier_in_novel=character.identifier_in_event,
+                static_features=character.static_features,
+                active_events={event_idx: character.identifier_in_event},
+            )
+            for index, character in enumerate(characters_in_event)
+        ]
+
+
+    @staticmethod
+    def _character_names(character: CharacterInNovel) -> List[str]:
+        names = {character.identifier_in_novel, *character.active_events.values()}
+        return [name.strip().lower() for name in names if name.strip()]
+
+
+    @classmethod
+    def _names_are_similar(cls, name_a: str, name_b: str) -> bool:
+        # containment covers titles and full names ("Holmes" / "Sherlock Holmes") and names without spaces
+        if name_a in name_b or name_b in name_a:
+            return True
+        if difflib.SequenceMatcher(None, name_a, name_b).ratio() >= 0.8:
+            return True
+        tokens_a = {token for token in re.findall(r"\w+", name_a) if len(token) >= 4}
+        tokens_b = {token for token in re.findall(r"\w+", name_b) if len(token) >= 4}
+        return len(tokens_a & tokens_b) > 0
+
+
+    def pre_cluster_candidates(
+        self,
+        earlier_characters: List[CharacterInNovel],
+        later_characters: List[CharacterInNovel],
+    ) -> Dict[int, List[int]]:
+        """
+        For every later character, the earlier characters it may be the same as, judged by name and alias
+        similarity only. Used to leave unrelated characters out of the merge prompt.
+        """
+        earlier_names = [self._character_names(character) for character in earlier_characters]
+        candidates = {}
+        for later_idx, later_character in enumerate(later_characters):
+            later_names = self._character_names(later_character)
+            candidates[later_idx] = [
+                earlier_idx for earlier_idx, names in enumerate(earlier_names)
+                if any(self._names_are_similar(name_a, name_b) for name_a in names for name_b in later_names)
+            ]
+        return candidates
+
+
+    @retry(
+        stop=stop_after_attempt(3),
+        after=lambda retry_state: logging.warning(f"Retrying due to {retry_state.outcome.exception()}"),
+    )
+    async def merge_character_sets_in_novel(
+        self,
+        earlier_characters: List[CharacterInNovel],
+        later_characters: List[CharacterInNovel],
+        full_context_max_characters: int = 20,
+    ) -> List[CharacterInNovel]:
+        """
+        Merge the characters of two disjoint sets of events into one list, the earlier set first.
+
+        When the earlier list has more than `full_context_max_characters` characters, it is pre-clustered:
+        the prompt only holds the earlier characters whose names resemble a later character's, and later
+        characters resembling none are added as new characters without asking the model.
+        """
+        if not earlier_characters or not later_characters:
+            merged = [character.model_copy(deep=True) for character in earlier_characters + later_characters]
+            for index, character in enumerate(merged):
+                character.index = index
+            return merged
+
+        if len(earlier_characters) > full_context_max_characters:
+            candidates = self.pre_cluster_candidates(earlier_characters, later_characters)
+            shown_earlier = sorted({earlier_idx for idxs in candidates.values() for earlier_idx in idxs})
+            shown_later = [later_idx for later_idx, idxs in candidates.items() if idxs]
+        else:
+            shown_earlier = list(range(len(earlier_characters)))
+            shown_later = list(range(len(later_characters)))
+
+        merged = [character.model_copy(deep=True) for character in earlier_characters]
+        matched = {}
+        if shown_later:
+            existing_characters_str = ""
+            for local_idx, earlier_idx in enumerate(shown_earlier):
+                existing_characters_str += f"<CHARACTER_{local_idx}_START>\n"
+                existing_characters_str += earlier_characters[earlier_idx].identifier_in_novel + "\n"
+                existing_characters_str += "Static features: " + earlier_characters[earlier_idx].static_features + "\n"
+                existing_characters_str += f"<CHARACTER_{local_idx}_END>\n"
+
+            later_characters_str = ""
+            for local_idx, later_idx in enumerate(shown_later):
+                later_characters_str += f"<CHARACTER_{local_idx}_START>\n"
+                later_characters_str += later_characters[later_idx].identifier_in_novel + "\n"
+                later_characters_str += "Static features: " + later_characters[later_idx].static_features + "\n"
+                later_characters_str += f"<CHARACTER_{local_idx}_END>\n"
+
+            parser = PydanticOutputParser(pydantic_object=MergeCharactersToExistingCharactersInNovelResponse)
+            messages = [
+                SystemMessage(
+                    content=system_prompt_template_merge_characters_to_existing_characters_in_novel.format(
+                        format_instructions=parser.get_format_instructions(),
+                    ),
+                ),
+                HumanMessage(
+                    content=human_prompt_template_merge_characters_to_existing_characters_in_novel.format(
+                        existing_characters_in_novel=existing_characters_str,
+                        characters_in_event=later_characters_str,
+                    )
+                )
+            ]
+            chain = self.chat_model | parser
+            response: MergeCharactersToExistingCharactersInNovelResponse = await chain.ainvoke(messages)
+
+            for character in response.characters:
+                if not 0 <= character.index_in_event < len(shown_later):
+                    raise ValueError(f"Character index {character.index_in_event} out of range of the {len(shown_later)} later characters")
+                if not -1 <= character.index_in_novel < len(shown_earlier):
+                    raise ValueError(f"Character index {character.index_in_novel} out of range of the {len(shown_earlier)} earlier characters")
+                matched[shown_later[character.index_in_event]] = character
+
+        for later_idx, later_character in enumerate(later_characters):
+            character = matched.get(later_idx)
+            if character is None or character.index_in_novel == -1:
+                new_character = later_character.model_copy(deep=True)
+                new_character.index = len(merged)
+                if character is not None:
+                    new_character.identifier_in_novel = character.identifier_in_novel
+                    new_character.static_features = character.modified_features
+                merged.append(new_character)
+            else:
+                existing_character = merged[shown_earlier[character.index_in_novel]]
+                existing_character.static_features = character.modified_features
+                existing_character.active_events.update(later_character.active_events)
+
+        return merged
+
+
+    async def merge_characters_in_novel_tree(
+        self,
+        event_idx_to_characters_in_event: Dict[int, List[CharacterInEvent]],
+        fan_in: int = 2,
+        max_concurrent_tasks: int = 5,
+        checkpoint_dir: Optional[str] = None,
+    ) -> List[CharacterInNovel]:
+        """
+        Merge the characters of all events into novel-level characters by a tree reduction: the character sets
+        of adjacent events are merged concurrently in groups of `fan_in`, then the merged sets of every level
+        likewise, until one set is left. Every merge sees two sets only, instead of the growing list of all
+        characters of the novel.
+
+        Args:
+            checkpoint_dir:
+            Where the sets of every level are saved, as level_<L>/set_<i>.json. A resumed merge starts from the
+            deepest level whose sets all exist, and reuses the sets of the next level that were already merged.
+            The checkpoints are discarded if they were saved for other event characters or another fan_in.
+        """
+        assert fan_in >= 2, "fan_in must be at least 2"
+        event_idxs = sorted(event_idx_to_characters_in_event)
+        if len(event_idxs) == 0:
+            return []
+
+        level_sizes = [len(event_idxs)]
+        while level_sizes[-1] > 1:
+            level_sizes.append(math.ceil(level_sizes[-1] / fan_in))
+
+        def checkpoint_path(level, index):
+            return os.path.join(checkpoint_dir, f"level_{level}", f"set_{index}.json")
+
+        def read_checkpoint(level, index):
+            with open(checkpoint_path(level, index), "r", encoding="utf-8") as f:
+                return [CharacterInNovel.model_validate(character) for character in json.load(f)]
+
+        level = 0
+        character_sets = [
+            self.characters_in_novel_from_event(event_idx, event_idx_to_characters_in_event[event_idx])
+            for event_idx in event_idxs
+        ]
+        if checkpoint_dir is not None:
+            inputs = [fan_in, [[character.model_dump() for character in character_set] for character_set in character_sets]]
+            inputs_digest = hashlib.sha256(json.dumps(inputs, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+            prepare_checkpoint_dir(checkpoint_dir, inputs_digest)
+            for deeper_level in range(len(level_sizes) - 1, 0, -1):
+                if all(os.path.exists(checkpoint_path(deeper_level, index)) for index in range(level_sizes[deeper_level])):
+                    level = deeper_level
+                    character_sets = [read_checkpoint(deeper_level, index) for index in range(level_sizes[deeper_level])]
+                    logging.info(f"Resuming the merge of the novel characters from level {level} ({len(character_sets)} sets)")
+                    break
+
+        sem = asyncio.Semaphore(max_concurrent_tasks)
+
+        async def merge_group(level, index, group):
+            merged = group[0]
+            for character_set in group[1:]:
+                async with sem:
+                    merged = await self.merge_character_sets_in_novel(merged, character_set)
+            if checkpoint_dir is not None:
+                with atomic_open(checkpoint_path(level, index), "w", encoding="utf-8") as f:
+                    json.dump([character.model_dump() for character in merged], f, ensure_ascii=False, indent=4)
+            return index, merged
+
+        while len(character_sets) > 1:
+            level += 1
+            groups = [character_sets[start:start + fan_in] for start in range(0, len(character_sets), fan_in)]
+            merged_sets = [None] * len(groups)
+            tasks = []
+            for index, group in enumerate(groups):
+                if checkpoint_dir is not None and os.path.exists(checkpoint_path(level, index)):
+                    merged_sets[index] = read_checkpoint(level, index)
+                else:
+                    tasks.append(merge_group(level, index, group))
+            for index, merged in await asyncio.gather(*tasks):
+                merged_sets[index] = merged
+            character_sets = merged_sets
+
+        return character_sets[0]
+
+
     # # TODO: 如果是长篇小说，事件太多，很容易报错，出场的角色会分不清在哪个事件里，也很容易漏，需要想办法解决
     # @retry(
     #     stop=stop_after_attempt(3),
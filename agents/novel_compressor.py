@@ -1,10 +1,14 @@
 import os
+import json
+import math
+import hashlib
 import logging
 import asyncio
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.chat_models import init_chat_model
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from utils.artifacts import atomic_open, prepare_checkpoint_dir
 
 
 
@@ -146,7 +150,7 @@ class NovelCompressor:
         return index, compressed_novel_chunk
     
 
-    def aggregate(
+    def _build_aggregate_messages(
         self,
         compressed_novel_chunks: List[str],
     ):
@@ -155,7 +159,7 @@ class NovelCompressor:
             for i, chunk in enumerate(compressed_novel_chunks)
         ])
 
-        messages = [
+        return [
             SystemMessage(
                 content=system_prompt_template_aggregate
             ),
@@ -165,7 +169,98 @@ class NovelCompressor:
                 )
             ),
         ]
+
+
+    def aggregate(
+        self,
+        compressed_novel_chunks: List[str],
+    ):
+        messages = self._build_aggregate_messages(compressed_novel_chunks)
         response = self.chat_model.invoke(messages)
         aggregated_novel = response.content
         return aggregated_novel
 
+
+    async def aggregate_group(
+        self,
+        semaphore: asyncio.Semaphore,
+        level: int,
+        index: int,
+        compressed_novel_chunks: List[str],
+    ) -> Tuple[int, str]:
+        """Merge a group of adjacent chunks into one. A group of a single chunk is passed through."""
+        if len(compressed_novel_chunks) == 1:
+            return index, compressed_novel_chunks[0]
+        async with semaphore:
+            logging.info(f"Merging {len(compressed_novel_chunks)} chunks into chunk {index} of level {level}")
+            messages = self._build_aggregate_messages(compressed_novel_chunks)
+            response = await self.chat_model.ainvoke(messages)
+            logging.info(f"Merged chunk {index} of level {level}")
+        return index, response.content
+
+
+    async def aggregate_tree(
+        self,
+        compressed_novel_chunks: List[str],
+        fan_in: int = 2,
+        max_concurrent_tasks: int = 5,
+        checkpoint_dir: Optional[str] = None,
+    ) -> str:
+        """
+        Merge the compressed chunks level by level: every level merges groups of `fan_in` adjacent chunks of the
+        level below concurrently, until one text is left. Unlike `aggregate`, no call gets more than `fan_in`
+        chunks, so the merge fits in the context of the model for novels of any length.
+
+        Args:
+            checkpoint_dir:
+            Where the chunks of every level are saved, as level_<L>/chunk_<i>.txt. A resumed merge starts from the
+            deepest level whose chunks all exist, and reuses the chunks of the next level that were already merged.
+            The checkpoints are discarded if they were saved for other chunks or another fan_in.
+        """
+        assert fan_in >= 2, "fan_in must be at least 2"
+        if len(compressed_novel_chunks) == 0:
+            return ""
+
+        level_sizes = [len(compressed_novel_chunks)]
+        while level_sizes[-1] > 1:
+            level_sizes.append(math.ceil(level_sizes[-1] / fan_in))
+
+        def checkpoint_path(level, index):
+            return os.path.join(checkpoint_dir, f"level_{level}", f"chunk_{index}.txt")
+
+        def read_checkpoint(level, index):
+            with open(checkpoint_path(level, index), "r", encoding="utf-8") as f:
+                return f.read()
+
+        level, chunks = 0, list(compressed_novel_chunks)
+        if checkpoint_dir is not None:
+            inputs_digest = hashlib.sha256(json.dumps([fan_in, chunks], ensure_ascii=False).encode("utf-8")).hexdigest()
+            prepare_checkpoint_dir(checkpoint_dir, inputs_digest)
+            for deeper_level in range(len(level_sizes) - 1, 0, -1):
+                if all(os.path.exists(checkpoint_path(deeper_level, index)) for index in range(level_sizes[deeper_level])):
+                    level = deeper_level
+                    chunks = [read_checkpoint(deeper_level, index) for index in range(level_sizes[deeper_level])]
+                    logging.info(f"Resuming the merge of the compressed novel from level {level} ({len(chunks)} chunks)")
+                    break
+
+        sem = asyncio.Semaphore(max_concurrent_tasks)
+        while len(chunks) > 1:
+            level += 1
+            groups = [chunks[start:start + fan_in] for start in range(0, len(chunks), fan_in)]
+            merged_chunks = [None] * len(groups)
+            tasks = []
+            for index, group in enumerate(groups):
+                if checkpoint_dir is not None and os.path.exists(checkpoint_path(level, index)):
+                    merged_chunks[index] = read_checkpoint(level, index)
+                else:
+                    tasks.append(self.aggregate_group(sem, level, index, group))
+
+            for future in asyncio.as_completed(tasks):
+                index, merged_chunk = await future
+                merged_chunks[index] = merged_chunk
+                if checkpoint_dir is not None:
+                    with atomic_open(checkpoint_path(level, index), "w", encoding="utf-8") as f:
+                        f.write(merged_chunk)
+            chunks = merged_chunks
+
+        return chunks[0]
@@ -40,6 +40,15 @@ Generate the next scene for a screenplay adaptation based on the provided input.
 """
 
 
+system_prompt_template_get_next_scenes = system_prompt_template_get_next_scene.replace(
+    "Generate the next scene for a screenplay adaptation based on the provided input.",
+    "Generate the next scenes (at most {max_scenes}, in order) for a screenplay adaptation based on the provided input. Generate fewer if the event ends earlier, and mark the last scene of the event with is_last.",
+).replace(
+    "- Previous Scenes (if any): Already adapted scenes for context (may be empty).",
+    "- Previous Scenes (if any): Already adapted scenes for context (may be empty). Earlier scenes may only be summarized in one line each within <PREVIOUS_SCENES_SUMMARY_START> and <PREVIOUS_SCENES_SUMMARY_END> tags.",
+)
+
+
 human_prompt_template_get_next_scene = \
 """
 <EVENT_DESCRIPTION_START>
@@ -58,6 +67,32 @@ human_prompt_template_get_next_scene = \
 
 
 
+human_prompt_template_get_next_scenes = \
+"""
+<EVENT_DESCRIPTION_START>
+{event_description}
+<EVENT_DESCRIPTION_END>
+
+<CONTEXT_FRAGMENTS_START>
+{context_fragments}
+<CONTEXT_FRAGMENTS_END>
+
+<PREVIOUS_SCENES_SUMMARY_START>
+{previous_scenes_summary}
+<PREVIOUS_SCENES_SUMMARY_END>
+
+<PREVIOUS_SCENES_START>
+{previous_scenes}
+<PREVIOUS_SCENES_END>
+"""
+
+
+class GetNextScenesResponse(BaseModel):
+    scenes: List[Scene] = Field(
+        description="The next scenes of the event, in order, continuing the scene numbering of the previous scenes.",
+    )
+
+
 class SceneExtractor:
     def __init__(
         self,
@@ -107,3 +142,66 @@ class SceneExtractor:
         chain = self.chat_model | parser
         scene = await chain.ainvoke(messages)
         return scene
+
+
+    @staticmethod
+    def summarize_scene(scene: Scene) -> str:
+        """A one-line summary of a scene that stands in for the full scene in the prompt."""
+        characters = ", ".join(character.identifier_in_scene for character in scene.characters)
+        return f"Scene {scene.idx}: {scene.environment.slugline} | Characters: {characters}"
+
+
+    @retry(
+        stop=stop_after_attempt(5),
+        after=lambda retry_state: logging.warning(f"Retrying SceneExtractor.get_next_scenes due to error: {retry_state.outcome.exception()}"),
+    )
+    async def get_next_scenes(
+        self,
+        relevant_chunks: List[str],
+        event: Event,
+        previous_scenes: List[Scene],
+        max_scenes: int = 3,
+        max_previous_scenes_in_full: int = 2,
+    ) -> List[Scene]:
+        """
+        Like `get_next_scene`, but returns up to `max_scenes` scenes per call. Only the last
+        `max_previous_scenes_in_full` previous scenes are sent in full; the earlier ones as one-line summaries,
+        so the prompt does not grow with every scene of the event.
+        """
+        context_fragments_str = "\n".join([f"<FRAGMENT_{i}_START>\n{chunk}\n<FRAGMENT_{i}_END>" for i, chunk in enumerate(relevant_chunks)])
+
+        num_summarized = max(0, len(previous_scenes) - max_previous_scenes_in_full)
+        previous_scenes_summary_str = "\n".join([self.summarize_scene(scene) for scene in previous_scenes[:num_summarized]])
+        previous_scenes_str = "\n".join([f"<SCENE_{scene.idx}_START>\n{scene}\n<SCENE_{scene.idx}_END>" for scene in previous_scenes[num_summarized:]])
+
+        parser = PydanticOutputParser(pydantic_object=GetNextScenesResponse)
+
+        messages = [
+            SystemMessage(
+                content=system_prompt_template_get_next_scenes.format(
+                    format_instructions=parser.get_format_instructions(),
+                    max_scenes=max_scenes,
+                ),
+            ),
+            HumanMessage(
+                content=human_prompt_template_get_next_scenes.format(
+                    event_description=str(event),
+                    context_fragments=context_fragments_str,
+                    previous_scenes_summary=previous_scenes_summary_str,
+                    previous_scenes=previous_scenes_str,
+                )
+            )
+        ]
+
+        chain = self.chat_model | parser
+        response: GetNextScenesResponse = await chain.ainvoke(messages)
+        if len(response.scenes) == 0:
+            raise ValueError("No scene was returned")
+
+        # scenes after the one marked is_last are dropped, and the numbering continues the previous scenes
+        scenes = []
+        for scene in response.scenes[:max_scenes]:
+            scenes.append(scene.model_copy(update={"idx": len(previous_scenes) + len(scenes)}))
+            if scene.is_last:
+                break
+        return scenes
@@ -0,0 +1,16 @@
+from .work_queue import WorkUnit, WorkQueue, LocalWorkQueue
+from .artifact_store import ArtifactStore, LocalArtifactStore
+from .coordinator import ShotCoordinator, build_work_units
+from .shot_worker import ShotWorker, start_shot_workers
+
+__all__ = [
+    "WorkUnit",
+    "WorkQueue",
+    "LocalWorkQueue",
+    "ArtifactStore",
+    "LocalArtifactStore",
+    "ShotCoordinator",
+    "build_work_units",
+    "ShotWorker",
+    "start_shot_workers",
+]
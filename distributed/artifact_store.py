@@ -0,0 +1,93 @@
+import os
+import json
+import shutil
+from abc import ABC, abstractmethod
+from typing import Any
+from utils.artifacts import atomic_open, atomic_path
+from utils.event_bus import BytesTransferred, publish_event
+
+
+class ArtifactStore(ABC):
+    """
+    The storage shared by the coordinator and the shot workers.
+
+    Keys are '/'-separated paths such as '<run_id>/shots/3/first_frame.png'. Implementations backed by
+    an object store (S3, GCS, ...) let workers on other machines join; LocalArtifactStore is the
+    single-machine stand-in.
+    """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, key: str, local_path: str) -> None:
+        """Upload the file at local_path. An existing artifact with the same key is replaced."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, key: str, local_path: str) -> None:
+        """Download the artifact to local_path. Raises FileNotFoundError if the key does not exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_json(self, key: str, obj: Any) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_json(self, key: str) -> Any:
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+    """An ArtifactStore backed by a local directory. Writes go through a temporary file so readers never see partial artifacts."""
+
+    def __init__(
+        self,
+        root_dir: str,
+    ):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, *key.split("/")))
+        if not path.startswith(os.path.abspath(self.root_dir) + os.sep):
+            raise ValueError(f"Invalid artifact key: {key}")
+        return path
+
+
+    @staticmethod
+    def _copy_atomic(src: str, dst: str) -> None:
+        with atomic_path(dst) as tmp_path:
+            shutil.copyfile(src, tmp_path)
+
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+
+    def put(self, key: str, local_path: str) -> None:
+        self._copy_atomic(local_path, self._path(key))
+        publish_event(BytesTransferred(direction="upload", channel="artifact_store", num_bytes=os.path.getsize(local_path)))
+
+
+    def get(self, key: str, local_path: str) -> None:
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Artifact not found: {key}")
+        self._copy_atomic(path, local_path)
+        publish_event(BytesTransferred(direction="download", channel="artifact_store", num_bytes=os.path.getsize(local_path)))
+
+
+    def put_json(self, key: str, obj: Any) -> None:
+        with atomic_open(self._path(key), "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=4)
+
+
+    def get_json(self, key: str) -> Any:
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Artifact not found: {key}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
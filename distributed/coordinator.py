@@ -0,0 +1,284 @@
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+from interfaces import Camera, CharacterInScene, ShotDescription
+from distributed.work_queue import WorkQueue, WorkUnit
+from distributed.artifact_store import ArtifactStore
+from utils.event_bus import StageStarted, StageProgress
+from utils.artifacts import validate_artifact
+
+
+def _frame_key(shot_idx: int, frame_type: str) -> str:
+    return f"shots/{shot_idx}/{frame_type}.png"
+
+
+def _portrait_keys(
+    character_idxs: List[int],
+    characters: List[CharacterInScene],
+    character_portraits_registry: Dict[str, Dict[str, Dict[str, str]]],
+) -> List[str]:
+    return [
+        item["path"]
+        for character_idx in character_idxs
+        for item in character_portraits_registry[characters[character_idx].identifier_in_scene].values()
+    ]
+
+
+def build_work_units(
+    run_id: str,
+    shot_descriptions: List[ShotDescription],
+    camera_tree: List[Camera],
+    characters: List[CharacterInScene],
+    character_portraits_registry: Dict[str, Dict[str, Dict[str, str]]],
+) -> List[WorkUnit]:
+    """
+    Split the frame and video generation of a run into work units following the camera tree:
+
+    - camera_first_frame: the first_frame of the first shot of a camera. It depends on the first_frame of the parent shot.
+    - frame: any other frame of the camera. It depends on the first_frame of the first shot of the camera.
+    - video: the video of a shot. It depends on the frames of the shot.
+
+    character_portraits_registry must hold portrait paths relative to the working_dir.
+    """
+    producers: Dict[Tuple[int, str], str] = {}
+    for camera in camera_tree:
+        first_shot_idx = camera.active_shot_idxs[0]
+        producers[(first_shot_idx, "first_frame")] = f"{run_id}/camera_{camera.idx}_first_frame"
+        for shot_idx in camera.active_shot_idxs:
+            if shot_idx != first_shot_idx:
+                producers[(shot_idx, "first_frame")] = f"{run_id}/shot_{shot_idx}_first_frame"
+            if shot_descriptions[shot_idx].variation_type in ["medium", "large"]:
+                producers[(shot_idx, "last_frame")] = f"{run_id}/shot_{shot_idx}_last_frame"
+
+    priority_shot_idxs = [camera.parent_shot_idx for camera in camera_tree if camera.parent_shot_idx is not None]
+
+    units = []
+    for camera in camera_tree:
+        first_shot_idx = camera.active_shot_idxs[0]
+        first_shot_ff_key = _frame_key(first_shot_idx, "first_frame")
+
+        inputs = _portrait_keys(shot_descriptions[first_shot_idx].ff_vis_char_idxs, characters, character_portraits_registry)
+        dependencies = []
+        if camera.parent_shot_idx is not None:
+            inputs.append(_frame_key(camera.parent_shot_idx, "first_frame"))
+            dependencies.append(producers[(camera.parent_shot_idx, "first_frame")])
+        units.append(
+            WorkUnit(
+                id=producers[(first_shot_idx, "first_frame")],
+                run_id=run_id,
+                kind="camera_first_frame",
+                payload={"camera_idx": camera.idx, "inputs": inputs, "outputs": [first_shot_ff_key]},
+                dependencies=dependencies,
+                priority=2,
+            )
+        )
+
+        for shot_idx in camera.active_shot_idxs:
+            frame_specs = []
+            if shot_idx != first_shot_idx:
+                frame_specs.append(("first_frame", shot_descriptions[shot_idx].ff_vis_char_idxs))
+            if shot_descriptions[shot_idx].variation_type in ["medium", "large"]:
+                frame_specs.append(("last_frame", shot_descriptions[shot_idx].lf_vis_char_idxs))
+
+            for frame_type, vis_char_idxs in frame_specs:
+                inputs = _portrait_keys(vis_char_idxs, characters, character_portraits_registry)
+                inputs.append(first_shot_ff_key)
+                units.append(
+                    WorkUnit(
+                        id=producers[(shot_idx, frame_type)],
+                        run_id=run_id,
+                        kind="frame",
+                        payload={
+                            "camera_idx": camera.idx,
+                            "shot_idx": shot_idx,
+                            "frame_type": frame_type,
+                            "inputs": inputs,
+                            "outputs": [_frame_key(shot_idx, frame_type)],
+                        },
+                        dependencies=[producers[(first_shot_idx, "first_frame")]],
+                        priority=1 if frame_type == "first_frame" and shot_idx in priority_shot_idxs else 0,
+                    )
+                )
+
+    for shot_description in shot_descriptions:
+        frame_types = ["first_frame"]
+        if shot_description.variation_type in ["medium", "large"]:
+            frame_types.append("last_frame")
+        units.append(
+            WorkUnit(
+                id=f"{run_id}/shot_{shot_description.idx}_video",
+                run_id=run_id,
+                kind="video",
+                payload={
+                    "shot_idx": shot_description.idx,
+                    "inputs": [_frame_key(shot_description.idx, frame_type) for frame_type in frame_types],
+                    "outputs": [f"shots/{shot_description.idx}/video.mp4"],
+                },
+                dependencies=[producers[(shot_description.idx, frame_type)] for frame_type in frame_types],
+            )
+        )
+
+    return units
+
+
+class ShotCoordinator:
+    """
+    Runs a Script2Video call with the frame and video generation sharded across shot workers.
+
+    The planning stages (characters, portraits, storyboard, shot descriptions and camera tree) run
+    locally in the pipeline's working_dir. Their results are uploaded to the artifact store as the
+    run plan, the work units are published to the work queue, and the coordinator waits for the
+    shot videos, downloads them and concatenates the final video.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        work_queue: WorkQueue,
+        artifact_store: ArtifactStore,
+        run_id: Optional[str] = None,
+        poll_interval: float = 2.0,
+        stale_timeout: float = 600.0,
+    ):
+        """
+        Args:
+            pipeline:
+            The Script2VideoPipeline used for the planning stages and the final concatenation.
+
+            run_id:
+            The id of the run in the queue and the artifact store. Defaults to a hash of the working_dir, so that restarting the coordinator on the same working_dir resumes the run.
+        """
+        self.pipeline = pipeline
+        self.work_queue = work_queue
+        self.artifact_store = artifact_store
+        self.run_id = run_id or hashlib.sha1(os.path.abspath(pipeline.working_dir).encode("utf-8")).hexdigest()[:12]
+        self.poll_interval = poll_interval
+        self.stale_timeout = stale_timeout
+
+
+    def _relative_path(self, path: str) -> str:
+        relative_path = os.path.relpath(path, self.pipeline.working_dir)
+        if relative_path.startswith(".."):
+            # e.g. portraits shared by the scenes of Idea2Video, which live in the parent directory
+            digest = hashlib.sha1(os.path.abspath(os.path.dirname(path)).encode("utf-8")).hexdigest()[:12]
+            relative_path = os.path.join("external", digest, os.path.basename(path))
+        return relative_path.replace(os.sep, "/")
+
+
+    def _key(self, relative_path: str) -> str:
+        return f"{self.run_id}/{relative_path}"
+
+
+    def _upload(self, relative_path: str, local_path: Optional[str] = None) -> None:
+        key = self._key(relative_path)
+        if not self.artifact_store.exists(key):
+            self.artifact_store.put(key, local_path or os.path.join(self.pipeline.working_dir, relative_path))
+
+
+    async def __call__(
+        self,
+        script: str,
+        user_requirement: str,
+        style: str,
+        characters: List[CharacterInScene] = None,
+        character_portraits_registry: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None,
+    ) -> str:
+        working_dir = self.pipeline.working_dir
+
+        if characters is None:
+            characters = await self.pipeline.extract_characters(script=script)
+
+        if character_portraits_registry is None:
+            self.pipeline.event_bus.publish(StageStarted(stage="generate_character_portraits", message=f"🔍 Generating character portraits..."))
+            character_portraits_registry = await self.pipeline.generate_character_portraits(
+                characters=characters,
+                character_portraits_registry=None,
+                style=style,
+            )
+
+        storyboard = await self.pipeline.design_storyboard(
+            script=script,
+            characters=characters,
+            user_requirement=user_requirement,
+        )
+        shot_descriptions = await self.pipeline.decompose_visual_descriptions(
+            shot_brief_descriptions=storyboard,
+            characters=characters,
+        )
+        camera_tree = await self.pipeline.construct_camera_tree(
+            shot_descriptions=shot_descriptions,
+        )
+
+        relative_registry = {}
+        for identifier, registry_item in character_portraits_registry.items():
+            relative_registry[identifier] = {}
+            for view, item in registry_item.items():
+                relative_path = self._relative_path(item["path"])
+                self._upload(relative_path, local_path=item["path"])
+                relative_registry[identifier][view] = {"path": relative_path, "description": item["description"]}
+
+        self.artifact_store.put_json(
+            self._key("plan.json"),
+            {
+                "characters": [character.model_dump() for character in characters],
+                "character_portraits_registry": relative_registry,
+                "shot_descriptions": [shot_description.model_dump() for shot_description in shot_descriptions],
+                "camera_tree": [camera.model_dump() for camera in camera_tree],
+            },
+        )
+
+        units = build_work_units(
+            run_id=self.run_id,
+            shot_descriptions=shot_descriptions,
+            camera_tree=camera_tree,
+            characters=characters,
+            character_portraits_registry=relative_registry,
+        )
+        # artifacts that already exist locally (e.g. from an earlier non-distributed run) are uploaded instead of regenerated
+        for unit in units:
+            if all(os.path.exists(os.path.join(working_dir, key)) and validate_artifact(os.path.join(working_dir, key)) for key in unit.payload["outputs"]):
+                for key in unit.payload["outputs"]:
+                    self._upload(key)
+            if all(self.artifact_store.exists(self._key(key)) for key in unit.payload["outputs"]):
+                unit.status = "done"
+
+        self.work_queue.publish(units)
+        self.pipeline.event_bus.publish(StageProgress(stage="publish_work_units", attributes={"run_id": self.run_id, "num_units": len(units)}, message=f"📤 Published {len(units)} work units of run {self.run_id}."))
+
+        await self.wait_for_units()
+
+        for shot_description in shot_descriptions:
+            relative_path = f"shots/{shot_description.idx}/video.mp4"
+            video_path = os.path.join(working_dir, relative_path)
+            if not os.path.exists(video_path) or not validate_artifact(video_path):
+                self.artifact_store.get(self._key(relative_path), video_path)
+            self.pipeline.run_manifest.record_artifact(video_path, stage="generate_video", shot_idx=shot_description.idx)
+
+        final_video_path = await self.pipeline.concatenate_videos(shot_descriptions)
+        self.pipeline.run_manifest.export_legacy_layout()
+        return final_video_path
+
+
+    async def wait_for_units(self) -> None:
+        last_counts = None
+        while True:
+            requeued = self.work_queue.requeue_stale(self.stale_timeout)
+            if requeued:
+                logging.warning(f"Requeued stale work units: {requeued}")
+
+            units = self.work_queue.list_units(self.run_id)
+            failed_units = [unit for unit in units if unit.status == "failed"]
+            if failed_units:
+                details = "\n".join(f"{unit.id}: {unit.error}" for unit in failed_units)
+                raise RuntimeError(f"{len(failed_units)} work units of run {self.run_id} failed:\n{details}")
+
+            counts = {status: sum(unit.status == status for unit in units) for status in ["pending", "running", "done"]}
+            if counts != last_counts:
+                self.pipeline.event_bus.publish(StageProgress(stage="wait_for_work_units", attributes={"run_id": self.run_id, **counts}, message=f"⏳ Run {self.run_id}: {counts['done']}/{len(units)} work units done, {counts['running']} running, {counts['pending']} pending."))
+                last_counts = counts
+
+            if counts["done"] == len(units):
+                return
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,277 @@
+import os
+import socket
+import asyncio
+import logging
+import traceback
+import multiprocessing
+from typing import Dict, List, Optional
+from interfaces import Camera, CharacterInScene, ShotDescription
+from distributed.work_queue import LocalWorkQueue, WorkQueue, WorkUnit
+from distributed.artifact_store import ArtifactStore, LocalArtifactStore
+from utils.artifacts import validate_artifact
+
+
+class ShotWorker:
+    """
+    Claims work units published by the ShotCoordinator and runs them with a Script2VideoPipeline.
+
+    Every run gets a scratch working_dir on the worker. Before a unit runs, its input artifacts
+    (character portraits and the frames it depends on) are fetched from the artifact store into
+    the scratch directory, and afterwards its outputs are uploaded back.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        work_queue: WorkQueue,
+        artifact_store: ArtifactStore,
+        scratch_dir: str,
+        worker_id: Optional[str] = None,
+        max_concurrent_units: int = 4,
+        poll_interval: float = 2.0,
+        heartbeat_interval: float = 10.0,
+        stale_timeout: float = 600.0,
+    ):
+        """
+        Args:
+            pipeline:
+            The Script2VideoPipeline whose generators and agents run the units. Its working_dir is not used.
+
+            max_concurrent_units:
+            The number of units run at the same time. Units mostly wait for the image and video APIs, so a few of them can share one process.
+        """
+        self.pipeline = pipeline
+        self.work_queue = work_queue
+        self.artifact_store = artifact_store
+        self.scratch_dir = scratch_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.max_concurrent_units = max_concurrent_units
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_timeout = stale_timeout
+
+        self.run_pipelines = {}
+        self.run_plans = {}
+
+
+    def get_run_pipeline(self, run_id: str):
+        if run_id not in self.run_pipelines:
+            self.run_pipelines[run_id] = self.pipeline.with_working_dir(os.path.join(self.scratch_dir, run_id))
+        return self.run_pipelines[run_id]
+
+
+    def get_run_plan(self, run_id: str) -> Dict:
+        if run_id not in self.run_plans:
+            plan = self.artifact_store.get_json(f"{run_id}/plan.json")
+            working_dir = self.get_run_pipeline(run_id).working_dir
+            self.run_plans[run_id] = {
+                "characters": [CharacterInScene.model_validate(character) for character in plan["characters"]],
+                "character_portraits_registry": {
+                    identifier: {
+                        view: {"path": os.path.join(working_dir, item["path"]), "description": item["description"]}
+                        for view, item in registry_item.items()
+                    }
+                    for identifier, registry_item in plan["character_portraits_registry"].items()
+                },
+                "shot_descriptions": [ShotDescription.model_validate(shot_description) for shot_description in plan["shot_descriptions"]],
+                "camera_tree": [Camera.model_validate(camera) for camera in plan["camera_tree"]],
+            }
+        return self.run_plans[run_id]
+
+
+    def prepare_frame_events(self, run_pipeline, shot_descriptions: List[ShotDescription]) -> None:
+        # the dependencies of a unit are done before it is claimed, so every frame that was fetched is ready
+        for shot_description in shot_descriptions:
+            frame_types = ["first_frame", "last_frame"] if shot_description.variation_type in ["medium", "large"] else ["first_frame"]
+            events = run_pipeline.frame_events.setdefault(shot_description.idx, {})
+            for frame_type in frame_types:
+                event = events.setdefault(frame_type, asyncio.Event())
+                if os.path.exists(os.path.join(run_pipeline.working_dir, "shots", f"{shot_description.idx}", f"{frame_type}.png")):
+                    event.set()
+
+
+    async def execute_unit(self, unit: WorkUnit) -> None:
+        run_pipeline = self.get_run_pipeline(unit.run_id)
+        working_dir = run_pipeline.working_dir
+
+        if all(self.artifact_store.exists(f"{unit.run_id}/{key}") for key in unit.payload["outputs"]):
+            logging.info(f"Outputs of work unit {unit.id} already exist, skipped.")
+            return
+
+        plan = self.get_run_plan(unit.run_id)
+        characters = plan["characters"]
+        character_portraits_registry = plan["character_portraits_registry"]
+        shot_descriptions = plan["shot_descriptions"]
+        camera_tree = plan["camera_tree"]
+
+        for key in unit.payload["inputs"] + unit.payload["outputs"]:
+            os.makedirs(os.path.dirname(os.path.join(working_dir, key)), exist_ok=True)
+        for key in unit.payload["inputs"]:
+            local_path = os.path.join(working_dir, key)
+            if not os.path.exists(local_path):
+                await asyncio.to_thread(self.artifact_store.get, f"{unit.run_id}/{key}", local_path)
+        self.prepare_frame_events(run_pipeline, shot_descriptions)
+
+        if unit.kind == "camera_first_frame":
+            camera = next(camera for camera in camera_tree if camera.idx == unit.payload["camera_idx"])
+            await run_pipeline.generate_first_frame_for_camera(
+                camera=camera,
+                shot_descriptions=shot_descriptions,
+                characters=characters,
+                character_portraits_registry=character_portraits_registry,
+            )
+
+        elif unit.kind == "frame":
+            camera = next(camera for camera in camera_tree if camera.idx == unit.payload["camera_idx"])
+            first_shot_idx = camera.active_shot_idxs[0]
+            shot_idx = unit.payload["shot_idx"]
+            frame_type = unit.payload["frame_type"]
+            shot_description = shot_descriptions[shot_idx]
+            if frame_type == "first_frame":
+                frame_desc, vis_char_idxs = shot_description.ff_desc, shot_description.ff_vis_char_idxs
+            else:
+                frame_desc, vis_char_idxs = shot_description.lf_desc, shot_description.lf_vis_char_idxs
+            await run_pipeline.generate_frame_for_single_shot(
+                shot_idx=shot_idx,
+                frame_type=frame_type,
+                first_shot_ff_path_and_text_pair=(
+                    os.path.join(working_dir, "shots", f"{first_shot_idx}", "first_frame.png"),
+                    shot_descriptions[first_shot_idx].ff_desc,
+                ),
+                frame_desc=frame_desc,
+                visible_characters=[characters[idx] for idx in vis_char_idxs],
+                character_portraits_registry=character_portraits_registry,
+            )
+
+        elif unit.kind == "video":
+            await run_pipeline.generate_video_for_single_shot(
+                shot_description=shot_descriptions[unit.payload["shot_idx"]],
+            )
+
+        else:
+            raise ValueError(f"Unknown work unit kind: {unit.kind}")
+
+        for key in unit.payload["outputs"]:
+            local_path = os.path.join(working_dir, key)
+            if not os.path.exists(local_path) or not validate_artifact(local_path):
+                raise RuntimeError(f"Work unit {unit.id} did not produce a complete {key}")
+            await asyncio.to_thread(self.artifact_store.put, f"{unit.run_id}/{key}", local_path)
+
+
+    async def run_unit(self, unit: WorkUnit) -> None:
+        logging.info(f"Worker {self.worker_id} started work unit {unit.id} (attempt {unit.attempts})")
+        unit_task = asyncio.create_task(self.execute_unit(unit))
+        try:
+            while not unit_task.done():
+                done, _ = await asyncio.wait({unit_task}, timeout=self.heartbeat_interval)
+                if not done and not await asyncio.to_thread(self.work_queue.heartbeat, unit.id, self.worker_id):
+                    # the unit was requeued as stale and may be running on another worker now
+                    unit_task.cancel()
+                    await asyncio.gather(unit_task, return_exceptions=True)
+                    logging.warning(f"Worker {self.worker_id} lost work unit {unit.id} (requeued as stale), stopped it.")
+                    return
+        finally:
+            if not unit_task.done():
+                unit_task.cancel()
+                await asyncio.gather(unit_task, return_exceptions=True)
+
+        try:
+            unit_task.result()
+        except Exception as e:
+            logging.error(f"Work unit {unit.id} failed: {e}")
+            if not self.work_queue.fail(unit.id, self.worker_id, "".join(traceback.format_exception(type(e), e, e.__traceback__))):
+                logging.warning(f"Work unit {unit.id} is no longer owned by worker {self.worker_id}, its failure was not recorded.")
+            return
+
+        if self.work_queue.complete(unit.id, self.worker_id):
+            logging.info(f"Work unit {unit.id} done.")
+        else:
+            logging.warning(f"Work unit {unit.id} is no longer owned by worker {self.worker_id}, its completion was not recorded.")
+
+
+    async def run(self, idle_timeout: Optional[float] = None) -> None:
+        """
+        Claim and run units until stopped.
+
+        Args:
+            idle_timeout:
+            Stop after no unit could be claimed for this many seconds. None means never stop.
+        """
+        running = set()
+        idle_since = asyncio.get_running_loop().time()
+        while True:
+            requeued = self.work_queue.requeue_stale(self.stale_timeout)
+            if requeued:
+                logging.warning(f"Requeued stale work units: {requeued}")
+
+            unit = self.work_queue.claim(self.worker_id) if len(running) < self.max_concurrent_units else None
+            if unit is not None:
+                running.add(asyncio.create_task(self.run_unit(unit)))
+                continue
+
+            now = asyncio.get_running_loop().time()
+            if running:
+                idle_since = now
+            elif idle_timeout is not None and now - idle_since > idle_timeout:
+                return
+
+            if running:
+                done, running = await asyncio.wait(running, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+
+def _shot_worker_process_main(
+    config_path: str,
+    db_path: str,
+    store_dir: str,
+    scratch_dir: str,
+    idle_timeout: Optional[float],
+    metrics_port: Optional[int],
+    worker_kwargs: dict,
+) -> None:
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [shot worker {os.getpid()}] %(levelname)s %(message)s")
+    from pipelines.script2video_pipeline import Script2VideoPipeline
+    work_queue = LocalWorkQueue(db_path)
+    if metrics_port is not None:
+        from utils.metrics import enable_metrics
+        metrics = enable_metrics(port=metrics_port)
+        if metrics is not None:
+            metrics.track_work_queue(work_queue)
+    pipeline = Script2VideoPipeline.init_from_config(config_path=config_path, working_dir=scratch_dir)
+    worker = ShotWorker(
+        pipeline=pipeline,
+        work_queue=work_queue,
+        artifact_store=LocalArtifactStore(store_dir),
+        scratch_dir=scratch_dir,
+        **worker_kwargs,
+    )
+    asyncio.run(worker.run(idle_timeout=idle_timeout))
+
+
+def start_shot_workers(
+    config_path: str,
+    db_path: str,
+    store_dir: str,
+    scratch_dir: str,
+    num_workers: int,
+    idle_timeout: Optional[float] = None,
+    metrics_port: Optional[int] = None,
+    **worker_kwargs,
+) -> List[multiprocessing.Process]:
+    """
+    Start `num_workers` shot worker processes on this machine, using the LocalWorkQueue at `db_path` and the LocalArtifactStore at `store_dir`.
+
+    With `metrics_port`, worker i serves its Prometheus metrics on port `metrics_port + i`.
+    """
+    processes = []
+    for i in range(num_workers):
+        port = metrics_port + i if metrics_port is not None else None
+        process = multiprocessing.Process(
+            target=_shot_worker_process_main,
+            args=(config_path, db_path, store_dir, os.path.join(scratch_dir, f"worker_{i}"), idle_timeout, port, worker_kwargs),
+            daemon=False,
+        )
+        process.start()
+        processes.append(process)
+    return processes
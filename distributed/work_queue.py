@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+WorkUnitKind = Literal["camera_first_frame", "frame", "video"]
+WorkUnitStatus = Literal["pending", "running", "done", "failed"]
+
+
+class WorkUnit(BaseModel):
+    id: str = Field(
+        description="The unique id of the work unit, prefixed with the run id, e.g. '<run_id>/shot_3_first_frame'.",
+    )
+    run_id: str = Field(
+        description="The run (one Script2Video call) the work unit belongs to.",
+    )
+    kind: WorkUnitKind = Field(
+        description="What the worker has to produce: the first_frame of the first shot of a camera, a single frame of a shot, or the video of a shot.",
+    )
+    payload: Dict[str, Any] = Field(
+        description="The parameters of the work unit, including the artifact keys it reads ('inputs') and writes ('outputs'), relative to the run.",
+    )
+    dependencies: List[str] = Field(
+        default_factory=list,
+        description="The ids of the work units that must be done before this one can be claimed.",
+    )
+    priority: int = Field(
+        default=0,
+        description="Units with a higher priority are claimed first, e.g. frames that other cameras are waiting for.",
+    )
+    status: WorkUnitStatus = Field(
+        default="pending",
+        description="The current status of the work unit.",
+    )
+    attempts: int = Field(
+        default=0,
+        description="How many times the work unit has been claimed by a worker.",
+    )
+    worker_id: Optional[str] = Field(
+        default=None,
+        description="The worker currently (or last) running the work unit.",
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="The error message of the last failed attempt.",
+    )
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    heartbeat_at: Optional[float] = None
+
+
+class WorkQueue(ABC):
+    """
+    The interface between the coordinator and the shot workers.
+
+    A unit can only be claimed once all of its dependencies are done. Implementations backed by a
+    remote service (a database, Redis, ...) let workers on other machines join; LocalWorkQueue is
+    the single-machine stand-in.
+    """
+
+    @abstractmethod
+    def publish(self, units: List[WorkUnit]) -> None:
+        """
+        Add units to the queue. Units that already exist (e.g. when the coordinator is restarted) are kept as
+        they are, except failed ones, which are pending again with their attempts reset so the run can resume.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[WorkUnit]:
+        """Take the pending unit with the highest priority whose dependencies are all done, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, unit_id: str, worker_id: str) -> bool:
+        """Refresh the heartbeat of a running unit. Returns False if the unit is no longer running on `worker_id`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, unit_id: str, worker_id: str) -> bool:
+        """Mark the unit done if it is still running on `worker_id`. Returns whether it was."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, unit_id: str, worker_id: str, error: str) -> bool:
+        """Record a failed attempt of `worker_id`. The unit is pending again until it runs out of attempts."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def requeue_stale(self, stale_timeout: float) -> List[str]:
+        """Put running units whose worker stopped sending heartbeats back into the queue."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_units(self, run_id: str) -> List[WorkUnit]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self, status: WorkUnitStatus) -> int:
+        """The number of units with the given status across all runs."""
+        raise NotImplementedError
+
+
+class LocalWorkQueue(WorkQueue):
+    """
+    A WorkQueue backed by a local SQLite database, shared by the coordinator and worker processes
+    on the same machine.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_attempts: int = 3,
+    ):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS units (
+                    id TEXT PRIMARY KEY,
+                    run_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS unit_dependencies (
+                    unit_id TEXT NOT NULL,
+                    dependency_id TEXT NOT NULL,
+                    PRIMARY KEY (unit_id, dependency_id)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_units_status ON units (status, priority, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_units_run ON units (run_id)")
+
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+    def _row_to_unit(self, conn: sqlite3.Connection, row: sqlite3.Row) -> WorkUnit:
+        data = dict(row)
+        data["payload"] = json.loads(data["payload"])
+        data["dependencies"] = [
+            dep_row["dependency_id"]
+            for dep_row in conn.execute("SELECT dependency_id FROM unit_dependencies WHERE unit_id = ?", (data["id"],)).fetchall()
+        ]
+        return WorkUnit.model_validate(data)
+
+
+    def publish(self, units: List[WorkUnit]) -> None:
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for unit in units:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO units (id, run_id, kind, payload, priority, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (unit.id, unit.run_id, unit.kind, json.dumps(unit.payload, ensure_ascii=False), unit.priority, unit.status, now, now),
+                    )
+                    conn.execute(
+                        "UPDATE units SET status = 'pending', attempts = 0, worker_id = NULL, error = NULL, heartbeat_at = NULL, updated_at = ? WHERE id = ? AND status = 'failed'",
+                        (now, unit.id),
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO unit_dependencies (unit_id, dependency_id) VALUES (?, ?)",
+                        [(unit.id, dependency_id) for dependency_id in unit.dependencies],
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+
+    def get(self, unit_id: str) -> Optional[WorkUnit]:
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM units WHERE id = ?", (unit_id,)).fetchone()
+            return self._row_to_unit(conn, row) if row is not None else None
+
+
+    def list_units(self, run_id: str) -> List[WorkUnit]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT * FROM units WHERE run_id = ? ORDER BY created_at, id", (run_id,)).fetchall()
+            return [self._row_to_unit(conn, row) for row in rows]
+
+
+    def count(self, status: WorkUnitStatus) -> int:
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM units WHERE status = ?", (status,)).fetchone()[0]
+
+
+    def claim(self, worker_id: str) -> Optional[WorkUnit]:
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    """
+                    SELECT id FROM units u
+                    WHERE u.status = 'pending' AND NOT EXISTS (
+                        SELECT 1 FROM unit_dependencies d JOIN units p ON p.id = d.dependency_id
+                        WHERE d.unit_id = u.id AND p.status != 'done'
+                    )
+                    ORDER BY u.priority DESC, u.created_at, u.id
+                    LIMIT 1
+                    """
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE units SET status = 'running', worker_id = ?, attempts = attempts + 1, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+
+    def heartbeat(self, unit_id: str, worker_id: str) -> bool:
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), unit_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def complete(self, unit_id: str, worker_id: str) -> bool:
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET status = 'done', error = NULL, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), unit_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def fail(self, unit_id: str, worker_id: str, error: str) -> bool:
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, error = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (self.max_attempts, error, time.time(), unit_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def requeue_stale(self, stale_timeout: float) -> List[str]:
+        deadline = time.time() - stale_timeout
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id FROM units WHERE status = 'running' AND heartbeat_at < ?",
+                (deadline,),
+            ).fetchall()
+            conn.execute(
+                """
+                UPDATE units SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+                    error = COALESCE(error, 'worker stopped sending heartbeats'), updated_at = ?
+                WHERE status = 'running' AND heartbeat_at < ?
+                """,
+                (self.max_attempts, time.time(), deadline),
+            )
+            conn.execute("COMMIT")
+        return [row["id"] for row in rows]
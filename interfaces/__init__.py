@@ -1,5 +1,7 @@
 from .camera import Camera
 from .character import CharacterInScene, CharacterInEvent, CharacterInNovel
+from .character_registry import CharacterRegistry
+from .environment import EnvironmentInScene
 from .event import Event
 from .frame import Frame
 from .image_output import ImageOutput
@@ -12,6 +14,8 @@ __all__ = [
     "CharacterInScene",
     "CharacterInEvent",
     "CharacterInNovel",
+    "CharacterRegistry",
+    "EnvironmentInScene",
     "Event",
     "Frame",
     "ImageOutput",
@@ -0,0 +1,174 @@
+import logging
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from interfaces.character import CharacterInScene, CharacterInEvent, CharacterInNovel
+from interfaces.scene import Scene
+
+
+
+class CharacterRegistry(BaseModel):
+    """
+    The characters of a novel at the novel, event and scene level, indexed for constant-time lookups within and
+    across levels.
+
+    A novel character links to its identifier in every event it is active in (CharacterInNovel.active_events),
+    and an event character to its identifier in every scene (CharacterInEvent.active_scenes). The registry
+    resolves these links once, when it is built, instead of scanning the character lists at every lookup.
+    It is a pydantic model, so it round-trips through model_dump/model_validate, e.g. to the run manifest;
+    the indexes are rebuilt on validation.
+    """
+
+    characters_in_novel: List[CharacterInNovel] = Field(
+        default_factory=list,
+        description="The characters of the novel.",
+    )
+    characters_in_event: Dict[int, List[CharacterInEvent]] = Field(
+        default_factory=dict,
+        description="The characters of every event, by event index.",
+    )
+    characters_in_scene: Dict[int, Dict[int, List[CharacterInScene]]] = Field(
+        default_factory=dict,
+        description="The characters of every scene, by event index and scene index.",
+    )
+
+    _novel_by_index: Dict[int, CharacterInNovel] = PrivateAttr(default_factory=dict)
+    _novel_by_identifier: Dict[str, CharacterInNovel] = PrivateAttr(default_factory=dict)
+    _event_by_identifier: Dict[Tuple[int, str], CharacterInEvent] = PrivateAttr(default_factory=dict)
+    _scene_by_identifier: Dict[Tuple[int, int, str], CharacterInScene] = PrivateAttr(default_factory=dict)
+    _novel_of_event: Dict[Tuple[int, str], CharacterInNovel] = PrivateAttr(default_factory=dict)
+    _event_of_scene: Dict[Tuple[int, int, str], CharacterInEvent] = PrivateAttr(default_factory=dict)
+
+
+    def model_post_init(self, __context) -> None:
+        self.reindex()
+
+
+    @classmethod
+    def build(
+        cls,
+        characters_in_novel: List[CharacterInNovel],
+        event_idx_to_characters_in_event: Dict[int, List[CharacterInEvent]],
+        event_idx_to_scenes: Dict[int, List[Scene]],
+    ) -> "CharacterRegistry":
+        return cls(
+            characters_in_novel=characters_in_novel,
+            characters_in_event=event_idx_to_characters_in_event,
+            characters_in_scene={
+                event_idx: {scene.idx: scene.characters for scene in scenes}
+                for event_idx, scenes in event_idx_to_scenes.items()
+            },
+        )
+
+
+    def reindex(self) -> None:
+        """Rebuild the indexes, e.g. after the character lists were modified in place."""
+        self._novel_by_index = {character.index: character for character in self.characters_in_novel}
+        self._novel_by_identifier = {character.identifier_in_novel: character for character in self.characters_in_novel}
+        self._event_by_identifier = {
+            (event_idx, character.identifier_in_event): character
+            for event_idx, characters in self.characters_in_event.items()
+            for character in characters
+        }
+        self._scene_by_identifier = {
+            (event_idx, scene_idx, character.identifier_in_scene): character
+            for event_idx, scenes in self.characters_in_scene.items()
+            for scene_idx, characters in scenes.items()
+            for character in characters
+        }
+
+        # links that point to a missing character (a mismatch in the model outputs) are dropped with a warning
+        self._novel_of_event = {}
+        for character in self.characters_in_novel:
+            for event_idx, identifier_in_event in character.active_events.items():
+                if (event_idx, identifier_in_event) in self._event_by_identifier:
+                    self._novel_of_event[(event_idx, identifier_in_event)] = character
+                else:
+                    logging.warning(f"Character {character.identifier_in_novel} refers to {identifier_in_event}, which is not a character of event {event_idx}")
+
+        self._event_of_scene = {}
+        for (event_idx, _), character in self._event_by_identifier.items():
+            for scene_idx, identifier_in_scene in character.active_scenes.items():
+                if (event_idx, scene_idx, identifier_in_scene) in self._scene_by_identifier:
+                    self._event_of_scene[(event_idx, scene_idx, identifier_in_scene)] = character
+                else:
+                    logging.warning(f"Character {character.identifier_in_event} of event {event_idx} refers to {identifier_in_scene}, which is not a character of scene {scene_idx}")
+
+
+    def get_in_novel(
+        self,
+        index: Optional[int] = None,
+        identifier: Optional[str] = None,
+    ) -> CharacterInNovel:
+        """The novel character with the given index or identifier. Raises KeyError if there is none."""
+        if index is not None:
+            return self._novel_by_index[index]
+        return self._novel_by_identifier[identifier]
+
+
+    def get_in_event(self, event_idx: int, identifier: str) -> CharacterInEvent:
+        return self._event_by_identifier[(event_idx, identifier)]
+
+
+    def get_in_scene(self, event_idx: int, scene_idx: int, identifier: str) -> CharacterInScene:
+        return self._scene_by_identifier[(event_idx, scene_idx, identifier)]
+
+
+    def novel_character_of_event_character(self, event_idx: int, identifier_in_event: str) -> CharacterInNovel:
+        return self._novel_of_event[(event_idx, identifier_in_event)]
+
+
+    def event_character_of_scene_character(self, event_idx: int, scene_idx: int, identifier_in_scene: str) -> CharacterInEvent:
+        return self._event_of_scene[(event_idx, scene_idx, identifier_in_scene)]
+
+
+    def novel_character_of_scene_character(self, event_idx: int, scene_idx: int, identifier_in_scene: str) -> CharacterInNovel:
+        character_in_event = self.event_character_of_scene_character(event_idx, scene_idx, identifier_in_scene)
+        return self.novel_character_of_event_character(event_idx, character_in_event.identifier_in_event)
+
+
+    def scene_appearances(self, character: CharacterInNovel) -> Iterator[Tuple[int, int, CharacterInScene]]:
+        """The (event index, scene index, scene character) of every scene the novel character appears in."""
+        for event_idx, identifier_in_event in character.active_events.items():
+            character_in_event = self._event_by_identifier.get((event_idx, identifier_in_event))
+            if character_in_event is None:
+                continue
+            for scene_idx, identifier_in_scene in character_in_event.active_scenes.items():
+                character_in_scene = self._scene_by_identifier.get((event_idx, scene_idx, identifier_in_scene))
+                if character_in_scene is not None:
+                    yield event_idx, scene_idx, character_in_scene
+
+
+    def unresolved_scene_characters(self, event_idx: int, scene_idx: int) -> List[CharacterInScene]:
+        """The characters of a scene that resolve to no novel character, because a link on the way was dropped."""
+        unresolved = []
+        for character in self.characters_in_scene.get(event_idx, {}).get(scene_idx, []):
+            character_in_event = self._event_of_scene.get((event_idx, scene_idx, character.identifier_in_scene))
+            if character_in_event is None or (event_idx, character_in_event.identifier_in_event) not in self._novel_of_event:
+                unresolved.append(character)
+        return unresolved
+
+
+    def scene_portraits_registry(
+        self,
+        event_idx: int,
+        scene_idx: int,
+        portrait_path: Callable[[int, int, CharacterInScene], str],
+    ) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """
+        The character_portraits_registry of a scene, as taken by Script2VideoPipeline. Every character of the
+        scene has an entry, including those in unresolved_scene_characters, so it matches the characters of the
+        scene; the caller generates their portraits.
+
+        Args:
+            portrait_path:
+            Returns the portrait of a scene character from (event index, scene index, scene character).
+        """
+        return {
+            character.identifier_in_scene: {
+                "front": {
+                    "path": portrait_path(event_idx, scene_idx, character),
+                    "description": f"A front view portrait of {character.identifier_in_scene}.",
+                },
+            }
+            for character in self.characters_in_scene.get(event_idx, {}).get(scene_idx, [])
+        }
@@ -4,6 +4,7 @@ from typing import List, Literal, Optional, Union
 from PIL import Image
 
 from utils.image import download_image
+from utils.artifacts import atomic_open, atomic_path
 
 
 
@@ -29,7 +30,7 @@ class ImageOutput:
         Args:
             path (str): Path where the image will be saved.
         """
-        with open(path, 'wb') as f:
+        with atomic_open(path, 'wb') as f:
             f.write(base64.b64decode(self.data))
 
     def save_url(self, path: str) -> None:
@@ -46,7 +47,8 @@ class ImageOutput:
         Args:
             path (str): Path where the image will be saved.
         """
-        self.data.save(path)
+        with atomic_path(path) as tmp_path:
+            self.data.save(tmp_path)
 
     def save_np(self, path: str) -> None:
         """Save a numpy array to the specified path.
@@ -54,8 +56,10 @@ class ImageOutput:
         Args:
             path (str): Path where the image will be saved.
         """
-        cv2.imencode('.png', self.data)[1].tofile(path)
+        with atomic_path(path) as tmp_path:
+            cv2.imencode('.png', self.data)[1].tofile(tmp_path)
 
     def save(self, path: str) -> None:
+        """Save the image to the specified path. The file appears only once it is complete."""
         save_func = getattr(self, f"save_{self.fmt}")
         save_func(path)
\ No newline at end of file
@@ -3,6 +3,7 @@ from typing import List, Literal, Optional, Union
 from PIL import Image
 
 from utils.video import download_video
+from utils.artifacts import atomic_open
 
 
 class VideoOutput:
@@ -34,10 +35,11 @@ class VideoOutput:
         Args:
             path (str): Path where the video will be saved.
         """
-        with open(path, 'wb') as f:
+        with atomic_open(path, 'wb') as f:
             f.write(self.data)
 
     def save(self, path: str) -> None:
+        """Save the video to the specified path. The file appears only once it is complete."""
         save_func = getattr(self, f"save_{self.fmt}")
         save_func(path)
 
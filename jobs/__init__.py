@@ -0,0 +1,9 @@
+from .queue import Job, JobQueue
+from .worker import Worker, start_workers
+
+__all__ = [
+    "Job",
+    "JobQueue",
+    "Worker",
+    "start_workers",
+]
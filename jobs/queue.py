@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+# what a worker learns from its heartbeat: keep running, stop because a cancellation was requested, or stop
+# because the job is no longer its own (it was requeued as stale and possibly claimed by another worker)
+HeartbeatStatus = Literal["running", "cancel_requested", "lost"]
+
+
+class Job(BaseModel):
+    id: str = Field(
+        description="The unique id of the job.",
+    )
+    pipeline: Literal["idea2video", "script2video"] = Field(
+        description="The pipeline that runs the job.",
+    )
+    config_path: str = Field(
+        description="The config file used to build the pipeline.",
+    )
+    params: Dict[str, Any] = Field(
+        description="The keyword arguments passed to the pipeline call, e.g. idea/script, user_requirement and style.",
+    )
+    working_dir: str = Field(
+        description="The working directory of the job. Checkpoint files in it are reused when the job is resumed.",
+    )
+    status: JobStatus = Field(
+        description="The current status of the job.",
+    )
+    attempts: int = Field(
+        default=0,
+        description="How many times the job has been claimed by a worker.",
+    )
+    worker_id: Optional[str] = Field(
+        default=None,
+        description="The worker currently (or last) running the job.",
+    )
+    cancel_requested: bool = Field(
+        default=False,
+        description="Whether a cancellation was requested while the job was running.",
+    )
+    result: Optional[str] = Field(
+        default=None,
+        description="The path of the final video if the job succeeded.",
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="The error message of the last failed attempt.",
+    )
+    created_at: float
+    updated_at: float
+    heartbeat_at: Optional[float] = None
+
+
+class JobQueue:
+    """
+    A durable job queue backed by a local SQLite database.
+
+    It is safe to use from several worker processes at the same time: every call opens its
+    own connection and claiming a job happens inside an immediate (write-locked) transaction.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        jobs_dir: Optional[str] = None,
+        max_attempts: int = 3,
+    ):
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "jobs")
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    pipeline TEXT NOT NULL,
+                    config_path TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    working_dir TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Job:
+        data = dict(row)
+        data["params"] = json.loads(data["params"])
+        data["cancel_requested"] = bool(data["cancel_requested"])
+        return Job.model_validate(data)
+
+
+    def submit(
+        self,
+        pipeline: Literal["idea2video", "script2video"],
+        config_path: str,
+        params: Dict[str, Any],
+        working_dir: Optional[str] = None,
+    ) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        working_dir = working_dir or os.path.join(self.jobs_dir, job_id)
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, pipeline, config_path, params, working_dir, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, pipeline, config_path, json.dumps(params, ensure_ascii=False), working_dir, now, now),
+            )
+        return job_id
+
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+
+    def list_jobs(self, status: Optional[JobStatus] = None) -> List[Job]:
+        with self.connect() as conn:
+            if status is None:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at").fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (status,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+    def count(self, status: JobStatus) -> int:
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """Atomically take the oldest queued job and mark it as running."""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+
+    def heartbeat(self, job_id: str, worker_id: str) -> HeartbeatStatus:
+        """
+        Refresh the heartbeat of a running job. Returns "lost" if the job is no longer running on `worker_id`,
+        in which case the worker must stop without recording anything.
+        """
+        now = time.time()
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now, job_id, worker_id),
+            )
+            if cursor.rowcount == 0:
+                return "lost"
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return "cancel_requested" if row is not None and row["cancel_requested"] else "running"
+
+
+    # the terminal updates only apply to the attempt of `worker_id`, so a worker that lost its job cannot
+    # overwrite the status or result of the worker that runs it now; they return whether they applied
+
+    def complete(self, job_id: str, worker_id: str, result: Optional[str]) -> bool:
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (result, time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Record a failed attempt. The job is queued again until it runs out of attempts."""
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, error = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (self.max_attempts, error, time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def release(self, job_id: str, worker_id: str) -> bool:
+        """Put a job back into the queue when its worker shuts down. The interrupted attempt is not counted."""
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, attempts = MAX(attempts - 1, 0), updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def mark_cancelled(self, job_id: str, worker_id: str) -> bool:
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job right away, or ask the worker running it to stop. Returns False if the job already finished."""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] in ("succeeded", "failed", "cancelled"):
+                conn.execute("COMMIT")
+                return False
+            if row["status"] == "queued":
+                conn.execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ?", (now, job_id))
+            else:
+                conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (now, job_id))
+            conn.execute("COMMIT")
+        return True
+
+
+    def requeue_stale(self, stale_timeout: float) -> List[str]:
+        """Put running jobs whose worker stopped sending heartbeats (e.g. crashed) back into the queue."""
+        deadline = time.time() - stale_timeout
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, attempts, cancel_requested FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                (deadline,),
+            ).fetchall()
+            for row in rows:
+                if row["cancel_requested"]:
+                    status = "cancelled"
+                elif row["attempts"] < self.max_attempts:
+                    status = "queued"
+                else:
+                    status = "failed"
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = COALESCE(error, 'worker stopped sending heartbeats'), updated_at = ? WHERE id = ?",
+                    (status, time.time(), row["id"]),
+                )
+            conn.execute("COMMIT")
+        return [row["id"] for row in rows]
@@ -0,0 +1,169 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+import traceback
+import multiprocessing
+from typing import Any, Callable, List, Optional
+from jobs.queue import Job, JobQueue
+from utils.event_bus import EventBus, JsonlSink, get_default_event_bus
+
+
+def build_pipeline(job: Job, event_bus: Optional[EventBus] = None):
+    # imported lazily so that submitting jobs does not pay for the heavy pipeline imports
+    if job.pipeline == "idea2video":
+        from pipelines.idea2video_pipeline import Idea2VideoPipeline
+        return Idea2VideoPipeline.init_from_config(config_path=job.config_path, working_dir=job.working_dir, event_bus=event_bus)
+    elif job.pipeline == "script2video":
+        from pipelines.script2video_pipeline import Script2VideoPipeline
+        return Script2VideoPipeline.init_from_config(config_path=job.config_path, working_dir=job.working_dir, event_bus=event_bus)
+    else:
+        raise ValueError(f"Unknown pipeline: {job.pipeline}")
+
+
+class Worker:
+    """
+    Pulls jobs from the JobQueue and runs them one at a time.
+
+    While a job runs, the worker keeps its heartbeat fresh and watches for cancellation.
+    A job whose worker died is put back into the queue by any other worker (see
+    JobQueue.requeue_stale) and resumes from the checkpoint files in its working_dir.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        worker_id: Optional[str] = None,
+        poll_interval: float = 2.0,
+        heartbeat_interval: float = 10.0,
+        stale_timeout: float = 600.0,
+        pipeline_factory: Callable[[Job, EventBus], Any] = build_pipeline,
+    ):
+        """
+        Args:
+            pipeline_factory:
+            Builds the pipeline that runs a job and publishes to the given event bus. Defaults to building a fresh pipeline from the job's config file.
+        """
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_timeout = stale_timeout
+        self.pipeline_factory = pipeline_factory
+
+
+    async def run_job(self, job: Job) -> None:
+        logging.info(f"Worker {self.worker_id} started job {job.id} ({job.pipeline}, attempt {job.attempts}) in {job.working_dir}")
+        # the progress events of a job are tagged with its id and kept in its working_dir, where the service streams them from
+        os.makedirs(job.working_dir, exist_ok=True)
+        events_sink = JsonlSink(os.path.join(job.working_dir, "events.jsonl"))
+        event_bus = get_default_event_bus().child(sinks=[events_sink], job_id=job.id)
+        try:
+            await self.run_pipeline(job, event_bus)
+        finally:
+            events_sink.close()
+
+
+    async def run_pipeline(self, job: Job, event_bus: EventBus) -> None:
+        try:
+            pipeline = self.pipeline_factory(job, event_bus)
+        except Exception as e:
+            logging.error(f"Job {job.id} failed to build its pipeline: {e}")
+            self.queue.fail(job.id, self.worker_id, "".join(traceback.format_exception(type(e), e, e.__traceback__)))
+            return
+        pipeline_task = asyncio.create_task(pipeline(**job.params))
+
+        heartbeat_status = "running"
+        try:
+            while not pipeline_task.done():
+                done, _ = await asyncio.wait({pipeline_task}, timeout=self.heartbeat_interval)
+                if done:
+                    break
+                heartbeat_status = await asyncio.to_thread(self.queue.heartbeat, job.id, self.worker_id)
+                if heartbeat_status != "running":
+                    pipeline_task.cancel()
+                    await asyncio.gather(pipeline_task, return_exceptions=True)
+        except asyncio.CancelledError:
+            # the worker is shutting down: the pipeline is stopped before the job goes back to the queue,
+            # so the next worker does not share the working_dir with it
+            pipeline_task.cancel()
+            await asyncio.gather(pipeline_task, return_exceptions=True)
+            self.queue.release(job.id, self.worker_id)
+            logging.info(f"Worker {self.worker_id} stopped, job {job.id} put back into the queue.")
+            raise
+        finally:
+            if not pipeline_task.done():
+                pipeline_task.cancel()
+                await asyncio.gather(pipeline_task, return_exceptions=True)
+
+        if heartbeat_status == "lost":
+            # another worker may be running the job in the same working_dir now, so nothing is recorded
+            logging.warning(f"Worker {self.worker_id} lost job {job.id} (requeued as stale), stopped its pipeline.")
+            return
+
+        if heartbeat_status == "cancel_requested":
+            self.queue.mark_cancelled(job.id, self.worker_id)
+            logging.info(f"Job {job.id} cancelled.")
+            return
+
+        try:
+            final_video_path = pipeline_task.result()
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {e}")
+            if not self.queue.fail(job.id, self.worker_id, "".join(traceback.format_exception(type(e), e, e.__traceback__))):
+                logging.warning(f"Job {job.id} is no longer owned by worker {self.worker_id}, its failure was not recorded.")
+            return
+
+        if self.queue.complete(job.id, self.worker_id, final_video_path):
+            logging.info(f"Job {job.id} succeeded, final video saved to {final_video_path}")
+        else:
+            logging.warning(f"Job {job.id} is no longer owned by worker {self.worker_id}, its result {final_video_path} was not recorded.")
+
+
+    async def run(self, max_jobs: Optional[int] = None) -> None:
+        num_jobs = 0
+        while max_jobs is None or num_jobs < max_jobs:
+            requeued = self.queue.requeue_stale(self.stale_timeout)
+            if requeued:
+                logging.warning(f"Requeued stale jobs: {requeued}")
+
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            num_jobs += 1
+            await self.run_job(job)
+
+
+def _worker_process_main(db_path: str, metrics_port: Optional[int], worker_kwargs: dict) -> None:
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker {os.getpid()}] %(levelname)s %(message)s")
+    queue = JobQueue(db_path)
+    if metrics_port is not None:
+        from utils.metrics import enable_metrics
+        metrics = enable_metrics(port=metrics_port)
+        if metrics is not None:
+            metrics.track_job_queue(queue)
+    worker = Worker(queue=queue, **worker_kwargs)
+    asyncio.run(worker.run())
+
+
+def start_workers(
+    db_path: str,
+    num_workers: int,
+    metrics_port: Optional[int] = None,
+    **worker_kwargs,
+) -> List[multiprocessing.Process]:
+    """
+    Start `num_workers` worker processes that pull jobs from the queue at `db_path`.
+
+    With `metrics_port`, worker i serves its Prometheus metrics on port `metrics_port + i`.
+    """
+    processes = []
+    for i in range(num_workers):
+        port = metrics_port + i if metrics_port is not None else None
+        process = multiprocessing.Process(target=_worker_process_main, args=(db_path, port, worker_kwargs), daemon=False)
+        process.start()
+        processes.append(process)
+    return processes
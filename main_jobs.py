@@ -0,0 +1,68 @@
+import json
+import argparse
+from jobs import JobQueue, start_workers
+
+
+# Usage:
+#   python main_jobs.py submit --pipeline script2video --config configs/script2video.yaml --params params.json
+#   python main_jobs.py work --num-workers 4
+#   python main_jobs.py status <job_id>
+#   python main_jobs.py list
+#   python main_jobs.py cancel <job_id>
+# params.json holds the keyword arguments of the pipeline call, e.g. {"script": ..., "user_requirement": ..., "style": ...}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit and run video generation jobs.")
+    parser.add_argument("--db", default=".working_dir/jobs.db", help="Path of the job queue database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit")
+    submit_parser.add_argument("--pipeline", choices=["idea2video", "script2video"], required=True)
+    submit_parser.add_argument("--config", required=True)
+    submit_parser.add_argument("--params", required=True, help="A JSON file with the keyword arguments of the pipeline call.")
+    submit_parser.add_argument("--working-dir", default=None)
+
+    work_parser = subparsers.add_parser("work")
+    work_parser.add_argument("--num-workers", type=int, default=1)
+    work_parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics, worker i on port metrics-port + i.")
+
+    status_parser = subparsers.add_parser("status")
+    status_parser.add_argument("job_id")
+
+    subparsers.add_parser("list")
+
+    cancel_parser = subparsers.add_parser("cancel")
+    cancel_parser.add_argument("job_id")
+
+    args = parser.parse_args()
+    queue = JobQueue(args.db)
+
+    if args.command == "submit":
+        with open(args.params, "r", encoding="utf-8") as f:
+            params = json.load(f)
+        job_id = queue.submit(pipeline=args.pipeline, config_path=args.config, params=params, working_dir=args.working_dir)
+        print(f"📥 Submitted job {job_id}.")
+    elif args.command == "work":
+        processes = start_workers(args.db, num_workers=args.num_workers, metrics_port=args.metrics_port)
+        print(f"👷 Started {len(processes)} workers.")
+        for process in processes:
+            process.join()
+    elif args.command == "status":
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"❌ Job {args.job_id} not found.")
+        else:
+            print(json.dumps(job.model_dump(exclude={"params"}), ensure_ascii=False, indent=4))
+    elif args.command == "list":
+        for job in queue.list_jobs():
+            print(f"{job.id}\t{job.pipeline}\t{job.status}\t{job.working_dir}")
+    elif args.command == "cancel":
+        if queue.cancel(args.job_id):
+            print(f"🛑 Cancellation requested for job {args.job_id}.")
+        else:
+            print(f"❌ Job {args.job_id} not found or already finished.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import json
+import asyncio
+import argparse
+from distributed import LocalWorkQueue, LocalArtifactStore, ShotCoordinator, start_shot_workers
+
+
+# Usage:
+#   python main_script2video_distributed.py coordinate --config configs/script2video.yaml --params params.json --local-workers 4
+#   python main_script2video_distributed.py work --config configs/script2video.yaml --num-workers 4
+# params.json holds the keyword arguments of the pipeline call, e.g. {"script": ..., "user_requirement": ..., "style": ...}
+# Without --local-workers the coordinator only publishes the work units and waits for workers started with `work`.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Script2Video with frames and videos sharded across shot workers.")
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--db", default=".working_dir/distributed/work_units.db", help="Path of the work queue database.")
+    parser.add_argument("--store", default=".working_dir/distributed/artifacts", help="Directory of the artifact store.")
+    parser.add_argument("--scratch", default=".working_dir/distributed/scratch", help="Scratch directory of the workers.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics, worker i on port metrics-port + i.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinate_parser = subparsers.add_parser("coordinate")
+    coordinate_parser.add_argument("--params", required=True, help="A JSON file with the keyword arguments of the pipeline call.")
+    coordinate_parser.add_argument("--working-dir", default=None)
+    coordinate_parser.add_argument("--local-workers", type=int, default=0)
+
+    work_parser = subparsers.add_parser("work")
+    work_parser.add_argument("--num-workers", type=int, default=1)
+    work_parser.add_argument("--idle-timeout", type=float, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "coordinate":
+        from pipelines.script2video_pipeline import Script2VideoPipeline
+        with open(args.params, "r", encoding="utf-8") as f:
+            params = json.load(f)
+
+        processes = start_shot_workers(args.config, args.db, args.store, args.scratch, num_workers=args.local_workers, metrics_port=args.metrics_port)
+        try:
+            pipeline = Script2VideoPipeline.init_from_config(config_path=args.config, working_dir=args.working_dir)
+            coordinator = ShotCoordinator(
+                pipeline=pipeline,
+                work_queue=LocalWorkQueue(args.db),
+                artifact_store=LocalArtifactStore(args.store),
+            )
+            final_video_path = asyncio.run(coordinator(**params))
+            print(f"🎉 Final video saved to {final_video_path}.")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+    elif args.command == "work":
+        processes = start_shot_workers(args.config, args.db, args.store, args.scratch, num_workers=args.num_workers, idle_timeout=args.idle_timeout, metrics_port=args.metrics_port)
+        print(f"👷 Started {len(processes)} shot workers.")
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
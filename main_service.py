@@ -0,0 +1,41 @@
+import logging
+import argparse
+from aiohttp import web
+from jobs import JobQueue
+from service import PipelineService
+from utils.metrics import enable_metrics
+
+
+# Usage:
+#   python main_service.py --port 8080 --num-workers 2
+#   curl -X POST localhost:8080/jobs -d '{"pipeline": "script2video", "params": {"script": ..., "user_requirement": ..., "style": ...}}'
+#   curl -N localhost:8080/jobs/<job_id>/events
+#   curl localhost:8080/metrics  (with --metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the video generation pipelines over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=".working_dir/jobs.db", help="Path of the job queue database.")
+    parser.add_argument("--idea2video-config", default="configs/idea2video.yaml")
+    parser.add_argument("--script2video-config", default="configs/script2video.yaml")
+    parser.add_argument("--num-workers", type=int, default=2, help="Jobs run at the same time in the service process.")
+    parser.add_argument("--metrics", action="store_true", help="Serve Prometheus metrics on /metrics (requires prometheus_client).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    service = PipelineService(
+        queue=JobQueue(args.db),
+        config_paths={
+            "idea2video": args.idea2video_config,
+            "script2video": args.script2video_config,
+        },
+        num_workers=args.num_workers,
+        metrics=enable_metrics() if args.metrics else None,
+    )
+    web.run_app(service.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
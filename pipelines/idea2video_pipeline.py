@@ -1,15 +1,21 @@
 import os
+import copy
 import logging
-from agents import Screenwriter, CharacterExtractor, CharacterPortraitsGenerator
+from agents import Screenwriter, CharacterExtractor, CharacterPortraitsGenerator, EnvironmentExtractor
 from pipelines.script2video_pipeline import Script2VideoPipeline
-from interfaces import CharacterInScene
+from interfaces import CharacterInScene, EnvironmentInScene
 from typing import List, Dict, Optional
 import asyncio
 import json
-from moviepy import VideoFileClip, concatenate_videoclips
 import yaml
 from langchain.chat_models import init_chat_model
 import importlib
+from utils.config import init_from_class_path
+from utils.event_bus import EventBus, get_default_event_bus, StageStarted, StageProgress, StageFinished, ArtifactReady, CacheHit
+from utils.artifacts import atomic_open, validate_artifact
+from utils.environment_library import EnvironmentLibrary
+from utils.run_manifest import RunManifest
+from utils.video import concatenate_video_files
 
 class Idea2VideoPipeline:
     def __init__(
@@ -18,21 +24,42 @@ class Idea2VideoPipeline:
         image_generator: str,
         video_generator: str,
         working_dir: str,
+        num_frame_candidates: int = 1,
+        min_frame_candidates: Optional[int] = None,
+        candidate_image_generators: Optional[List] = None,
+        event_bus: Optional[EventBus] = None,
     ):
         self.chat_model = chat_model
         self.image_generator = image_generator
         self.video_generator = video_generator
+        self.num_frame_candidates = num_frame_candidates
+        self.min_frame_candidates = min_frame_candidates
+        self.candidate_image_generators = candidate_image_generators
+        self.event_bus = event_bus or get_default_event_bus()
         self.working_dir = working_dir
         os.makedirs(self.working_dir, exist_ok=True)
+        self.run_manifest = RunManifest(self.working_dir)
 
         self.screenwriter = Screenwriter(chat_model=self.chat_model)
         self.character_extractor = CharacterExtractor(chat_model=self.chat_model)
         self.character_portraits_generator = CharacterPortraitsGenerator(image_generator=self.image_generator)
+        self.environment_extractor = EnvironmentExtractor(chat_model=self.chat_model)
+
+    def with_working_dir(self, working_dir: str, event_bus: Optional[EventBus] = None):
+        """Return a pipeline that shares the chat model, generators and agents of this one but works in another working_dir."""
+        pipeline = copy.copy(self)
+        pipeline.working_dir = working_dir
+        pipeline.event_bus = event_bus or self.event_bus
+        os.makedirs(pipeline.working_dir, exist_ok=True)
+        pipeline.run_manifest = RunManifest(pipeline.working_dir)
+        return pipeline
 
     @classmethod
     def init_from_config(
         cls,
         config_path: str,
+        working_dir: Optional[str] = None,
+        event_bus: Optional[EventBus] = None,
     ):
         with open(config_path, "r") as f:
             config = yaml.safe_load(f)
@@ -50,11 +77,21 @@ class Idea2VideoPipeline:
         video_generator_args = config["video_generator"]["init_args"]
         video_generator = video_generator_cls(**video_generator_args)
 
+        frame_candidates_config = config.get("frame_candidates") or {}
+        candidate_image_generators = [
+            init_from_class_path(item)
+            for item in frame_candidates_config.get("image_generators") or []
+        ]
+
         return cls(
             chat_model=chat_model,
             image_generator=image_generator,
             video_generator=video_generator,
-            working_dir=config["working_dir"],
+            working_dir=working_dir or config["working_dir"],
+            num_frame_candidates=frame_candidates_config.get("num_candidates", 1),
+            min_frame_candidates=frame_candidates_config.get("min_candidates"),
+            candidate_image_generators=candidate_image_generators,
+            event_bus=event_bus,
         )
 
     async def extract_characters(
@@ -63,34 +100,57 @@ class Idea2VideoPipeline:
     ):
         save_path = os.path.join(self.working_dir, "characters.json")
 
-        if os.path.exists(save_path):
+        if os.path.exists(save_path) and validate_artifact(save_path):
             with open(save_path, "r", encoding="utf-8") as f:
                 characters = json.load(f)
             characters = [CharacterInScene.model_validate(character) for character in characters]
-            print(f"🚀 Loaded {len(characters)} characters from existing file.")
+            self.event_bus.publish(CacheHit(stage="extract_characters", path=save_path, message=f"🚀 Loaded {len(characters)} characters from existing file."))
         else:
             characters = await self.character_extractor.extract_characters(story)
-            with open(save_path, "w", encoding="utf-8") as f:
+            with atomic_open(save_path, "w", encoding="utf-8") as f:
                 json.dump([character.model_dump() for character in characters], f, ensure_ascii=False, indent=4)
-            print(f"✅ Extracted {len(characters)} characters from story and saved to {save_path}.")
+            self.event_bus.publish(ArtifactReady(stage="extract_characters", path=save_path, message=f"✅ Extracted {len(characters)} characters from story and saved to {save_path}."))
 
         return characters
 
 
+    async def extract_environment(
+        self,
+        scene_idx: int,
+        scene_script: str,
+    ) -> EnvironmentInScene:
+        save_path = os.path.join(self.working_dir, f"scene_{scene_idx}", "environment.json")
+
+        if os.path.exists(save_path) and validate_artifact(save_path):
+            with open(save_path, "r", encoding="utf-8") as f:
+                environment = EnvironmentInScene.model_validate(json.load(f))
+            self.event_bus.publish(CacheHit(stage="extract_environment", path=save_path, attributes={"scene_idx": scene_idx}, message=f"🚀 Loaded the environment of scene {scene_idx} from existing file."))
+        else:
+            environment = await self.environment_extractor.extract_environment(scene_script)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            with atomic_open(save_path, "w", encoding="utf-8") as f:
+                json.dump(environment.model_dump(), f, ensure_ascii=False, indent=4)
+            self.event_bus.publish(ArtifactReady(stage="extract_environment", path=save_path, attributes={"scene_idx": scene_idx}, message=f"✅ Extracted the environment of scene {scene_idx} ({environment.slugline}) and saved to {save_path}."))
+
+        return environment
+
+
     async def generate_character_portraits(
         self,
         characters: List[CharacterInScene],
         character_portraits_registry: Optional[Dict[str, Dict[str, Dict[str, str]]]],
         style: str,
     ):
-        character_portraits_registry_path = os.path.join(self.working_dir, "character_portraits_registry.json")
         if character_portraits_registry is None:
-            if os.path.exists(character_portraits_registry_path):
-                with open(character_portraits_registry_path, 'r', encoding='utf-8') as f:
-                    character_portraits_registry = json.load(f)
-            else:
-                character_portraits_registry = {}
-
+            if not self.run_manifest.get_outputs("generate_character_portraits"):
+                self.run_manifest.get_output(
+                    "character_portraits/legacy_registry",
+                    stage="generate_character_portraits",
+                    legacy_path="character_portraits_registry.json",
+                )
+            character_portraits_registry = {}
+            for registry_item in self.run_manifest.get_outputs("generate_character_portraits").values():
+                character_portraits_registry.update(registry_item)
 
         tasks = [
             self.generate_portraits_for_single_character(character, style)
@@ -98,14 +158,23 @@ class Idea2VideoPipeline:
             if character.identifier_in_scene not in character_portraits_registry
         ]
         if tasks:
+            self.event_bus.publish(StageStarted(stage="generate_character_portraits"))
             for future in asyncio.as_completed(tasks):
-                character_portraits_registry.update(await future)
-                with open(character_portraits_registry_path, 'w', encoding='utf-8') as f:
-                    json.dump(character_portraits_registry, f, ensure_ascii=False, indent=4)
-
-            print(f"✅ Completed character portrait generation for {len(characters)} characters.")
+                registry_item = await future
+                character_portraits_registry.update(registry_item)
+                # one row per character, so finishing a character does not rewrite the others
+                for identifier_in_scene in registry_item:
+                    self.run_manifest.put_output(
+                        f"character_portraits/{identifier_in_scene}",
+                        stage="generate_character_portraits",
+                        data={identifier_in_scene: registry_item[identifier_in_scene]},
+                        legacy_path="character_portraits_registry.json",
+                    )
+            self.run_manifest.export_legacy_layout()
+
+            self.event_bus.publish(StageFinished(stage="generate_character_portraits", message=f"✅ Completed character portrait generation for {len(characters)} characters."))
         else:
-            print("🚀 All characters already have portraits, skipping portrait generation.")
+            self.event_bus.publish(CacheHit(stage="generate_character_portraits", path=self.run_manifest.db_path, message="🚀 All characters already have portraits, skipping portrait generation."))
 
         return character_portraits_registry
 
@@ -117,16 +186,16 @@ class Idea2VideoPipeline:
         user_requirement: str,
     ):
         save_path = os.path.join(self.working_dir, "story.txt")
-        if os.path.exists(save_path):
+        if os.path.exists(save_path) and validate_artifact(save_path):
             with open(save_path, "r", encoding="utf-8") as f:
                 story = f.read()
-            print(f"🚀 Loaded story from existing file.")
+            self.event_bus.publish(CacheHit(stage="develop_story", path=save_path, message=f"🚀 Loaded story from existing file."))
         else:
-            print("🧠 Developing story...")
+            self.event_bus.publish(StageStarted(stage="develop_story", message="🧠 Developing story..."))
             story = await self.screenwriter.develop_story(idea=idea, user_requirement=user_requirement)
-            with open(save_path, "w", encoding="utf-8") as f:
+            with atomic_open(save_path, "w", encoding="utf-8") as f:
                 f.write(story)
-            print(f"✅ Developed story and saved to {save_path}.")
+            self.event_bus.publish(ArtifactReady(stage="develop_story", path=save_path, message=f"✅ Developed story and saved to {save_path}."))
 
         return story
 
@@ -137,16 +206,16 @@ class Idea2VideoPipeline:
         user_requirement: str,
     ):
         save_path = os.path.join(self.working_dir, "script.json")
-        if os.path.exists(save_path):
+        if os.path.exists(save_path) and validate_artifact(save_path):
             with open(save_path, "r", encoding="utf-8") as f:
                 script = json.load(f)
-            print(f"🚀 Loaded script from existing file.")
+            self.event_bus.publish(CacheHit(stage="write_script", path=save_path, message=f"🚀 Loaded script from existing file."))
         else:
-            print("🧠 Writing script based on story...")
+            self.event_bus.publish(StageStarted(stage="write_script", message="🧠 Writing script based on story..."))
             script = await self.screenwriter.write_script_based_on_story(story=story, user_requirement=user_requirement)
-            with open(save_path, "w", encoding="utf-8") as f:
+            with atomic_open(save_path, "w", encoding="utf-8") as f:
                 json.dump(script, f, ensure_ascii=False, indent=4)
-            print(f"✅ Written script based on story and saved to {save_path}.")
+            self.event_bus.publish(ArtifactReady(stage="write_script", path=save_path, message=f"✅ Written script based on story and saved to {save_path}."))
         return script
 
 
@@ -159,7 +228,7 @@ class Idea2VideoPipeline:
         os.makedirs(character_dir, exist_ok=True)
 
         front_portrait_path = os.path.join(character_dir, "front.png")
-        if os.path.exists(front_portrait_path):
+        if os.path.exists(front_portrait_path) and validate_artifact(front_portrait_path):
             pass
         else:
             front_portrait_output = await self.character_portraits_generator.generate_front_portrait(character, style)
@@ -167,20 +236,20 @@ class Idea2VideoPipeline:
 
 
         side_portrait_path = os.path.join(character_dir, "side.png")
-        if os.path.exists(side_portrait_path):
+        if os.path.exists(side_portrait_path) and validate_artifact(side_portrait_path):
             pass
         else:
             side_portrait_output = await self.character_portraits_generator.generate_side_portrait(character, front_portrait_path)
             side_portrait_output.save(side_portrait_path)
 
         back_portrait_path = os.path.join(character_dir, "back.png")
-        if os.path.exists(back_portrait_path):
+        if os.path.exists(back_portrait_path) and validate_artifact(back_portrait_path):
             pass
         else:
             back_portrait_output = await self.character_portraits_generator.generate_back_portrait(character, front_portrait_path)
             back_portrait_output.save(back_portrait_path)
 
-        print(f"☑️ Completed character portrait generation for {character.identifier_in_scene}.")
+        self.event_bus.publish(StageProgress(stage="generate_character_portraits", attributes={"character": character.identifier_in_scene}, message=f"☑️ Completed character portrait generation for {character.identifier_in_scene}."))
 
         return {
             character.identifier_in_scene: {
@@ -220,14 +289,30 @@ class Idea2VideoPipeline:
 
         all_video_paths = []
 
+        # the establishing frame of the first scene at a location is kept as its plate, and offered as a reference
+        # to the root cameras of the later scenes at the location
+        environment_library = EnvironmentLibrary(os.path.join(self.working_dir, "environments"))
+        environments = await asyncio.gather(*[
+            self.extract_environment(scene_idx=idx, scene_script=scene_script)
+            for idx, scene_script in enumerate(scene_scripts)
+        ])
+
         for idx, scene_script in enumerate(scene_scripts):
             scene_working_dir = os.path.join(self.working_dir, f"scene_{idx}")
             os.makedirs(scene_working_dir, exist_ok=True)
+            environment = environments[idx]
+            environment_reference_image_path_and_text_pairs = environment_library.reference_image_path_and_text_pairs(environment)
+            if environment_reference_image_path_and_text_pairs:
+                self.event_bus.publish(CacheHit(stage="reuse_environment", path=environment_reference_image_path_and_text_pairs[0][0], attributes={"scene_idx": idx}, message=f"🚀 Reusing the plate of {environment.slugline} for scene {idx}."))
             script2video_pipeline = Script2VideoPipeline(
                 chat_model=self.chat_model,
                 image_generator=self.image_generator,
                 video_generator=self.video_generator,
                 working_dir=scene_working_dir,
+                num_frame_candidates=self.num_frame_candidates,
+                min_frame_candidates=self.min_frame_candidates,
+                candidate_image_generators=self.candidate_image_generators,
+                event_bus=self.event_bus.child(scene_idx=idx),
             )
             final_video_path = await script2video_pipeline(
                 script=scene_script,
@@ -235,16 +320,20 @@ class Idea2VideoPipeline:
                 style=style,
                 characters=characters,
                 character_portraits_registry=character_portraits_registry,
+                environment_reference_image_path_and_text_pairs=environment_reference_image_path_and_text_pairs,
             )
             all_video_paths.append(final_video_path)
 
+            # the storyboard opens every scene with its widest, establishing shot
+            plate_path = os.path.join(scene_working_dir, "shots", "0", "first_frame.png")
+            if os.path.exists(plate_path) and validate_artifact(plate_path) and environment_library.add(environment, plate_path):
+                self.event_bus.publish(ArtifactReady(stage="reuse_environment", path=plate_path, attributes={"scene_idx": idx}, message=f"☑️ Added the establishing frame of scene {idx} as the plate of {environment.slugline}."))
+
         final_video_path = os.path.join(self.working_dir, "final_video.mp4")
-        if os.path.exists(final_video_path):
-            print(f"🚀 Skipped concatenating videos, already exists.")
+        if os.path.exists(final_video_path) and validate_artifact(final_video_path):
+            self.event_bus.publish(CacheHit(stage="concatenate_videos", path=final_video_path, message=f"🚀 Skipped concatenating videos, already exists."))
         else:
-            print(f"🎬 Starting concatenating videos...")
-            video_clips = [VideoFileClip(final_video_path) for final_video_path in all_video_paths]
-            final_video = concatenate_videoclips(video_clips)
-            final_video.write_videofile(final_video_path)
-            print(f"☑️ Concatenated videos, saved to {final_video_path}.")
+            self.event_bus.publish(StageStarted(stage="concatenate_videos", message=f"🎬 Starting concatenating videos..."))
+            await asyncio.to_thread(concatenate_video_files, all_video_paths, final_video_path)
+            self.event_bus.publish(ArtifactReady(stage="concatenate_videos", path=final_video_path, message=f"☑️ Concatenated videos, saved to {final_video_path}."))
         return final_video_path
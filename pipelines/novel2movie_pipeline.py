@@ -1,16 +1,16 @@
 # TODO: NOT IMPLEMENTED YET
 
 import os
+import re
 import shutil
+import hashlib
 import yaml
 import json
 import importlib
 import asyncio
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from langchain.embeddings import CacheBackedEmbeddings
 from langchain.storage import LocalFileStore
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from PIL import Image
 
 from components.event import Event
@@ -18,393 +18,524 @@ from components.scene import Scene
 from components.character import CharacterInScene, CharacterInNovel, CharacterInEvent
 from pipelines.base import BasePipeline
 from tenacity import retry
+from utils.event_bus import EventBus, get_default_event_bus, StageStarted, StageProgress, StageFinished, ArtifactReady, CacheHit
+from utils.knowledge_base import NovelKnowledgeBase
+from utils.artifacts import atomic_open, atomic_path, validate_artifact, link_artifact, is_temp_path
+from utils.run_manifest import RunManifest
+from interfaces import CharacterRegistry
+from utils.novel_stream import NovelTextStream, iter_shared_chunks
+from utils.video import concatenate_video_files
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _normalize_features(features: str) -> str:
+    # case, whitespace and trailing punctuation do not change the portrait
+    return re.sub(r"\s+", " ", features).strip().strip(".;,").lower()
+
+
+def _portrait_request_key(base_portrait_digest: str, dynamic_features: str, style: Optional[str]) -> Optional[str]:
+    """The key of a portrait generated from a base portrait, or None if the features leave the base portrait unchanged."""
+    features = _normalize_features(dynamic_features)
+    if not features:
+        return None
+    return hashlib.sha256(json.dumps([base_portrait_digest, features, style or ""]).encode("utf-8")).hexdigest()[:32]
 
 class Novel2MoviePipeline(BasePipeline):
 
+    event_bus: Optional[EventBus] = None
+
+    # the number of scenes whose videos are generated at the same time
+    max_concurrent_scenes: int = 4
+
     async def __call__(
         self,
-        novel_text: str,
-        style: str,
+        novel_text: Optional[str] = None,
+        style: Optional[str] = None,
+        novel_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            novel_text, novel_path:
+            The novel, as a string or as the path of a UTF-8 text file. Either way it is read from the working_dir
+            copy in blocks, so a file of any size is never held in memory at once.
+        """
+        try:
+            return await self._run(novel_text=novel_text, style=style, novel_path=novel_path)
+        finally:
+            # a reranker backed by an HTTP API keeps its session open across the calls of a run
+            if hasattr(self.rerank_model, "close"):
+                await self.rerank_model.close()
+
+
+    async def _run(
+        self,
+        novel_text: Optional[str],
+        style: Optional[str],
+        novel_path: Optional[str],
     ):
-        print("🎬 Novel to Movie Pipeline Started".center(80, "="))
+        assert (novel_text is None) != (novel_path is None), "Exactly one of novel_text and novel_path must be given"
+        event_bus = self.event_bus or get_default_event_bus()
+        event_bus.publish(StageStarted(stage="novel2movie", message="🎬 Novel to Movie Pipeline Started".center(80, "=")))
 
         # Step 1: Compress the novel text
-        print()
-        print("📋 Step 1: Compress the novel text".center(80, "-"))
+        event_bus.publish(StageStarted(stage="compress_novel", message="\n" + "📋 Step 1: Compress the novel text".center(80, "-")))
 
         working_dir_novel_compressor = os.path.join(self.working_dir, "novel")
         os.makedirs(working_dir_novel_compressor, exist_ok=True)
-        with open(os.path.join(working_dir_novel_compressor, "novel.txt"), "w", encoding="utf-8") as f:
-            f.write(novel_text)
-        print(f"🗂️ Working directory: {working_dir_novel_compressor}")
-
-        print("🔖 Splitting the novel into chunks...")
-        novel_chunks = self.novel_compressor.split(novel_text)
-        for idx, novel_chunk in enumerate(novel_chunks):
-            with open(os.path.join(working_dir_novel_compressor, f"novel_chunk_{idx}.txt"), "w", encoding="utf-8") as f:
-                f.write(novel_chunk)
-        print(f"🔖 Split the novel into {len(novel_chunks)} chunks, all saved to {working_dir_novel_compressor}.")
-
-
-        print()
-        print("🔖 Compressing the novel chunks...")
-        compressed_novel_chunks = [None] * len(novel_chunks)
-        index_chunk_pairs_unfinished = []
-        for index, novel_chunk in enumerate(novel_chunks):
-            path = os.path.join(working_dir_novel_compressor, f"novel_chunk_{index}_compressed.txt")
-            if os.path.exists(path):
-                compressed_novel_chunks[index] = open(path, "r", encoding="utf-8").read()
-                print(f"⏭️ Skipping compression for chunk {index} as it already exists.")
-            else:
-                index_chunk_pairs_unfinished.append((index, novel_chunk))
+        novel_copy_path = os.path.join(working_dir_novel_compressor, "novel.txt")
+        if novel_text is not None:
+            with atomic_open(novel_copy_path, "w", encoding="utf-8") as f:
+                f.write(novel_text)
+        elif os.path.abspath(novel_path) != os.path.abspath(novel_copy_path):
+            with atomic_path(novel_copy_path) as tmp_path:
+                shutil.copyfile(novel_path, tmp_path)
+        event_bus.publish(StageProgress(stage="compress_novel", message=f"🗂️ Working directory: {working_dir_novel_compressor}"))
+
+        # the knowledge base of step 3 is built in the same pass over the novel as the compression chunks
+        working_dir_knowledge_base = os.path.join(self.working_dir, "knowledge_base")
+        os.makedirs(working_dir_knowledge_base, exist_ok=True)
+        embeddings = CacheBackedEmbeddings.from_bytes_store(
+            underlying_embeddings=self.embeddings,
+            document_embedding_cache=LocalFileStore(
+                root_path=working_dir_knowledge_base,
+            ),
+            namespace=self.embeddings.model,
+            key_encoder="sha256",
+        )
+        novel_knowledge_base = NovelKnowledgeBase(
+            root_dir=working_dir_knowledge_base,
+            embeddings=embeddings,
+            chunk_size=512,
+            chunk_overlap=128,
+            embedding_model=self.embeddings.model,
+        )
+        novel_knowledge_base.start_build()
 
+        event_bus.publish(StageProgress(stage="compress_novel", message="🔖 Splitting the novel into chunks and compressing them as they are read..."))
+        novel_stream = NovelTextStream(novel_copy_path)
+        compressed_novel_chunks = []
+        pending_tasks = set()
+        knowledge_base_batch = []
         sem = asyncio.Semaphore(5)
-        tasks = [
-            self.novel_compressor.compress_single_novel_chunk(sem, index, novel_chunk)
-            for index, novel_chunk in index_chunk_pairs_unfinished
-        ]
-        task_outputs = await asyncio.gather(*tasks)
-        for index, novel_chunk_compressed in task_outputs:
+
+        def save_compressed_chunk(index, novel_chunk_compressed):
             save_path = os.path.join(working_dir_novel_compressor, f"novel_chunk_{index}_compressed.txt")
-            with open(save_path, "w", encoding="utf-8") as f:
+            with atomic_open(save_path, "w", encoding="utf-8") as f:
                 f.write(novel_chunk_compressed)
-            print(f"✅ Compressed chunk {index}, saved to {save_path}")
+            event_bus.publish(ArtifactReady(stage="compress_novel", path=save_path, message=f"✅ Compressed chunk {index}, saved to {save_path}"))
             compressed_novel_chunks[index] = novel_chunk_compressed
-        print("🔖 Compressed all novel chunks.")
 
+        async def drain_tasks(max_pending):
+            nonlocal pending_tasks
+            while len(pending_tasks) > max_pending:
+                done, pending_tasks = await asyncio.wait(pending_tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    save_compressed_chunk(*task.result())
+
+        for splitter_name, chunk in iter_shared_chunks(novel_stream, {
+            "compress": self.novel_compressor.splitter,
+            "knowledge_base": novel_knowledge_base.splitter,
+        }):
+            if splitter_name == "knowledge_base":
+                knowledge_base_batch.append(chunk)
+                if len(knowledge_base_batch) >= 256:
+                    # embedding runs in a thread while the compression calls are in flight
+                    await asyncio.to_thread(novel_knowledge_base.add_chunks, knowledge_base_batch)
+                    knowledge_base_batch = []
+                continue
+
+            index = len(compressed_novel_chunks)
+            compressed_novel_chunks.append(None)
+            with atomic_open(os.path.join(working_dir_novel_compressor, f"novel_chunk_{index}.txt"), "w", encoding="utf-8") as f:
+                f.write(chunk)
+            path = os.path.join(working_dir_novel_compressor, f"novel_chunk_{index}_compressed.txt")
+            if os.path.exists(path) and validate_artifact(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    compressed_novel_chunks[index] = f.read()
+                event_bus.publish(CacheHit(stage="compress_novel", message=f"⏭️ Skipping compression for chunk {index} as it already exists."))
+            else:
+                pending_tasks.add(asyncio.create_task(self.novel_compressor.compress_single_novel_chunk(sem, index, chunk)))
+                # bounds the uncompressed chunks held in memory
+                await drain_tasks(max_pending=10)
 
-        print()
-        print("🔖 Merging the compressed novel chunks...")
+        if knowledge_base_batch:
+            await asyncio.to_thread(novel_knowledge_base.add_chunks, knowledge_base_batch)
+        await drain_tasks(max_pending=0)
+        knowledge_base, knowledge_base_loaded = await asyncio.to_thread(novel_knowledge_base.finish_build, novel_stream.sha256, novel_stream.length)
+        event_bus.publish(StageProgress(stage="compress_novel", message=f"🔖 Split the novel into {len(compressed_novel_chunks)} chunks, all saved to {working_dir_novel_compressor}."))
+        event_bus.publish(StageProgress(stage="compress_novel", message="🔖 Compressed all novel chunks."))
+
+
+        event_bus.publish(StageProgress(stage="compress_novel", message="🔖 Merging the compressed novel chunks..."))
         path = os.path.join(working_dir_novel_compressor, "novel_compressed.txt")
-        if os.path.exists(path):
-            compressed_novel = open(path, "r", encoding="utf-8").read()
-            print(f"⏭️ Skipping merging as {path} already exists.")
+        if os.path.exists(path) and validate_artifact(path):
+            with open(path, "r", encoding="utf-8") as f:
+                compressed_novel = f.read()
+            event_bus.publish(CacheHit(stage="compress_novel", message=f"⏭️ Skipping merging as {path} already exists."))
         else:
-            compressed_novel = self.novel_compressor.aggregate(compressed_novel_chunks)
-            with open(path, "w", encoding="utf-8") as f:
+            # merged pairwise level by level; the levels are checkpointed, so a resumed merge skips the completed ones
+            compressed_novel = await self.novel_compressor.aggregate_tree(
+                compressed_novel_chunks,
+                fan_in=2,
+                checkpoint_dir=os.path.join(working_dir_novel_compressor, "aggregate"),
+            )
+            with atomic_open(path, "w", encoding="utf-8") as f:
                 f.write(compressed_novel)
-            print(f"✅ Merged the compressed novel chunks, saved to {path}")
-        print(f"🔖 Merging completed.")
+            event_bus.publish(ArtifactReady(stage="compress_novel", path=path, message=f"✅ Merged the compressed novel chunks, saved to {path}"))
+        event_bus.publish(StageProgress(stage="compress_novel", message=f"🔖 Merging completed."))
 
         # summary
-        print()
-        print("📌 Summary:")
-        print(f"📌 Before Compression: {len(novel_text)} characters")
-        print(f"📌 After Compression: {len(compressed_novel)} characters")
-        print(f"📌 Compression Ratio: {len(compressed_novel) / len(novel_text):.2%}")
+        event_bus.publish(StageProgress(stage="compress_novel", message="📌 Summary:"))
+        event_bus.publish(StageProgress(stage="compress_novel", message=f"📌 Before Compression: {novel_stream.length} characters"))
+        event_bus.publish(StageProgress(stage="compress_novel", message=f"📌 After Compression: {len(compressed_novel)} characters"))
+        event_bus.publish(StageProgress(stage="compress_novel", message=f"📌 Compression Ratio: {len(compressed_novel) / novel_stream.length:.2%}"))
 
-        print("📋 Step 1: Compress the novel text".center(80, "-"))
+        event_bus.publish(StageFinished(stage="compress_novel", message="📋 Step 1: Compress the novel text".center(80, "-")))
 
 
-        # Step 2: Extract events from the compressed novel
-        print()
-        print("📋 Step 2: Extract events from the compressed novel".center(80, "-"))
+        # Steps 2 to 5.1 run as a stream of events: every event is retrieved for (step 3), split into scenes
+        # (step 4) and has its characters merged across its scenes (step 5.1) as soon as it is extracted,
+        # while the next events are still being extracted. Only the novel-level merge (step 5.2) waits for all events.
+        event_bus.publish(StageStarted(stage="extract_events", message="\n" + "📋 Step 2: Extract events from the compressed novel".center(80, "-")))
         working_dir_event_extractor = os.path.join(self.working_dir, "events")
         os.makedirs(working_dir_event_extractor, exist_ok=True)
-        print(f"🗂️ Working directory: {working_dir_event_extractor}")
-
-        extracted_events = []
-        for event_json_fname in sorted(os.listdir(working_dir_event_extractor), key=lambda x: int(x.split('_')[1].split('.')[0])):
-            event_json_path = os.path.join(working_dir_event_extractor, event_json_fname)
-            if os.path.exists(event_json_path):
-                with open(event_json_path, "r", encoding="utf-8") as f:
-                    event_data = json.load(f)
-                event: Event = Event.model_validate(event_data)
-                extracted_events.append(event)
-
-        if len(extracted_events) > 0:
-            if extracted_events[-1].is_last:
-                print(f"⏭️ Skipping event extraction as all events already exist in {working_dir_event_extractor}.")
-            else:
-                print(f"🔖 Continuing event extraction from {len(extracted_events)} existing events...")
-        else:
-            print("🔖 Starting event extraction ...")
-
-        while len(extracted_events) == 0 or not extracted_events[-1].is_last:
-            next_event = self.event_extractor.extract_next_event(
-                novel_text=compressed_novel,
-                extracted_events=extracted_events,
-            )
-            event_json_path = os.path.join(working_dir_event_extractor, f"event_{len(extracted_events)}.json")
-            with open(event_json_path, "w", encoding="utf-8") as f:
-                json.dump(next_event.model_dump(), f, ensure_ascii=False, indent=4)
-            print(f"✅ Extracted event {next_event.index}, saved to {event_json_path}")
+        event_bus.publish(StageProgress(stage="extract_events", message=f"🗂️ Working directory: {working_dir_event_extractor}"))
 
-            extracted_events.append(next_event)
-
-        # summary
-        print()
-        print("📌 Summary:")
-        print(f"📌 Extracted a total of {len(extracted_events)} events.")
-
-        print("📋 Step 2: Extract events from the compressed novel".center(80, "-"))
-
-
-        # Step 3:  Extract relevant chunks for each event
-        print()
-        print("📋 Step 3: Retrieve relevant chunks for each event".center(80, "-"))
-        working_dir_knowledge_base = os.path.join(self.working_dir, "knowledge_base")
+        event_bus.publish(StageStarted(stage="retrieve_relevant_chunks", message="\n" + "📋 Step 3: Retrieve relevant chunks for each event".center(80, "-")))
         working_dir_retrieve = os.path.join(self.working_dir, "relevant_chunks")
-        os.makedirs(working_dir_knowledge_base, exist_ok=True)
         os.makedirs(working_dir_retrieve, exist_ok=True)
-        print(f"🗂️ Working directory: {working_dir_knowledge_base} and {working_dir_retrieve}")
+        event_bus.publish(StageProgress(stage="retrieve_relevant_chunks", message=f"🗂️ Working directory: {working_dir_knowledge_base} and {working_dir_retrieve}"))
 
-        print("🔖 Constructing knowledge base from the raw novel text...")
-        embeddings = CacheBackedEmbeddings.from_bytes_store(
-            underlying_embeddings=self.embeddings,
-            document_embedding_cache=LocalFileStore(
-                root_path=working_dir_knowledge_base,
-            ),
-            namespace=self.embeddings.model,
-            key_encoder="sha256",
-        )
-        novel_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=512,
-            chunk_overlap=128,
-        )
-        novel_chunks = novel_splitter.split_text(novel_text)
-        knowledge_base = FAISS.from_texts(texts=novel_chunks, embedding=embeddings)
-        print(f"🔖 Constructed knowledge base with {len(novel_chunks)} chunks, saved to {working_dir_knowledge_base}")
+        # the knowledge base was built from the raw novel text while it was read in step 1
+        if knowledge_base_loaded:
+            event_bus.publish(CacheHit(stage="retrieve_relevant_chunks", path=novel_knowledge_base.index_dir, message=f"⏭️ Loaded knowledge base with {len(novel_knowledge_base.chunks)} chunks from {novel_knowledge_base.index_dir}"))
+        else:
+            event_bus.publish(ArtifactReady(stage="retrieve_relevant_chunks", path=novel_knowledge_base.index_dir, message=f"🔖 Constructed knowledge base with {len(novel_knowledge_base.chunks)} chunks, saved to {novel_knowledge_base.index_dir}"))
 
+        # lexical rerankers weight terms by their rarity in the novel
+        if hasattr(self.rerank_model, "fit"):
+            self.rerank_model.fit(novel_knowledge_base.chunks)
+        # scores are persisted so that reruns skip the reranker, and process steps shared by several events are scored once
+        if hasattr(self.rerank_model, "enable_persistent_cache"):
+            self.rerank_model.enable_persistent_cache(os.path.join(working_dir_knowledge_base, "rerank_scores.db"))
 
-        print("🔖 Retrieving relevant chunks for each event...")
-        async def retrieve_relevant_chunks(sem, knowledge_base, event):
-            async with sem:
-                relevant_chunk_score_dict = {}
-                for process in event.process_chain:
-                    chunks = knowledge_base.similarity_search(process, k=10)
-                    chunks = [chunk.page_content for chunk in chunks if chunk.page_content not in relevant_chunk_score_dict]
-
-                    chunk_score_pairs = await self.rerank_model(
-                        documents=chunks,
-                        query=process,
-                        top_n=10,
-                    )
+        event_bus.publish(StageStarted(stage="extract_scenes", message="\n" + "📋 Step 4: Extract scenes for each event, design the script for each scene".center(80, "-")))
+        working_dir_scene_extractor = os.path.join(self.working_dir, "scenes")
+        os.makedirs(working_dir_scene_extractor, exist_ok=True)
+        event_bus.publish(StageProgress(stage="extract_scenes", message=f"🗂️ Working directory: {working_dir_scene_extractor}"))
 
-                    threshold = 0.7
-                    for chunk, score in chunk_score_pairs:
-                        if score >= threshold:
-                            if chunk not in relevant_chunk_score_dict:
-                                relevant_chunk_score_dict[chunk] = score
-                            else:
-                                relevant_chunk_score_dict[chunk] += score
+        event_bus.publish(StageStarted(stage="merge_characters", message="\n" + "📋 Step 5: Merge characters from scene-level to novel-level".center(80, "-")))
+        working_dir_global_information_planner = os.path.join(self.working_dir, "global_information")
+        working_dir_characters = os.path.join(working_dir_global_information_planner, "characters")
+        os.makedirs(os.path.join(working_dir_characters, "event_level"), exist_ok=True)
+        event_bus.publish(StageProgress(stage="merge_characters", message=f"🗂️ Working directory: {working_dir_global_information_planner}"))
 
-            return event.index, relevant_chunk_score_dict
 
-        event_idx_to_relevant_chunk_score_dict = {}
+        retrieve_sem = asyncio.Semaphore(10)
 
-        sem = asyncio.Semaphore(10)
-        tasks = []
-        for event in extracted_events:
+        async def retrieve_relevant_chunks_for_event(event: Event) -> Dict[str, float]:
             chunks_dir = os.path.join(working_dir_retrieve, f"event_{event.index}")
-            if os.path.exists(chunks_dir) and len(os.listdir(chunks_dir)) > 0:
+            # chunks.json lists the chunk files and is written after them, so a directory without it is incomplete
+            chunks_index_path = os.path.join(chunks_dir, "chunks.json")
+            if os.path.exists(chunks_index_path) and validate_artifact(chunks_index_path):
+                with open(chunks_index_path, "r", encoding="utf-8") as f:
+                    chunk_fnames = json.load(f)
                 relevant_chunk_score_dict = {}
-                for chunk_fname in os.listdir(chunks_dir):
+                for chunk_fname in chunk_fnames:
                     chunk_path = os.path.join(chunks_dir, chunk_fname)
                     score = float(chunk_fname.split('-score_')[1].split('.txt')[0])
                     with open(chunk_path, "r", encoding="utf-8") as f:
                         chunk = f.read()
                     relevant_chunk_score_dict[chunk] = score
-                event_idx_to_relevant_chunk_score_dict[event.index] = relevant_chunk_score_dict
-                print(f"⏭️ Skipping retrieval for event {event.index} as it already exists.")
-            else:
-                tasks.append(retrieve_relevant_chunks(sem, knowledge_base, event))
-
-        if len(tasks) > 0:
-            for task in asyncio.as_completed(tasks):
-                event_index, relevant_chunk_score_dict = await task
-                chunks_dir = os.path.join(working_dir_retrieve, f"event_{event_index}")
-                os.makedirs(chunks_dir, exist_ok=True)
-                for idx, (chunk, score) in enumerate(relevant_chunk_score_dict.items()):
-                    chunk_path = os.path.join(chunks_dir, f"chunk_{idx}-score_{score:.2f}.txt")
-                    with open(chunk_path, "w", encoding="utf-8") as f:
-                        f.write(chunk)
-                event_idx_to_relevant_chunk_score_dict[event_index] = relevant_chunk_score_dict
-                print(f"✅ Retrieved {len(relevant_chunk_score_dict)} relevant chunks for event {event_index}, saved to {chunks_dir}")
-
-        print("🔖 Retrieved relevant chunks for all events.")
-        print("📋 Step 3: Retrieve relevant chunks for each event".center(80, "-"))
-
-
-
-        # Step 4: Extract scenes for each event, design the script for each scene
-        print()
-        print("📋 Step 4: Extract scenes for each event, design the script for each scene".center(80, "-"))
-        working_dir_scene_extractor = os.path.join(self.working_dir, "scenes")
-        os.makedirs(working_dir_scene_extractor, exist_ok=True)
-        print(f"🗂️ Working directory: {working_dir_scene_extractor}")
-
-
-        unfinished_event_indices = []
-        event_idx_to_scenes = {event.index: [] for event in extracted_events}
-        for event in extracted_events:
+                event_bus.publish(CacheHit(stage="retrieve_relevant_chunks", message=f"⏭️ Skipping retrieval for event {event.index} as it already exists."))
+                return relevant_chunk_score_dict
+
+            async with retrieve_sem:
+                # the process steps of the event are embedded in one call and searched with one query matrix;
+                # identical steps are searched and reranked once
+                queries = list(dict.fromkeys(event.process_chain))
+                search_results = await asyncio.to_thread(novel_knowledge_base.batch_search, queries, 10)
+                query_to_chunks = {
+                    query: list(dict.fromkeys(chunks))
+                    for query, chunks in zip(queries, search_results)
+                }
+                if hasattr(self.rerank_model, "rerank_batch"):
+                    results = await self.rerank_model.rerank_batch(
+                        [(query, query_to_chunks[query]) for query in queries],
+                        top_n=10,
+                    )
+                else:
+                    results = await asyncio.gather(*[
+                        self.rerank_model(documents=query_to_chunks[query], query=query, top_n=10)
+                        for query in queries
+                    ])
+                query_to_chunk_score_pairs = dict(zip(queries, results))
+
+            # the scale of the scores depends on the reranker backend
+            threshold = getattr(self.rerank_model, "relevance_threshold", 0.7)
+            relevant_chunk_score_dict = {}
+            for process in event.process_chain:
+                for chunk, score in query_to_chunk_score_pairs[process]:
+                    if score >= threshold and chunk not in relevant_chunk_score_dict:
+                        relevant_chunk_score_dict[chunk] = score
+
+            os.makedirs(chunks_dir, exist_ok=True)
+            chunk_fnames = []
+            for idx, (chunk, score) in enumerate(relevant_chunk_score_dict.items()):
+                chunk_fname = f"chunk_{idx}-score_{score:.2f}.txt"
+                with atomic_open(os.path.join(chunks_dir, chunk_fname), "w", encoding="utf-8") as f:
+                    f.write(chunk)
+                chunk_fnames.append(chunk_fname)
+            with atomic_open(chunks_index_path, "w", encoding="utf-8") as f:
+                json.dump(chunk_fnames, f, ensure_ascii=False, indent=4)
+            event_bus.publish(ArtifactReady(stage="retrieve_relevant_chunks", path=chunks_dir, message=f"✅ Retrieved {len(relevant_chunk_score_dict)} relevant chunks for event {event.index}, saved to {chunks_dir}"))
+            return relevant_chunk_score_dict
+
+
+        scene_sem = asyncio.Semaphore(8)
+
+        async def extract_scenes_for_event(event: Event, relevant_chunks: List[str]) -> List[Scene]:
             scenes_dir = os.path.join(working_dir_scene_extractor, f"event_{event.index}")
-            if os.path.exists(scenes_dir):
-                for scene_json_fname in sorted(os.listdir(scenes_dir), key=lambda x: int(x.split('_')[1].split('.')[0])):
-                    scene_json_path = os.path.join(scenes_dir, scene_json_fname)
-                    with open(scene_json_path, "r", encoding="utf-8") as f:
-                        scene_data = json.load(f)
-                    scene = Scene.model_validate(scene_data)
-                    event_idx_to_scenes[event.index].append(scene)
-
-            if len(event_idx_to_scenes[event.index]) > 0 and event_idx_to_scenes[event.index][-1].is_last:
-                print(f"⏭️ Skipping scene extraction for event {event.index} as all scenes already exist in {scenes_dir}.")
-            else:
-                unfinished_event_indices.append(event.index)
-
-        if len(unfinished_event_indices) > 0:
-            if len(unfinished_event_indices) == len(extracted_events):
-                print(f"🔖 Starting scene extraction for all events...")
-            else:
-                print(f"🔖 Continuing scene extraction for events: {unfinished_event_indices}")
-
-
-        async def extract_scenes_for_event(sem, relevant_chunks, event, previous_scenes):
-            async with sem:
-                os.makedirs(os.path.join(working_dir_scene_extractor, f"event_{event.index}"), exist_ok=True)
-
-                while len(previous_scenes) == 0 or not previous_scenes[-1].is_last:
-                    next_scene = await self.scene_extractor.get_next_scene(
+            os.makedirs(scenes_dir, exist_ok=True)
+
+            previous_scenes = []
+            scene_json_fnames = [fname for fname in os.listdir(scenes_dir) if not is_temp_path(fname)]
+            for scene_json_fname in sorted(scene_json_fnames, key=lambda x: int(x.split('_')[1].split('.')[0])):
+                with open(os.path.join(scenes_dir, scene_json_fname), "r", encoding="utf-8") as f:
+                    previous_scenes.append(Scene.model_validate(json.load(f)))
+
+            if len(previous_scenes) > 0 and previous_scenes[-1].is_last:
+                event_bus.publish(CacheHit(stage="extract_scenes", message=f"⏭️ Skipping scene extraction for event {event.index} as all scenes already exist in {scenes_dir}."))
+                return previous_scenes
+            if len(previous_scenes) > 0:
+                event_bus.publish(StageProgress(stage="extract_scenes", message=f"🔖 Continuing scene extraction for event {event.index} from {len(previous_scenes)} existing scenes..."))
+
+            while len(previous_scenes) == 0 or not previous_scenes[-1].is_last:
+                # the slot is held per call rather than per event, so the events take turns
+                async with scene_sem:
+                    next_scenes = await self.scene_extractor.get_next_scenes(
                         relevant_chunks=relevant_chunks,
                         event=event,
                         previous_scenes=previous_scenes,
+                        max_scenes=3,
+                        max_previous_scenes_in_full=2,
                     )
-                    scene_json_path = os.path.join(working_dir_scene_extractor, f"event_{event.index}", f"scene_{len(previous_scenes)}.json")
-                    with open(scene_json_path, "w", encoding="utf-8") as f:
+                # the scene marked is_last is written after the others, so a rerun that finds it has them all
+                for next_scene in sorted(next_scenes, key=lambda scene: scene.is_last):
+                    scene_json_path = os.path.join(scenes_dir, f"scene_{next_scene.idx}.json")
+                    with atomic_open(scene_json_path, "w", encoding="utf-8") as f:
                         json.dump(next_scene.model_dump(), f, ensure_ascii=False, indent=4)
-                    print(f"✔️​ Extracted scene {next_scene.idx} for event {event.index}, saved to {scene_json_path}")
+                    event_bus.publish(ArtifactReady(stage="extract_scenes", path=scene_json_path, message=f"✔️​ Extracted scene {next_scene.idx} for event {event.index}, saved to {scene_json_path}"))
                     previous_scenes.append(next_scene)
 
-            print(f"✅ Extracted all {len(previous_scenes)} scenes for event {event.index}.")
-            return event.index, previous_scenes
-
+            event_bus.publish(StageProgress(stage="extract_scenes", message=f"✅ Extracted all {len(previous_scenes)} scenes for event {event.index}."))
+            return previous_scenes
 
-        sem = asyncio.Semaphore(8)
-        for event_index in unfinished_event_indices:
-            relevant_chunks = list(event_idx_to_relevant_chunk_score_dict[event_index].keys())
-            tasks.append(extract_scenes_for_event(sem, relevant_chunks, extracted_events[event_index], event_idx_to_scenes[event_index]))
 
-        task_outputs = await asyncio.gather(*tasks)
-        for event_index, previous_scenes in task_outputs:
-            event_idx_to_scenes[event_index] = previous_scenes
+        merge_sem = asyncio.Semaphore(8)
 
-        print("🔖 Extracted scenes for all events.")
-        print("📋 Step 4: Extract scenes for each event, design the script for each scene".center(80, "-"))
+        async def merge_characters_across_scenes_in_event(event: Event, scenes: List[Scene]) -> List[CharacterInEvent]:
+            path = os.path.join(working_dir_characters, "event_level", f"event_{event.index}_characters.json")
+            if os.path.exists(path) and validate_artifact(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    character_data = json.load(f)
+                event_bus.publish(CacheHit(stage="merge_characters", message=f"⏭️ Skipping character merging for event {event.index} as it already exists."))
+                return [CharacterInEvent.model_validate(char) for char in character_data]
 
+            async with merge_sem:
+                merged_characters = await self.global_information_planner.merge_characters_across_scenes_in_event(
+                    event_idx=event.index,
+                    scenes=scenes,
+                )
+            with atomic_open(path, "w", encoding="utf-8") as f:
+                json.dump([char.model_dump() for char in merged_characters], f, ensure_ascii=False, indent=4)
+            event_bus.publish(ArtifactReady(stage="merge_characters", path=path, message=f"✅ Merged characters for event {event.index}, saved to {path}"))
+            return merged_characters
 
 
-        # Step 5: Merge characters from scene-level to event-level, then to novel-level
-        print()
-        print("📋 Step 5: Merge characters from scene-level to novel-level".center(80, "-"))
-        working_dir_global_information_planner = os.path.join(self.working_dir, "global_information")
-        os.makedirs(working_dir_global_information_planner, exist_ok=True)
-        print(f"🗂️ Working directory: {working_dir_global_information_planner}")
+        async def process_event(event: Event):
+            relevant_chunk_score_dict = await retrieve_relevant_chunks_for_event(event)
+            scenes = await extract_scenes_for_event(event, list(relevant_chunk_score_dict.keys()))
+            characters_in_event = await merge_characters_across_scenes_in_event(event, scenes)
+            return event.index, scenes, characters_in_event
 
-        # Step 5.1: Merge characters from scene-level to event-level
-        print("🔖 Merging characters across scenes in each event...")
-        working_dir_characters = os.path.join(working_dir_global_information_planner, "characters")
-        os.makedirs(working_dir_characters, exist_ok=True)
+        event_tasks = []
 
-        async def merge_characters_across_scenes_in_event(sem, event_idx, scenes):
-            async with sem:
-                merged_characters = await self.global_information_planner.merge_characters_across_scenes_in_event(
-                    event_idx=event_idx,
-                    scenes=scenes,
-                )
-                path = os.path.join(working_dir_characters, "event_level", f"event_{event_idx}_characters.json")
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump([char.model_dump() for char in merged_characters], f, ensure_ascii=False, indent=4)
-                print(f"✅ Merged characters for event {event_idx}, saved to {path}")
+        def start_event(event: Event):
+            event_tasks.append(asyncio.create_task(process_event(event)))
 
-            return event_idx, merged_characters
 
+        extracted_events = []
+        event_json_fnames = [fname for fname in os.listdir(working_dir_event_extractor) if not is_temp_path(fname)]
+        for event_json_fname in sorted(event_json_fnames, key=lambda x: int(x.split('_')[1].split('.')[0])):
+            event_json_path = os.path.join(working_dir_event_extractor, event_json_fname)
+            if os.path.exists(event_json_path) and validate_artifact(event_json_path):
+                with open(event_json_path, "r", encoding="utf-8") as f:
+                    event_data = json.load(f)
+                event: Event = Event.model_validate(event_data)
+                extracted_events.append(event)
 
-        event_idx_to_characters_in_event = {}
+        if len(extracted_events) > 0:
+            if extracted_events[-1].is_last:
+                event_bus.publish(CacheHit(stage="extract_events", message=f"⏭️ Skipping event extraction as all events already exist in {working_dir_event_extractor}."))
+            else:
+                event_bus.publish(StageProgress(stage="extract_events", message=f"🔖 Continuing event extraction from {len(extracted_events)} existing events..."))
+        else:
+            event_bus.publish(StageProgress(stage="extract_events", message="🔖 Starting event extraction ..."))
+
+        windows = self.event_extractor.split_windows(compressed_novel)
+        if len(windows) > 1 and (len(extracted_events) == 0 or not extracted_events[-1].is_last):
+            # windowed extraction: the events of every window are extracted concurrently and saved per window,
+            # so an interrupted run resumes each window after its last saved event. The events are only final
+            # after the boundaries are reconciled, so they enter the stream then.
+            working_dir_windows = os.path.join(self.working_dir, "event_windows")
+            event_bus.publish(StageProgress(stage="extract_events", message=f"🔖 Extracting events from {len(windows)} overlapping windows of the compressed novel..."))
+
+            window_events = []
+            for window_idx in range(len(windows)):
+                window_dir = os.path.join(working_dir_windows, f"window_{window_idx}")
+                os.makedirs(window_dir, exist_ok=True)
+                events = []
+                while os.path.exists(os.path.join(window_dir, f"event_{len(events)}.json")) and validate_artifact(os.path.join(window_dir, f"event_{len(events)}.json")):
+                    with open(os.path.join(window_dir, f"event_{len(events)}.json"), "r", encoding="utf-8") as f:
+                        events.append(Event.model_validate(json.load(f)))
+                window_events.append(events)
+
+            def save_window_event(window_idx, event):
+                event_json_path = os.path.join(working_dir_windows, f"window_{window_idx}", f"event_{event.index}.json")
+                with atomic_open(event_json_path, "w", encoding="utf-8") as f:
+                    json.dump(event.model_dump(), f, ensure_ascii=False, indent=4)
+                event_bus.publish(ArtifactReady(stage="extract_events", path=event_json_path, message=f"✅ Extracted event {event.index} of window {window_idx}, saved to {event_json_path}"))
+
+            sem = asyncio.Semaphore(self.event_extractor.max_concurrent_windows)
+            task_outputs = await asyncio.gather(*[
+                self.event_extractor.extract_events_in_window(sem, window_idx, windows, window_events[window_idx], on_event=save_window_event)
+                for window_idx in range(len(windows))
+            ])
+            window_events = [events for _, events in sorted(task_outputs, key=lambda pair: pair[0])]
+
+            event_bus.publish(StageProgress(stage="extract_events", message="🔖 Reconciling the events at the window boundaries..."))
+            extracted_events = await self.event_extractor.reconcile_windows(window_events)
+
+            # the last event (is_last) is written last, so an interrupted write is redone on resume
+            for event in extracted_events:
+                event_json_path = os.path.join(working_dir_event_extractor, f"event_{event.index}.json")
+                with atomic_open(event_json_path, "w", encoding="utf-8") as f:
+                    json.dump(event.model_dump(), f, ensure_ascii=False, indent=4)
+                event_bus.publish(ArtifactReady(stage="extract_events", path=event_json_path, message=f"✅ Extracted event {event.index}, saved to {event_json_path}"))
+            for event_json_fname in os.listdir(working_dir_event_extractor):
+                if is_temp_path(event_json_fname):
+                    continue
+                if int(event_json_fname.split('_')[1].split('.')[0]) >= len(extracted_events):
+                    os.remove(os.path.join(working_dir_event_extractor, event_json_fname))
 
-        sem = asyncio.Semaphore(8)
-        tasks = []
         for event in extracted_events:
-            path = os.path.join(working_dir_characters, "event_level", f"event_{event.index}_characters.json")
-            if os.path.exists(path):
-                with open(path, "r", encoding="utf-8") as f:
-                    character_data = json.load(f)
-                characters = [CharacterInEvent.model_validate(char) for char in character_data]
-                event_idx_to_characters_in_event[event.index] = characters
-                print(f"⏭️ Skipping character merging for event {event.index} as it already exists.")
-            else:
-                tasks.append(merge_characters_across_scenes_in_event(sem, event.index, event_idx_to_scenes[event.index]))
+            start_event(event)
+
+        while len(extracted_events) == 0 or not extracted_events[-1].is_last:
+            next_event = await self.event_extractor.aextract_next_event(
+                novel_text=compressed_novel,
+                extracted_events=extracted_events,
+            )
+            event_json_path = os.path.join(working_dir_event_extractor, f"event_{len(extracted_events)}.json")
+            with atomic_open(event_json_path, "w", encoding="utf-8") as f:
+                json.dump(next_event.model_dump(), f, ensure_ascii=False, indent=4)
+            event_bus.publish(ArtifactReady(stage="extract_events", path=event_json_path, message=f"✅ Extracted event {next_event.index}, saved to {event_json_path}"))
+
+            extracted_events.append(next_event)
+            start_event(next_event)
+
+        # summary
+        event_bus.publish(StageProgress(stage="extract_events", message="📌 Summary:"))
+        event_bus.publish(StageProgress(stage="extract_events", message=f"📌 Extracted a total of {len(extracted_events)} events."))
+
+        event_bus.publish(StageFinished(stage="extract_events", message="📋 Step 2: Extract events from the compressed novel".center(80, "-")))
 
-        task_outputs = await asyncio.gather(*tasks)
-        for event_index, merged_characters in task_outputs:
-            event_idx_to_characters_in_event[event_index] = merged_characters
 
-        print("🔖 Merged characters across scenes in each event.")
+        event_idx_to_scenes = {}
+        event_idx_to_characters_in_event = {}
+        for event_index, scenes, characters_in_event in await asyncio.gather(*event_tasks):
+            event_idx_to_scenes[event_index] = scenes
+            event_idx_to_characters_in_event[event_index] = characters_in_event
+
+        event_bus.publish(StageProgress(stage="retrieve_relevant_chunks", message="🔖 Retrieved relevant chunks for all events."))
+        event_bus.publish(StageFinished(stage="retrieve_relevant_chunks", message="📋 Step 3: Retrieve relevant chunks for each event".center(80, "-")))
+        event_bus.publish(StageProgress(stage="extract_scenes", message="🔖 Extracted scenes for all events."))
+        event_bus.publish(StageFinished(stage="extract_scenes", message="📋 Step 4: Extract scenes for each event, design the script for each scene".center(80, "-")))
+        event_bus.publish(StageProgress(stage="merge_characters", message="🔖 Merged characters across scenes in each event."))
+
 
         # Step 5.2: Merge characters from event-level to novel-level
-        print("🔖 Merging characters across events in the novel...")
+        event_bus.publish(StageProgress(stage="merge_characters", message="🔖 Merging characters across events in the novel..."))
 
         working_dir_characters_novel = os.path.join(working_dir_characters, f"novel_level")
         os.makedirs(working_dir_characters_novel, exist_ok=True)
 
-        fnames = os.listdir(working_dir_characters_novel)
-        existing_characters_in_novel = []
-        if len(fnames) > 0:
-            fname = max(fnames, key=lambda x: int(x.split('_')[-1].split('.json')[0]))
-            start_event_idx = int(fname.split('_')[-1].split('.json')[0]) + 1
-            path = os.path.join(working_dir_characters_novel, fname)
+        # the final characters are saved under the name of the last event, as by the former event-by-event merge
+        path = os.path.join(working_dir_characters_novel, f"novel_characters_after_event_{extracted_events[-1].index}.json")
+        if os.path.exists(path) and validate_artifact(path):
             with open(path, "r", encoding="utf-8") as f:
                 character_data = json.load(f)
             existing_characters_in_novel = [CharacterInNovel.model_validate(char) for char in character_data]
-            
-            if start_event_idx == len(extracted_events):
-                print(f"⏭️ Skipping merging as all events already merged to novel-level in {working_dir_characters_novel}.")
-            else:
-                print(f"🔖 Continuing merging from event {start_event_idx}, currently {len(existing_characters_in_novel)} characters in novel.")
-
+            event_bus.publish(CacheHit(stage="merge_characters", message=f"⏭️ Skipping merging as all events already merged to novel-level in {working_dir_characters_novel}."))
         else:
-            existing_characters_in_novel = []
-            start_event_idx = 0
-
-        for event in extracted_events[start_event_idx:]:
-            characters_in_event = event_idx_to_characters_in_event[event.index]
-            path = os.path.join(working_dir_characters_novel, f"novel_characters_after_event_{event.index}.json")
-            existing_characters_in_novel = self.global_information_planner.merge_characters_to_existing_characters_in_novel(
-                event_idx=event.index,
-                existing_characters_in_novel=existing_characters_in_novel,
-                characters_in_event=characters_in_event,
+            # events are merged pairwise, level by level and concurrently within a level; the levels are
+            # checkpointed, so a resumed merge skips the completed ones
+            existing_characters_in_novel = await self.global_information_planner.merge_characters_in_novel_tree(
+                {event.index: event_idx_to_characters_in_event[event.index] for event in extracted_events},
+                fan_in=2,
+                checkpoint_dir=os.path.join(working_dir_characters, "novel_level_tree"),
             )
-            with open(path, "w", encoding="utf-8") as f:
+            with atomic_open(path, "w", encoding="utf-8") as f:
                 json.dump([char.model_dump() for char in existing_characters_in_novel], f, ensure_ascii=False, indent=4)
-            print(f"✅ Merged characters from event {event.index} to novel-level, now {len(existing_characters_in_novel)} characters in novel, saved to {path}")
+            event_bus.publish(ArtifactReady(stage="merge_characters", path=path, message=f"✅ Merged characters from all {len(extracted_events)} events to novel-level, {len(existing_characters_in_novel)} characters in novel, saved to {path}"))
 
-        print("🔖 Merged characters across events in the novel.")
+        event_bus.publish(StageProgress(stage="merge_characters", message="🔖 Merged characters across events in the novel."))
 
         characters_in_novel = existing_characters_in_novel
 
-        print("📋 Step 5: Merge characters from scene-level to novel-level".center(80, "-"))
+        # novel, event and scene characters indexed by identifier, for the lookups of steps 6 and 7
+        character_registry = CharacterRegistry.build(
+            characters_in_novel=characters_in_novel,
+            event_idx_to_characters_in_event=event_idx_to_characters_in_event,
+            event_idx_to_scenes=event_idx_to_scenes,
+        )
+        run_manifest = RunManifest(self.working_dir)
+        run_manifest.put_output("character_registry", stage="merge_characters", data=character_registry.model_dump(mode="json"))
+
+        event_bus.publish(StageFinished(stage="merge_characters", message="📋 Step 5: Merge characters from scene-level to novel-level".center(80, "-")))
 
 
 
 
-        # Step 6: Generate the portrait for all characters in the novel
-        print()
-        print("📋 Step 6: Generate the reference images for all characters in the specific scene")
+        # Steps 6 and 7 run as a stream of scenes: the video of a scene is generated as soon as the portraits
+        # of its characters are, while the portraits of the later scenes are still being generated
+        event_bus.publish(StageStarted(stage="generate_character_portraits", message="\n" + "📋 Step 6: Generate the reference images for all characters in the specific scene"))
 
         working_dir_character_portrait = os.path.join(self.working_dir, "character_portraits")
         os.makedirs(working_dir_character_portrait, exist_ok=True)
-        print(f"🗂️ Working directory: {working_dir_character_portrait}")
+        event_bus.publish(StageProgress(stage="generate_character_portraits", message=f"🗂️ Working directory: {working_dir_character_portrait}"))
 
-        print("🔖 Generating character portraits based on static features ...")
         base_character_portrait_dir = os.path.join(working_dir_character_portrait, "base")
         os.makedirs(base_character_portrait_dir, exist_ok=True)
 
+        event_bus.publish(StageStarted(stage="generate_scene_videos", message="\n" + "📋 Step 7: Generate the video for each scene".center(80, "-")))
+        working_dir_scene_videos = os.path.join(self.working_dir, "videos")
+        os.makedirs(working_dir_scene_videos, exist_ok=True)
+
+        def base_portrait_path(character: CharacterInNovel) -> str:
+            return os.path.join(base_character_portrait_dir, f"character_{character.index}_{character.identifier_in_novel}.png")
+
         async def generate_portrait_for_character(sem, character: CharacterInNovel):
             async with sem:
-                image_path = os.path.join(base_character_portrait_dir, f"character_{character.index}_{character.identifier_in_novel}.png")
-                
-                if os.path.exists(image_path):
-                    print(f"⏭️ Skipping portrait generation for character {character.index} as it already exists.")
+                image_path = base_portrait_path(character)
+
+                if os.path.exists(image_path) and validate_artifact(image_path):
+                    event_bus.publish(CacheHit(stage="generate_character_portraits", path=image_path, message=f"⏭️ Skipping portrait generation for character {character.index} as it already exists."))
                     return
 
                 prompt = f"Generate a full-body, front-view portrait based on the following description, in the style of {style}:"
@@ -416,21 +547,53 @@ class Novel2MoviePipeline(BasePipeline):
                     prompt=prompt,
                     size="512x512",
                 )
-                image.save(image_path)
-                print(f"✅ Generated portrait for character {character.index} ({character.identifier_in_novel}), saved to {image_path}")
+                with atomic_path(image_path) as tmp_path:
+                    image.save(tmp_path)
+                event_bus.publish(ArtifactReady(stage="generate_character_portraits", path=image_path, message=f"✅ Generated portrait for character {character.index} ({character.identifier_in_novel}), saved to {image_path}"))
 
 
-        sem = asyncio.Semaphore(5)
-        tasks = [
-            generate_portrait_for_character(sem, character)
-            for character in characters_in_novel
-        ]
+        def scene_portrait_path(event_idx: int, scene_idx: int, character: CharacterInScene) -> str:
+            return os.path.join(
+                working_dir_character_portrait,
+                f"event_{event_idx}",
+                f"scene_{scene_idx}",
+                f"character_{character.idx}_{character.identifier_in_scene}.png",
+            )
 
-        await asyncio.gather(*tasks)
-        print("🔖 Generated character portraits based on static features.")
+        # portraits from dynamic features are stored once per (base portrait, normalized dynamic features, style)
+        # and hardlinked into every scene that requests them, so identical requests are generated only once
+        dynamic_character_portrait_dir = os.path.join(working_dir_character_portrait, "dynamic")
+        os.makedirs(dynamic_character_portrait_dir, exist_ok=True)
+        dynamic_portrait_tasks: Dict[str, asyncio.Task] = {}
+        base_portrait_digests: Dict[str, str] = {}
 
+        async def generate_dynamic_portrait(
+            sem,
+            key: str,
+            base_character_image_path: str,
+            character: CharacterInScene,
+        ) -> str:
+            image_path = os.path.join(dynamic_character_portrait_dir, f"{key}.png")
+            if os.path.exists(image_path) and validate_artifact(image_path):
+                return image_path
+
+            async with sem:
+                prompt = f"Generate a full-body, front-view portrait based on the provided base image. Modify the base image according to the following dynamic features, in the style of {style}. Keep the character's identity consistent with the base image:"
+                prompt += f"\nCharacter Identifier: {character.identifier_in_scene}"
+                prompt += f"\nDynamic Features: {character.dynamic_features}"
+                prompt += f"\nThe character should be centered in the image, occupying most of the frame. Gazing straight ahead. Standing with arms relaxed at sides. Natural expression. The background should be plain white."
+
+                prompt = await self.rewriter(prompt)
 
-        print("🔖 Generating character portraits based on dynamic features in the specific scene")
+
+                image = await self.image_generator.generate_single_image(
+                    prompt=prompt,
+                    reference_image_paths=[base_character_image_path],
+                    size="512x512",
+                )
+                with atomic_path(image_path) as tmp_path:
+                    image.save(tmp_path)
+            return image_path
 
         async def generate_portrait_for_character_in_scene(
             sem,
@@ -439,103 +602,187 @@ class Novel2MoviePipeline(BasePipeline):
             event_idx: int,
             scene_idx: int,
         ):
-            async with sem:
-                image_path = os.path.join(
-                    working_dir_character_portrait,
-                    f"event_{event_idx}",
-                    f"scene_{scene_idx}",
-                    f"character_{character.index}_{character.identifier_in_scene}.png",
-                )
-                os.makedirs(os.path.dirname(image_path), exist_ok=True)
+            image_path = scene_portrait_path(event_idx, scene_idx, character)
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
+
+            if os.path.exists(image_path) and validate_artifact(image_path):
+                event_bus.publish(CacheHit(stage="generate_character_portraits", path=image_path, message=f"⏭️ Skipping portrait generation for event {event_idx}, scene {scene_idx}, character {character.idx} as it already exists."))
+                return
+
+            if not character.is_visible:
+                link_artifact(base_character_image_path, image_path)
+                event_bus.publish(CacheHit(stage="generate_character_portraits", path=image_path, message=f"⏭️ For event {event_idx}, scene {scene_idx}, character {character.idx} ({character.identifier_in_scene}) is not visible, linked base portrait to {image_path}"))
+                return
+
+            key = None
+            if character.dynamic_features is not None:
+                if base_character_image_path not in base_portrait_digests:
+                    base_portrait_digests[base_character_image_path] = await asyncio.to_thread(_file_digest, base_character_image_path)
+                key = _portrait_request_key(base_portrait_digests[base_character_image_path], character.dynamic_features, style)
+
+            if key is None:
+                link_artifact(base_character_image_path, image_path)
+                event_bus.publish(CacheHit(stage="generate_character_portraits", path=image_path, message=f"⏭️ For event {event_idx}, scene {scene_idx}, character {character.idx} ({character.identifier_in_scene}) has no dynamic features, linked base portrait to {image_path}"))
+                return
+
+            if key in dynamic_portrait_tasks:
+                shared = True
+            else:
+                shared = os.path.exists(os.path.join(dynamic_character_portrait_dir, f"{key}.png"))
+                dynamic_portrait_tasks[key] = asyncio.create_task(generate_dynamic_portrait(sem, key, base_character_image_path, character))
+            dynamic_image_path = await dynamic_portrait_tasks[key]
+            link_artifact(dynamic_image_path, image_path)
+            if shared:
+                event_bus.publish(CacheHit(stage="generate_character_portraits", path=image_path, message=f"⏭️ For event {event_idx}, scene {scene_idx}, reused the portrait of character {character.idx} ({character.identifier_in_scene}) with the same dynamic features, linked to {image_path}"))
+            else:
+                event_bus.publish(ArtifactReady(stage="generate_character_portraits", path=image_path, message=f"✅ For event {event_idx}, scene {scene_idx}, generated portrait for character {character.idx} ({character.identifier_in_scene}), saved to {image_path}"))
 
-                if os.path.exists(image_path):
-                    print(f"⏭️ Skipping portrait generation for event {event_idx}, scene {scene_idx}, character {character.index} as it already exists.")
-                    return
 
-                if not character.is_visible:
-                    shutil.copy(base_character_image_path, image_path)
-                    print(f"⏭️ For event {event_idx}, scene {scene_idx}, character {character.index} ({character.identifier_in_scene}) is not visible, copied base portrait to {image_path}")
-                    return
+        async def generate_fallback_portrait_for_character_in_scene(
+            sem,
+            character: CharacterInScene,
+            event_idx: int,
+            scene_idx: int,
+        ):
+            # a scene character whose link to a novel character was dropped has no base portrait, so its portrait
+            # is generated from its own features; Script2VideoPipeline needs one for every character of the scene
+            image_path = scene_portrait_path(event_idx, scene_idx, character)
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
 
-                if character.dynamic_features is None:
-                    shutil.copy(base_character_image_path, image_path)
-                    print(f"⏭️ For event {event_idx}, scene {scene_idx}, character {character.index} ({character.identifier_in_scene}) has no dynamic features, copied base portrait to {image_path}")
-                    return
+            if os.path.exists(image_path) and validate_artifact(image_path):
+                event_bus.publish(CacheHit(stage="generate_character_portraits", path=image_path, message=f"⏭️ Skipping portrait generation for event {event_idx}, scene {scene_idx}, character {character.idx} as it already exists."))
+                return
 
-                prompt = f"Generate a full-body, front-view portrait based on the provided base image. Modify the base image according to the following dynamic features, in the style of {style}. Keep the character's identity consistent with the base image:"
+            async with sem:
+                prompt = f"Generate a full-body, front-view portrait based on the following description, in the style of {style}:"
                 prompt += f"\nCharacter Identifier: {character.identifier_in_scene}"
-                prompt += f"\nDynamic Features: {character.dynamic_features}"
+                prompt += f"\nFeatures: {character.static_features}"
+                if character.dynamic_features:
+                    prompt += f"\nDynamic Features: {character.dynamic_features}"
                 prompt += f"\nThe character should be centered in the image, occupying most of the frame. Gazing straight ahead. Standing with arms relaxed at sides. Natural expression. The background should be plain white."
 
-                prompt = await self.rewriter(prompt)
-
-
                 image = await self.image_generator.generate_single_image(
                     prompt=prompt,
-                    reference_image_paths=[base_character_image_path],
                     size="512x512",
                 )
-                image.save(image_path)
-                print(f"✅ For event {event_idx}, scene {scene_idx}, generated portrait for character {character.index} ({character.identifier_in_scene}), saved to {image_path}")
-
-
-        sem = asyncio.Semaphore(3)
-        tasks = []
+                with atomic_path(image_path) as tmp_path:
+                    image.save(tmp_path)
+            event_bus.publish(ArtifactReady(stage="generate_character_portraits", path=image_path, message=f"✅ For event {event_idx}, scene {scene_idx}, character {character.idx} ({character.identifier_in_scene}) has no novel character, generated a portrait from its own features, saved to {image_path}"))
+
+
+        # every scene runs in its own pipeline context (working_dir, run manifest, event bus) sharing the
+        # models of self.script2video_pipeline; scenes are started in story order, at most
+        # max_concurrent_scenes at a time, so the movie can be assembled from the front while the rest render
+        ordered_scenes = [
+            (event.index, scene)
+            for event in extracted_events
+            for scene in event_idx_to_scenes[event.index]
+        ]
+        scene_video_paths: List[Optional[str]] = [None] * len(ordered_scenes)
+        movie_manifest_path = os.path.join(working_dir_scene_videos, "scene_videos.json")
+        num_ready_in_order = 0
+
+        def update_movie_manifest():
+            nonlocal num_ready_in_order
+            previous = num_ready_in_order
+            while num_ready_in_order < len(ordered_scenes) and scene_video_paths[num_ready_in_order] is not None:
+                num_ready_in_order += 1
+            if num_ready_in_order == previous:
+                return
+            with atomic_open(movie_manifest_path, "w", encoding="utf-8") as f:
+                json.dump([
+                    {"event_idx": event_idx, "scene_idx": scene.idx, "path": scene_video_paths[position]}
+                    for position, (event_idx, scene) in enumerate(ordered_scenes[:num_ready_in_order])
+                ], f, ensure_ascii=False, indent=4)
+            event_bus.publish(ArtifactReady(stage="generate_scene_videos", path=movie_manifest_path, message=f"🎞️ The first {num_ready_in_order} of {len(ordered_scenes)} scenes are ready in order, listed in {movie_manifest_path}"))
+
+        # the novel characters appearing in every scene, with their scene-level counterparts
+        scene_appearances: Dict[Tuple[int, int], List[Tuple[CharacterInNovel, CharacterInScene]]] = {}
         for character in characters_in_novel:
-            character_base_image_path = os.path.join(base_character_portrait_dir, f"character_{character.index}_{character.identifier_in_novel}.png")
-            for event_idx, identifier_in_event in character.active_events.items():
-                characters_in_event: List[CharacterInEvent] = event_idx_to_characters_in_event[event_idx]
-                character_in_event = [char for char in characters_in_event if char.identifier_in_event == identifier_in_event][0]  # TODO: 这里的数据结构没有做好，居然还要遍历查找。。。
-                for scene_idx, identifier_in_scene in character_in_event.active_scenes.items():
-                    scene = event_idx_to_scenes[event_idx][scene_idx]
-                    character_in_scene: CharacterInScene = [char for char in scene.characters if char.identifier_in_scene == identifier_in_scene][0]  # TODO: 这里的数据结构也没有做好
-                    tasks.append(
-                        generate_portrait_for_character_in_scene(
-                            sem,
-                            character_base_image_path,
-                            character_in_scene,
-                            event_idx,
-                            scene_idx,
-                        )
-                    )
-        await asyncio.gather(*tasks)
-        print("🔖 Generated character portraits based on dynamic features in the specific scene")
+            for event_idx, scene_idx, character_in_scene in character_registry.scene_appearances(character):
+                scene_appearances.setdefault((event_idx, scene_idx), []).append((character, character_in_scene))
 
-        print("📋 Step 6: Generate the reference images for all characters in the specific scene".center(80, "-"))
+        # base portraits are started in the order of the first appearance of their characters, so the
+        # first scenes get theirs first; a base portrait shared by several scenes is generated once
+        base_portrait_sem = asyncio.Semaphore(5)
+        base_portrait_tasks: Dict[int, asyncio.Task] = {}
 
+        def start_base_portrait(character: CharacterInNovel):
+            if character.index not in base_portrait_tasks:
+                base_portrait_tasks[character.index] = asyncio.create_task(generate_portrait_for_character(base_portrait_sem, character))
 
+        for event_idx, scene in ordered_scenes:
+            for character, _ in scene_appearances.get((event_idx, scene.idx), []):
+                start_base_portrait(character)
+        for character in characters_in_novel:
+            start_base_portrait(character)
+
+        scene_portrait_sem = asyncio.Semaphore(3)
+
+        async def generate_scene_video(sem, position, event_idx, scene: Scene):
+            scene_video_dir = os.path.join(working_dir_scene_videos, f"event_{event_idx}", f"scene_{scene.idx}")
+            final_video_path = os.path.join(scene_video_dir, "final_video.mp4")
+            if os.path.exists(final_video_path) and validate_artifact(final_video_path):
+                event_bus.publish(CacheHit(stage="generate_scene_videos", path=final_video_path, message=f"⏭️ Skipping video generation for event {event_idx}, scene {scene.idx} as it already exists."))
+                return position, final_video_path
+
+            # the portraits of the characters in the scene, each from the base portrait of its novel character, or
+            # from its own features for a character that resolves to no novel character
+            appearances = scene_appearances.get((event_idx, scene.idx), [])
+            await asyncio.gather(*[base_portrait_tasks[character.index] for character, _ in appearances])
+            await asyncio.gather(*[
+                generate_portrait_for_character_in_scene(
+                    scene_portrait_sem,
+                    base_portrait_path(character),
+                    character_in_scene,
+                    event_idx,
+                    scene.idx,
+                )
+                for character, character_in_scene in appearances
+            ], *[
+                generate_fallback_portrait_for_character_in_scene(
+                    scene_portrait_sem,
+                    character_in_scene,
+                    event_idx,
+                    scene.idx,
+                )
+                for character_in_scene in character_registry.unresolved_scene_characters(event_idx, scene.idx)
+            ])
 
-        # Step 7: Generate video for each scene
-        print("📋 Step 7: Generate the video for each scene".center(80, "-"))
-        working_dir_scene_videos = os.path.join(self.working_dir, "videos")
-        os.makedirs(working_dir_scene_videos, exist_ok=True)
-
-        for event in extracted_events:
-            scenes: List[Scene] = event_idx_to_scenes[event.index]
-            for scene in scenes:
-                scene_video_dir = os.path.join(working_dir_scene_videos, f"event_{event.index}", f"scene_{scene.idx}")
-                os.makedirs(scene_video_dir, exist_ok=True)
-
-                self.script2video_pipeline.working_dir = scene_video_dir
-                script = scene.script
-                style = "realistic movie style"
-                character_registry = {}
-                for character in scene.characters:
-                    character_registry[character.identifier_in_scene] = [
-                        {
-                            "path": os.path.join(
-                                working_dir_character_portrait,
-                                f"event_{event.index}",
-                                f"scene_{scene.idx}",
-                                f"character_{character.index}_{character.identifier_in_scene}.png",
-                            ),
-                            "description": f"A portrait of {character.identifier_in_scene}",
-                        }
-                    ]
-                await self.script2video_pipeline(
-                    script=script,
-                    style=style,
-                    character_registry=character_registry
+            async with sem:
+                script2video_pipeline = self.script2video_pipeline.with_working_dir(
+                    scene_video_dir,
+                    event_bus=event_bus.child(event_idx=event_idx, scene_idx=scene.idx),
+                )
+                final_video_path = await script2video_pipeline(
+                    script=scene.script,
+                    user_requirement="",
+                    style="realistic movie style",
+                    characters=scene.characters,
+                    character_portraits_registry=character_registry.scene_portraits_registry(event_idx, scene.idx, scene_portrait_path),
                 )
-                print(f"✅ Generated video for event {event.index}, scene {scene.idx}, saved to {scene_video_dir}")
-        print("📋 Step 7: Generate the video for each scene".center(80, "-"))
\ No newline at end of file
+            event_bus.publish(ArtifactReady(stage="generate_scene_videos", path=scene_video_dir, message=f"✅ Generated video for event {event_idx}, scene {scene.idx}, saved to {scene_video_dir}"))
+            return position, final_video_path
+
+        sem = asyncio.Semaphore(self.max_concurrent_scenes)
+        # tasks are created in story order, which is the order they acquire the semaphores in
+        tasks = [
+            asyncio.create_task(generate_scene_video(sem, position, event_idx, scene))
+            for position, (event_idx, scene) in enumerate(ordered_scenes)
+        ]
+        for future in asyncio.as_completed(tasks):
+            position, final_video_path = await future
+            scene_video_paths[position] = final_video_path
+            update_movie_manifest()
+
+        # characters that appear in no scene still get a base portrait
+        await asyncio.gather(*base_portrait_tasks.values())
+        event_bus.publish(StageProgress(stage="generate_character_portraits", message="🔖 Generated character portraits based on static features and on dynamic features in the specific scene"))
+        event_bus.publish(StageFinished(stage="generate_character_portraits", message="📋 Step 6: Generate the reference images for all characters in the specific scene".center(80, "-")))
+
+        movie_path = os.path.join(self.working_dir, "final_movie.mp4")
+        if os.path.exists(movie_path) and validate_artifact(movie_path):
+            event_bus.publish(CacheHit(stage="generate_scene_videos", path=movie_path, message=f"⏭️ Skipping assembling the movie as {movie_path} already exists."))
+        else:
+            await asyncio.to_thread(concatenate_video_files, scene_video_paths, movie_path)
+            event_bus.publish(ArtifactReady(stage="generate_scene_videos", path=movie_path, message=f"✅ Assembled the {len(scene_video_paths)} scene videos into {movie_path}"))
@@ -1,54 +1,98 @@
 import os
+import copy
 import shutil
 import json
 import logging
 import asyncio
 import time
 from typing import Optional, Dict, List, Tuple, Literal
-from moviepy import VideoFileClip, concatenate_videoclips
 from PIL import Image
 from agents import *
 import yaml
 from interfaces import *
 from langchain.chat_models import init_chat_model
 from utils.timer import Timer
+from utils.image import make_thumbnail
+from utils.video import concatenate_video_files
+from utils.config import init_from_class_path
+from utils.event_bus import EventBus, get_default_event_bus, StageStarted, StageProgress, StageFinished, ArtifactReady, CacheHit
+from utils.run_manifest import RunManifest
+from utils.artifacts import atomic_path, validate_artifact
 import importlib
 
 class Script2VideoPipeline:
 
-    # events
-    character_portrait_events = {}
-    shot_desc_events = {}
-    frame_events = {}
-
-
     def __init__(
         self,
         chat_model: str,
         image_generator,
         video_generator,
         working_dir: str,
+        num_frame_candidates: int = 1,
+        min_frame_candidates: Optional[int] = None,
+        candidate_image_generators: Optional[List] = None,
+        event_bus: Optional[EventBus] = None,
     ):
+        """
+        Args:
+            num_frame_candidates:
+            The number of candidate images fired concurrently for each frame. When greater than 1, the best candidate is picked by the BestImageSelector.
+
+            min_frame_candidates:
+            The number of finished candidates that is enough to start the selection. The remaining candidates are cancelled. Defaults to num_frame_candidates.
+
+            candidate_image_generators:
+            Additional image generators. Candidates are spread round-robin across image_generator and these generators.
+
+            event_bus:
+            The bus progress events are published to. Defaults to the process-wide bus, which prints them.
+        """
 
         self.chat_model = chat_model
         self.image_generator = image_generator
         self.video_generator = video_generator
 
+        self.num_frame_candidates = num_frame_candidates
+        self.min_frame_candidates = min_frame_candidates if min_frame_candidates is not None else num_frame_candidates
+        self.candidate_image_generators = candidate_image_generators or []
+        self.event_bus = event_bus or get_default_event_bus()
+
         self.character_extractor = CharacterExtractor(chat_model=self.chat_model)
         self.character_portraits_generator = CharacterPortraitsGenerator(image_generator=self.image_generator)
         self.storyboard_artist = StoryboardArtist(chat_model=self.chat_model)
         self.camera_image_generator = CameraImageGenerator(chat_model=self.chat_model, image_generator=self.image_generator, video_generator=self.video_generator)
         self.reference_image_selector = ReferenceImageSelector(chat_model=self.chat_model)
+        self.best_image_selector = BestImageSelector(chat_model=self.chat_model)
 
         self.working_dir = working_dir
         os.makedirs(self.working_dir, exist_ok=True)
+        self.run_manifest = RunManifest(self.working_dir)
+
+        # events
+        self.character_portrait_events = {}
+        self.shot_desc_events = {}
+        self.frame_events = {}
+
 
+    def with_working_dir(self, working_dir: str, event_bus: Optional[EventBus] = None):
+        """Return a pipeline that shares the chat model, generators and agents of this one but works in another working_dir."""
+        pipeline = copy.copy(self)
+        pipeline.working_dir = working_dir
+        pipeline.event_bus = event_bus or self.event_bus
+        os.makedirs(pipeline.working_dir, exist_ok=True)
+        pipeline.run_manifest = RunManifest(pipeline.working_dir)
+        pipeline.character_portrait_events = {}
+        pipeline.shot_desc_events = {}
+        pipeline.frame_events = {}
+        return pipeline
 
 
     @classmethod
     def init_from_config(
         cls,
         config_path: str,
+        working_dir: Optional[str] = None,
+        event_bus: Optional[EventBus] = None,
     ):
         with open(config_path, "r") as f:
             config = yaml.safe_load(f)
@@ -66,11 +110,21 @@ class Script2VideoPipeline:
         video_generator_args = config["video_generator"]["init_args"]
         video_generator = video_generator_cls(**video_generator_args)
 
+        frame_candidates_config = config.get("frame_candidates") or {}
+        candidate_image_generators = [
+            init_from_class_path(item)
+            for item in frame_candidates_config.get("image_generators") or []
+        ]
+
         return cls(
             chat_model=chat_model,
             image_generator=image_generator,
             video_generator=video_generator,
-            working_dir=config["working_dir"],
+            working_dir=working_dir or config["working_dir"],
+            num_frame_candidates=frame_candidates_config.get("num_candidates", 1),
+            min_frame_candidates=frame_candidates_config.get("min_candidates"),
+            candidate_image_generators=candidate_image_generators,
+            event_bus=event_bus,
         )
 
     async def __call__(
@@ -80,7 +134,14 @@ class Script2VideoPipeline:
         style: str,
         characters: List[CharacterInScene] = None,
         character_portraits_registry: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None,
+        environment_reference_image_path_and_text_pairs: Optional[List[Tuple[str, str]]] = None,
     ):
+        """
+        Args:
+            environment_reference_image_path_and_text_pairs:
+            Images of the location of the scene from earlier scenes, e.g. from an EnvironmentLibrary. They are offered
+            to the ReferenceImageSelector for the first frames of the root cameras, which establish the setting.
+        """
         if characters is None:
             characters = await self.extract_characters(script=script)
 
@@ -97,22 +158,17 @@ class Script2VideoPipeline:
             #     print(f"☑️ Extracted {len(characters)} characters from script and saved to {characters_path}.")
 
         if character_portraits_registry is None:
-            character_portraits_registry_path = os.path.join(self.working_dir, "character_portraits_registry.json")
-            if os.path.exists(character_portraits_registry_path):
-                with open(character_portraits_registry_path, "r", encoding="utf-8") as f:
-                    character_portraits_registry = json.load(f)
-                print(f"🚀 Loaded {len(character_portraits_registry)} character portraits from existing file.")
+            character_portraits_registry = self.load_character_portraits_registry()
+            if all(character.identifier_in_scene in character_portraits_registry for character in characters):
+                self.event_bus.publish(CacheHit(stage="generate_character_portraits", path=self.run_manifest.db_path, message=f"🚀 Loaded {len(character_portraits_registry)} character portraits from the run manifest."))
             else:
-                print(f"🔍 Generating character portraits...")
+                self.event_bus.publish(StageStarted(stage="generate_character_portraits", message=f"🔍 Generating character portraits..."))
                 character_portraits_registry = await self.generate_character_portraits(
                     characters=characters,
-                    character_portraits_registry=None,
+                    character_portraits_registry=character_portraits_registry,
                     style=style,
                 )
-
-                with open(character_portraits_registry_path, "w", encoding="utf-8") as f:
-                    json.dump(character_portraits_registry, f, ensure_ascii=False, indent=4)
-                print(f"☑️ Generated {len(character_portraits_registry)} character portraits and saved to {character_portraits_registry_path}.")
+                self.event_bus.publish(ArtifactReady(stage="generate_character_portraits", path=self.run_manifest.db_path, message=f"☑️ Generated {len(character_portraits_registry)} character portraits and saved to the run manifest."))
 
 
 
@@ -142,6 +198,7 @@ class Script2VideoPipeline:
                 characters=characters,
                 character_portraits_registry=character_portraits_registry,
                 priority_shot_idxs=priority_shot_idxs,
+                environment_reference_image_path_and_text_pairs=environment_reference_image_path_and_text_pairs,
             )
             for camera in camera_tree
         ]
@@ -155,18 +212,41 @@ class Script2VideoPipeline:
         tasks.extend(video_tasks)
         await asyncio.gather(*tasks)
 
+        final_video_path = await self.concatenate_videos(shot_descriptions)
+        self.run_manifest.export_legacy_layout()
+        return final_video_path
+
+
+    def load_character_portraits_registry(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """The portraits of every character generated so far, from the run manifest (or a legacy character_portraits_registry.json)."""
+        if not self.run_manifest.get_outputs("generate_character_portraits"):
+            self.run_manifest.get_output(
+                "character_portraits/legacy_registry",
+                stage="generate_character_portraits",
+                legacy_path="character_portraits_registry.json",
+            )
+        character_portraits_registry = {}
+        for registry_item in self.run_manifest.get_outputs("generate_character_portraits").values():
+            character_portraits_registry.update(registry_item)
+        return character_portraits_registry
+
+
+    async def concatenate_videos(
+        self,
+        shot_descriptions: List[ShotDescription],
+    ) -> str:
         final_video_path = os.path.join(self.working_dir, "final_video.mp4")
-        if os.path.exists(final_video_path):
-            print(f"🚀 Skipped concatenating videos, already exists.")
+        if self.run_manifest.artifact_is_complete(final_video_path, stage="concatenate_videos"):
+            self.event_bus.publish(CacheHit(stage="concatenate_videos", path=final_video_path, message=f"🚀 Skipped concatenating videos, already exists."))
         else:
-            print(f"🎬 Starting concatenating videos...")
-            video_clips = [
-                VideoFileClip(os.path.join(self.working_dir, "shots", f"{shot_description.idx}", "video.mp4"))
+            self.event_bus.publish(StageStarted(stage="concatenate_videos", message=f"🎬 Starting concatenating videos..."))
+            video_paths = [
+                os.path.join(self.working_dir, "shots", f"{shot_description.idx}", "video.mp4")
                 for shot_description in shot_descriptions
             ]
-            final_video = concatenate_videoclips(video_clips)
-            final_video.write_videofile(final_video_path, codec="libx264", preset="medium")
-            print(f"☑️ Concatenated videos, saved to {final_video_path}.")
+            await asyncio.to_thread(concatenate_video_files, video_paths, final_video_path, codec="libx264", preset="medium")
+            self.run_manifest.record_artifact(final_video_path, stage="concatenate_videos")
+            self.event_bus.publish(ArtifactReady(stage="concatenate_videos", path=final_video_path, message=f"☑️ Concatenated videos, saved to {final_video_path}."))
 
         return final_video_path
 
@@ -178,17 +258,83 @@ class Script2VideoPipeline:
         characters: List[CharacterInScene],
         character_portraits_registry: Dict[str, Dict[str, Dict[str, str]]],
         priority_shot_idxs: List[int],
+        environment_reference_image_path_and_text_pairs: Optional[List[Tuple[str, str]]] = None,
     ):
         # 1. generate the first_frame of the first shot of the camera
         first_shot_idx = camera.active_shot_idxs[0]
+        first_shot_ff_path = await self.generate_first_frame_for_camera(
+            camera=camera,
+            shot_descriptions=shot_descriptions,
+            characters=characters,
+            character_portraits_registry=character_portraits_registry,
+            environment_reference_image_path_and_text_pairs=environment_reference_image_path_and_text_pairs,
+        )
+
+        # 2. generate the following frames of the camera
+        priority_tasks = []
+        normal_tasks = []
+
+        if shot_descriptions[first_shot_idx].variation_type in ["medium", "large"]:
+            task = self.generate_frame_for_single_shot(
+                shot_idx=first_shot_idx, 
+                frame_type="last_frame", 
+                first_shot_ff_path_and_text_pair=(first_shot_ff_path, shot_descriptions[first_shot_idx].ff_desc),
+                frame_desc=shot_descriptions[first_shot_idx].lf_desc,
+                visible_characters=[characters[idx] for idx in shot_descriptions[first_shot_idx].lf_vis_char_idxs],
+                character_portraits_registry=character_portraits_registry,
+            )
+            normal_tasks.append(task)
+
+        for shot_idx in camera.active_shot_idxs[1:]:
+            first_frame_task = self.generate_frame_for_single_shot(
+                    shot_idx=shot_idx, 
+                    frame_type="first_frame", 
+                    first_shot_ff_path_and_text_pair=(first_shot_ff_path, shot_descriptions[first_shot_idx].ff_desc),
+                    frame_desc=shot_descriptions[shot_idx].ff_desc,
+                    visible_characters=[characters[idx] for idx in shot_descriptions[shot_idx].ff_vis_char_idxs],
+                    character_portraits_registry=character_portraits_registry,
+                )
+            if shot_idx in priority_shot_idxs:
+                priority_tasks.append(first_frame_task)
+            else:
+                normal_tasks.append(first_frame_task)
+
+
+            if shot_descriptions[shot_idx].variation_type in ["medium", "large"]:
+                last_frame_task = self.generate_frame_for_single_shot(
+                    shot_idx=shot_idx, 
+                    frame_type="last_frame", 
+                    first_shot_ff_path_and_text_pair=(first_shot_ff_path, shot_descriptions[first_shot_idx].ff_desc),
+                    frame_desc=shot_descriptions[shot_idx].lf_desc,
+                    visible_characters=[characters[idx] for idx in shot_descriptions[shot_idx].lf_vis_char_idxs],
+                    character_portraits_registry=character_portraits_registry,
+                )
+                normal_tasks.append(last_frame_task)
+
+
+        await asyncio.gather(*priority_tasks)
+        await asyncio.gather(*normal_tasks)
+
+
+
+    async def generate_first_frame_for_camera(
+        self,
+        camera: Camera,
+        shot_descriptions: List[ShotDescription],
+        characters: List[CharacterInScene],
+        character_portraits_registry: Dict[str, Dict[str, Dict[str, str]]],
+        environment_reference_image_path_and_text_pairs: Optional[List[Tuple[str, str]]] = None,
+    ) -> str:
+        """Generate the first_frame of the first shot of the camera, which the other frames of the camera are based on."""
+        first_shot_idx = camera.active_shot_idxs[0]
         first_shot_ff_path = os.path.join(self.working_dir, "shots", f"{first_shot_idx}", "first_frame.png")
 
-        if os.path.exists(first_shot_ff_path):
-            print(f"🚀 Skipped generating first_frame for shot {first_shot_idx}, already exists.")
+        if self.run_manifest.artifact_is_complete(first_shot_ff_path, stage="generate_frame", shot_idx=first_shot_idx):
+            self.event_bus.publish(CacheHit(stage="generate_frame", path=first_shot_ff_path, attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"🚀 Skipped generating first_frame for shot {first_shot_idx}, already exists."))
             self.frame_events[first_shot_idx]["first_frame"].set()
 
         else:
-            print(f"🖼️ Starting first_frame generation for shot {first_shot_idx}...")
+            self.event_bus.publish(StageStarted(stage="generate_frame", attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"🖼️ Starting first_frame generation for shot {first_shot_idx}..."))
             available_image_path_and_text_pairs = []
 
             for character_idx in shot_descriptions[first_shot_idx].ff_vis_char_idxs:
@@ -196,6 +342,10 @@ class Script2VideoPipeline:
                 registry_item = character_portraits_registry[identifier_in_scene]
                 for view, item in registry_item.items():
                     available_image_path_and_text_pairs.append((item["path"], item["description"]))
+
+            # root cameras establish the setting, so they get the images of the location from earlier scenes
+            if camera.parent_shot_idx is None and environment_reference_image_path_and_text_pairs:
+                available_image_path_and_text_pairs.extend(environment_reference_image_path_and_text_pairs)
             
             # generate the first_frame based on the shot_description.ff_desc
             if camera.parent_shot_idx is not None:
@@ -205,26 +355,28 @@ class Script2VideoPipeline:
                 parent_shot_ff_path = os.path.join(self.working_dir, "shots", f"{parent_shot_idx}", "first_frame.png")
                 transition_video_path = os.path.join(self.working_dir, "shots", f"{first_shot_idx}", f"transition_video_from_shot_{parent_shot_idx}.mp4")
 
-                if os.path.exists(transition_video_path):
-                    print(f"🚀 Skipped generating transition video for shot {first_shot_idx} from shot {parent_shot_idx}, already exists.")
+                if self.run_manifest.artifact_is_complete(transition_video_path, stage="generate_transition_video", shot_idx=first_shot_idx):
+                    self.event_bus.publish(CacheHit(stage="generate_transition_video", path=transition_video_path, attributes={"shot_idx": first_shot_idx}, message=f"🚀 Skipped generating transition video for shot {first_shot_idx} from shot {parent_shot_idx}, already exists."))
                 else:
-                    print(f"🖼️ Starting transition video generation for shot {first_shot_idx} from shot {parent_shot_idx}...")
+                    self.event_bus.publish(StageStarted(stage="generate_transition_video", attributes={"shot_idx": first_shot_idx}, message=f"🖼️ Starting transition video generation for shot {first_shot_idx} from shot {parent_shot_idx}..."))
                     transition_video_output = await self.camera_image_generator.generate_transition_video(
                         first_shot_visual_desc=shot_descriptions[parent_shot_idx].visual_desc,
                         second_shot_visual_desc=shot_descriptions[first_shot_idx].visual_desc,
                         first_shot_ff_path=parent_shot_ff_path,
                     )
                     transition_video_output.save(transition_video_path)
-                    print(f"☑️ Generated transition video for shot {first_shot_idx} from shot {parent_shot_idx}, saved to {transition_video_path}.")
+                    self.run_manifest.record_artifact(transition_video_path, stage="generate_transition_video", shot_idx=first_shot_idx)
+                    self.event_bus.publish(ArtifactReady(stage="generate_transition_video", path=transition_video_path, attributes={"shot_idx": first_shot_idx}, message=f"☑️ Generated transition video for shot {first_shot_idx} from shot {parent_shot_idx}, saved to {transition_video_path}."))
 
                 new_camera_image_path = os.path.join(self.working_dir, "shots", f"{first_shot_idx}", f"new_camera_{camera.idx}.png")
-                if os.path.exists(new_camera_image_path):
-                    print(f"🚀 Skipped generating new camera image for shot {first_shot_idx}, already exists.")
+                if self.run_manifest.artifact_is_complete(new_camera_image_path, stage="generate_new_camera_image", shot_idx=first_shot_idx):
+                    self.event_bus.publish(CacheHit(stage="generate_new_camera_image", path=new_camera_image_path, attributes={"shot_idx": first_shot_idx}, message=f"🚀 Skipped generating new camera image for shot {first_shot_idx}, already exists."))
                 else:
-                    print(f"🖼️ Starting new camera image generation for shot {first_shot_idx}...")
+                    self.event_bus.publish(StageStarted(stage="generate_new_camera_image", attributes={"shot_idx": first_shot_idx}, message=f"🖼️ Starting new camera image generation for shot {first_shot_idx}..."))
                     new_camera_image = self.camera_image_generator.get_new_camera_image(transition_video_path)
                     new_camera_image.save(new_camera_image_path)
-                    print(f"☑️ Generated new camera image for shot {first_shot_idx} (not completed), saved to {new_camera_image_path}.")
+                    self.run_manifest.record_artifact(new_camera_image_path, stage="generate_new_camera_image", shot_idx=first_shot_idx)
+                    self.event_bus.publish(ArtifactReady(stage="generate_new_camera_image", path=new_camera_image_path, attributes={"shot_idx": first_shot_idx}, message=f"☑️ Generated new camera image for shot {first_shot_idx} (not completed), saved to {new_camera_image_path}."))
 
                     available_image_path_and_text_pairs.append(
                         (
@@ -236,87 +388,52 @@ class Script2VideoPipeline:
 
             # 如果子镜头缺少信息，则需要选择参考图像生成
             if camera.parent_shot_idx is None or camera.missing_info is not None:
-                ff_selector_output_path = os.path.join(self.working_dir, "shots", f"{first_shot_idx}", "first_frame_selector_output.json")
-                if os.path.exists(ff_selector_output_path):
-                    with open(ff_selector_output_path, 'r', encoding='utf-8') as f:
-                        ff_selector_output = json.load(f)
-                    print(f"🚀 Loaded existing reference image selection and prompt for first_frame of shot {first_shot_idx} from {ff_selector_output_path}.")
+                ff_selector_output_key = f"selector_output/{first_shot_idx}/first_frame"
+                ff_selector_output = self.run_manifest.get_output(
+                    ff_selector_output_key,
+                    stage="select_reference_images",
+                    shot_idx=first_shot_idx,
+                    legacy_path=f"shots/{first_shot_idx}/first_frame_selector_output.json",
+                )
+                if ff_selector_output is not None:
+                    self.event_bus.publish(CacheHit(stage="select_reference_images", path=self.run_manifest.db_path, attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"🚀 Loaded existing reference image selection and prompt for first_frame of shot {first_shot_idx} from the run manifest."))
                 else:
-                    print(f"🔍 Selecting reference images and generating prompt for first_frame of shot {first_shot_idx}...")
+                    self.event_bus.publish(StageStarted(stage="select_reference_images", attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"🔍 Selecting reference images and generating prompt for first_frame of shot {first_shot_idx}..."))
                     ff_selector_output = await self.reference_image_selector.select_reference_images_and_generate_prompt(
                         available_image_path_and_text_pairs=available_image_path_and_text_pairs,
                         frame_description=shot_descriptions[first_shot_idx].ff_desc
                     )
-                    with open(ff_selector_output_path, 'w', encoding='utf-8') as f:
-                        json.dump(ff_selector_output, f, ensure_ascii=False, indent=4)
-
-                    print(f"☑️ Selected reference images and generated prompt for first_frame of shot {first_shot_idx}, saved to {ff_selector_output_path}.")
+                    self.run_manifest.put_output(
+                        ff_selector_output_key,
+                        stage="select_reference_images",
+                        data=ff_selector_output,
+                        shot_idx=first_shot_idx,
+                        legacy_path=f"shots/{first_shot_idx}/first_frame_selector_output.json",
+                    )
+                    self.event_bus.publish(ArtifactReady(stage="select_reference_images", path=self.run_manifest.db_path, attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"☑️ Selected reference images and generated prompt for first_frame of shot {first_shot_idx}, saved to the run manifest."))
 
                 reference_image_path_and_text_pairs, prompt = ff_selector_output["reference_image_path_and_text_pairs"], ff_selector_output["text_prompt"]
                 prefix_prompt = ""
                 for i, (image_path, text) in enumerate(reference_image_path_and_text_pairs):
                     prefix_prompt += f"Image {i}: {text}\n"
                 prompt = f"{prefix_prompt}\n{prompt}"
-                reference_image_paths = [item[0] for item in reference_image_path_and_text_pairs]
-                ff_image: ImageOutput = await self.image_generator.generate_single_image(
+                await self.generate_frame_image(
                     prompt=prompt,
-                    reference_image_paths=reference_image_paths,
-                    size="1600x900",
+                    reference_image_path_and_text_pairs=reference_image_path_and_text_pairs,
+                    frame_desc=shot_descriptions[first_shot_idx].ff_desc,
+                    save_path=first_shot_ff_path,
                 )
-                ff_image.save(first_shot_ff_path)
+                self.run_manifest.record_artifact(first_shot_ff_path, stage="generate_frame", shot_idx=first_shot_idx)
                 self.frame_events[first_shot_idx]["first_frame"].set()
-                print(f"☑️ Generated first_frame for shot {first_shot_idx}, saved to {first_shot_ff_path}.")
+                self.event_bus.publish(ArtifactReady(stage="generate_frame", path=first_shot_ff_path, attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"☑️ Generated first_frame for shot {first_shot_idx}, saved to {first_shot_ff_path}."))
             else:
-                shutil.copy(new_camera_image_path, first_shot_ff_path)
+                with atomic_path(first_shot_ff_path) as tmp_path:
+                    shutil.copy(new_camera_image_path, tmp_path)
+                self.run_manifest.record_artifact(first_shot_ff_path, stage="generate_frame", shot_idx=first_shot_idx)
                 self.frame_events[first_shot_idx]["first_frame"].set()
-                print(f"☑️ Generated first_frame for shot {first_shot_idx}, saved to {first_shot_ff_path}.")
-
-
-        # 2. generate the following frames of the camera
-        priority_tasks = []
-        normal_tasks = []
-
-        if shot_descriptions[first_shot_idx].variation_type in ["medium", "large"]:
-            task = self.generate_frame_for_single_shot(
-                shot_idx=first_shot_idx, 
-                frame_type="last_frame", 
-                first_shot_ff_path_and_text_pair=(first_shot_ff_path, shot_descriptions[first_shot_idx].ff_desc),
-                frame_desc=shot_descriptions[first_shot_idx].lf_desc,
-                visible_characters=[characters[idx] for idx in shot_descriptions[first_shot_idx].lf_vis_char_idxs],
-                character_portraits_registry=character_portraits_registry,
-            )
-            normal_tasks.append(task)
-
-        for shot_idx in camera.active_shot_idxs[1:]:
-            first_frame_task = self.generate_frame_for_single_shot(
-                    shot_idx=shot_idx, 
-                    frame_type="first_frame", 
-                    first_shot_ff_path_and_text_pair=(first_shot_ff_path, shot_descriptions[first_shot_idx].ff_desc),
-                    frame_desc=shot_descriptions[shot_idx].ff_desc,
-                    visible_characters=[characters[idx] for idx in shot_descriptions[shot_idx].ff_vis_char_idxs],
-                    character_portraits_registry=character_portraits_registry,
-                )
-            if shot_idx in priority_shot_idxs:
-                priority_tasks.append(first_frame_task)
-            else:
-                normal_tasks.append(first_frame_task)
-
-
-            if shot_descriptions[shot_idx].variation_type in ["medium", "large"]:
-                last_frame_task = self.generate_frame_for_single_shot(
-                    shot_idx=shot_idx, 
-                    frame_type="last_frame", 
-                    first_shot_ff_path_and_text_pair=(first_shot_ff_path, shot_descriptions[first_shot_idx].ff_desc),
-                    frame_desc=shot_descriptions[shot_idx].lf_desc,
-                    visible_characters=[characters[idx] for idx in shot_descriptions[shot_idx].lf_vis_char_idxs],
-                    character_portraits_registry=character_portraits_registry,
-                )
-                normal_tasks.append(last_frame_task)
-
-
-        await asyncio.gather(*priority_tasks)
-        await asyncio.gather(*normal_tasks)
+                self.event_bus.publish(ArtifactReady(stage="generate_frame", path=first_shot_ff_path, attributes={"shot_idx": first_shot_idx, "frame_type": "first_frame"}, message=f"☑️ Generated first_frame for shot {first_shot_idx}, saved to {first_shot_ff_path}."))
 
+        return first_shot_ff_path
 
 
     async def generate_video_for_single_shot(
@@ -324,8 +441,8 @@ class Script2VideoPipeline:
         shot_description: ShotDescription,
     ):
         video_path = os.path.join(self.working_dir, "shots", f"{shot_description.idx}", "video.mp4")
-        if os.path.exists(video_path):
-            print(f"🚀 Skipped generating video for shot {shot_description.idx}, already exists.")
+        if self.run_manifest.artifact_is_complete(video_path, stage="generate_video", shot_idx=shot_description.idx):
+            self.event_bus.publish(CacheHit(stage="generate_video", path=video_path, attributes={"shot_idx": shot_description.idx}, message=f"🚀 Skipped generating video for shot {shot_description.idx}, already exists."))
         else:
             await self.frame_events[shot_description.idx]["first_frame"].wait()
             if shot_description.variation_type in ["medium", "large"]:
@@ -336,13 +453,14 @@ class Script2VideoPipeline:
             if shot_description.variation_type in ["medium", "large"]:
                 frame_paths.append(os.path.join(self.working_dir, "shots", f"{shot_description.idx}", "last_frame.png"))
 
-            print(f"🎬 Starting video generation for shot {shot_description.idx}...")
+            self.event_bus.publish(StageStarted(stage="generate_video", attributes={"shot_idx": shot_description.idx}, message=f"🎬 Starting video generation for shot {shot_description.idx}..."))
             video_output = await self.video_generator.generate_single_video(
                 prompt=shot_description.motion_desc + "\n" + shot_description.audio_desc,
                 reference_image_paths=frame_paths,
             )
             video_output.save(video_path)
-            print(f"☑️ Generated video for shot {shot_description.idx}, saved to {video_path}.")
+            self.run_manifest.record_artifact(video_path, stage="generate_video", shot_idx=shot_description.idx)
+            self.event_bus.publish(ArtifactReady(stage="generate_video", path=video_path, attributes={"shot_idx": shot_description.idx}, message=f"☑️ Generated video for shot {shot_description.idx}, saved to {video_path}."))
 
     async def generate_frame_for_single_shot(
         self,
@@ -356,11 +474,11 @@ class Script2VideoPipeline:
 
         frame_image_path = os.path.join(self.working_dir, "shots", f"{shot_idx}", f"{frame_type}.png")
 
-        if os.path.exists(frame_image_path):
-            print(f"🚀 Skipped generating {frame_type} for shot {shot_idx}, already exists.")
+        if self.run_manifest.artifact_is_complete(frame_image_path, stage="generate_frame", shot_idx=shot_idx):
+            self.event_bus.publish(CacheHit(stage="generate_frame", path=frame_image_path, attributes={"shot_idx": shot_idx, "frame_type": frame_type}, message=f"🚀 Skipped generating {frame_type} for shot {shot_idx}, already exists."))
 
         else:
-            print(f"🖼️ Starting {frame_type} generation for shot {shot_idx}...")
+            self.event_bus.publish(StageStarted(stage="generate_frame", attributes={"shot_idx": shot_idx, "frame_type": frame_type}, message=f"🖼️ Starting {frame_type} generation for shot {shot_idx}..."))
             available_image_path_and_text_pairs = []
             for visible_character in visible_characters:
                 identifier_in_scene = visible_character.identifier_in_scene
@@ -370,52 +488,139 @@ class Script2VideoPipeline:
 
             available_image_path_and_text_pairs.append(first_shot_ff_path_and_text_pair)
 
-            selector_output_path = os.path.join(self.working_dir, "shots", f"{shot_idx}", f"{frame_type}_selector_output.json")
-            if os.path.exists(selector_output_path):
-                with open(selector_output_path, 'r', encoding='utf-8') as f:
-                    selector_output = json.load(f)
-                print(f"🚀 Loaded existing reference image selection and prompt for {frame_type} frame of shot {shot_idx} from {selector_output_path}.")
+            selector_output_key = f"selector_output/{shot_idx}/{frame_type}"
+            selector_output = self.run_manifest.get_output(
+                selector_output_key,
+                stage="select_reference_images",
+                shot_idx=shot_idx,
+                legacy_path=f"shots/{shot_idx}/{frame_type}_selector_output.json",
+            )
+            if selector_output is not None:
+                self.event_bus.publish(CacheHit(stage="select_reference_images", path=self.run_manifest.db_path, attributes={"shot_idx": shot_idx, "frame_type": frame_type}, message=f"🚀 Loaded existing reference image selection and prompt for {frame_type} frame of shot {shot_idx} from the run manifest."))
             else:
-                print(f"🔍 Selecting reference images and generating prompt for {frame_type} frame of shot {shot_idx}...")
+                self.event_bus.publish(StageStarted(stage="select_reference_images", attributes={"shot_idx": shot_idx, "frame_type": frame_type}, message=f"🔍 Selecting reference images and generating prompt for {frame_type} frame of shot {shot_idx}..."))
                 selector_output = await self.reference_image_selector.select_reference_images_and_generate_prompt(
                     available_image_path_and_text_pairs=available_image_path_and_text_pairs,
                     frame_description=frame_desc
                 )
-                with open(selector_output_path, 'w', encoding='utf-8') as f:
-                    json.dump(selector_output, f, ensure_ascii=False, indent=4)
-                print(f"☑️ Selected reference images and generated prompt for {frame_type} frame of shot {shot_idx}, saved to {selector_output_path}.")
+                self.run_manifest.put_output(
+                    selector_output_key,
+                    stage="select_reference_images",
+                    data=selector_output,
+                    shot_idx=shot_idx,
+                    legacy_path=f"shots/{shot_idx}/{frame_type}_selector_output.json",
+                )
+                self.event_bus.publish(ArtifactReady(stage="select_reference_images", path=self.run_manifest.db_path, attributes={"shot_idx": shot_idx, "frame_type": frame_type}, message=f"☑️ Selected reference images and generated prompt for {frame_type} frame of shot {shot_idx}, saved to the run manifest."))
 
             reference_image_path_and_text_pairs, prompt = selector_output["reference_image_path_and_text_pairs"], selector_output["text_prompt"]
             prefix_prompt = ""
             for i, (image_path, text) in enumerate(reference_image_path_and_text_pairs):
                 prefix_prompt += f"Image {i}: {text}\n"
             prompt = f"{prefix_prompt}\n{prompt}"
-            reference_image_paths = [item[0] for item in reference_image_path_and_text_pairs]
+            await self.generate_frame_image(
+                prompt=prompt,
+                reference_image_path_and_text_pairs=reference_image_path_and_text_pairs,
+                frame_desc=frame_desc,
+                save_path=frame_image_path,
+            )
+            self.run_manifest.record_artifact(frame_image_path, stage="generate_frame", shot_idx=shot_idx)
+            self.event_bus.publish(ArtifactReady(stage="generate_frame", path=frame_image_path, attributes={"shot_idx": shot_idx, "frame_type": frame_type}, message=f"☑️ Generated {frame_type} frame for shot {shot_idx}, saved to {frame_image_path}."))
+
+
+        self.frame_events[shot_idx][frame_type].set()
+        return frame_image_path
+
+
+    async def generate_frame_image(
+        self,
+        prompt: str,
+        reference_image_path_and_text_pairs: List[Tuple[str, str]],
+        frame_desc: str,
+        save_path: str,
+    ) -> str:
+        reference_image_paths = [item[0] for item in reference_image_path_and_text_pairs]
 
+        if self.num_frame_candidates <= 1:
             frame_image: ImageOutput = await self.image_generator.generate_single_image(
                 prompt=prompt,
                 reference_image_paths=reference_image_paths,
                 size="1600x900",
             )
-            frame_image.save(frame_image_path)
-            print(f"☑️ Generated {frame_type} frame for shot {shot_idx}, saved to {frame_image_path}.")
+            frame_image.save(save_path)
+            return save_path
+
+        # fire all candidates concurrently, spread across the available image generators
+        frame_name = os.path.splitext(os.path.basename(save_path))[0]
+        candidates_dir = os.path.join(os.path.dirname(save_path), "candidates")
+        os.makedirs(candidates_dir, exist_ok=True)
+        image_generators = [self.image_generator] + self.candidate_image_generators
+
+        async def generate_candidate(candidate_idx: int) -> str:
+            candidate_path = os.path.join(candidates_dir, f"{frame_name}_candidate_{candidate_idx}.png")
+            if os.path.exists(candidate_path) and validate_artifact(candidate_path):
+                return candidate_path
+            image_generator = image_generators[candidate_idx % len(image_generators)]
+            candidate_image: ImageOutput = await image_generator.generate_single_image(
+                prompt=prompt,
+                reference_image_paths=reference_image_paths,
+                size="1600x900",
+            )
+            candidate_image.save(candidate_path)
+            return candidate_path
 
+        tasks = [asyncio.create_task(generate_candidate(i)) for i in range(self.num_frame_candidates)]
+        candidate_paths = []
+        try:
+            for future in asyncio.as_completed(tasks):
+                try:
+                    candidate_paths.append(await future)
+                except Exception as e:
+                    logging.warning(f"Candidate generation for {save_path} failed: {e}")
+                    continue
+                if len(candidate_paths) >= self.min_frame_candidates:
+                    break
+        finally:
+            # cancel the stragglers once enough candidates arrived
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if len(candidate_paths) == 0:
+            raise RuntimeError(f"All {self.num_frame_candidates} candidates failed for {save_path}")
+
+        best_candidate_path = candidate_paths[0]
+        if len(candidate_paths) > 1:
+            thumbnail_paths = [
+                make_thumbnail(path, os.path.join(candidates_dir, f"thumbnail_{os.path.basename(path)}"))
+                for path in candidate_paths
+            ]
+            try:
+                best_thumbnail_path = await self.best_image_selector(
+                    reference_image_path_and_text_pairs=reference_image_path_and_text_pairs,
+                    target_description=frame_desc,
+                    candidate_image_paths=thumbnail_paths,
+                )
+                best_candidate_path = candidate_paths[thumbnail_paths.index(best_thumbnail_path)]
+            except Exception as e:
+                logging.warning(f"Best image selection for {save_path} failed, falling back to the first candidate: {e}")
 
-        self.frame_events[shot_idx][frame_type].set()
-        return frame_image_path
+        with open(os.path.join(candidates_dir, f"{frame_name}_selection.json"), "w", encoding="utf-8") as f:
+            json.dump({"candidate_paths": candidate_paths, "best_candidate_path": best_candidate_path}, f, ensure_ascii=False, indent=4)
+        with atomic_path(save_path) as tmp_path:
+            shutil.copy(best_candidate_path, tmp_path)
+        self.event_bus.publish(StageProgress(stage="select_best_image", attributes={"selected": best_candidate_path, "num_candidates": len(candidate_paths)}, message=f"🏅 Selected {best_candidate_path} from {len(candidate_paths)} candidates for {save_path}."))
+        return save_path
 
 
     async def construct_camera_tree(
         self,
         shot_descriptions: List[ShotDescription],
     ):
-        camera_tree_path = os.path.join(self.working_dir, "camera_tree.json")
-
-        if os.path.exists(camera_tree_path):
-            with open(camera_tree_path, "r", encoding="utf-8") as f:
-                camera_tree = json.load(f)
+        camera_tree = self.run_manifest.get_output("camera_tree", stage="construct_camera_tree", legacy_path="camera_tree.json")
+        if camera_tree is not None:
             camera_tree = [Camera.model_validate(camera) for camera in camera_tree]
-            print(f"🚀 Loaded {len(camera_tree)} cameras from existing file.")
+            self.event_bus.publish(CacheHit(stage="construct_camera_tree", path=self.run_manifest.db_path, message=f"🚀 Loaded {len(camera_tree)} cameras from the run manifest."))
             return camera_tree
 
         cameras: List[Camera] = []
@@ -426,9 +631,13 @@ class Script2VideoPipeline:
                 cameras[shot_description.cam_idx].active_shot_idxs.append(shot_description.idx)
 
         camera_tree = await self.camera_image_generator.construct_camera_tree(cameras=cameras, shot_descs=shot_descriptions)
-        with open(camera_tree_path, "w", encoding="utf-8") as f:
-            json.dump([camera.model_dump() for camera in camera_tree], f, ensure_ascii=False, indent=4)
-        print(f"✅ Constructed camera tree and saved to {camera_tree_path}.")
+        self.run_manifest.put_output(
+            "camera_tree",
+            stage="construct_camera_tree",
+            data=[camera.model_dump() for camera in camera_tree],
+            legacy_path="camera_tree.json",
+        )
+        self.event_bus.publish(ArtifactReady(stage="construct_camera_tree", path=self.run_manifest.db_path, message=f"✅ Constructed camera tree and saved to the run manifest."))
         return camera_tree
 
 
@@ -438,18 +647,19 @@ class Script2VideoPipeline:
         self,
         script: str,
     ):
-        save_path = os.path.join(self.working_dir, "characters.json")
-
-        if os.path.exists(save_path):
-            with open(save_path, "r", encoding="utf-8") as f:
-                characters = json.load(f)
+        characters = self.run_manifest.get_output("characters", stage="extract_characters", legacy_path="characters.json")
+        if characters is not None:
             characters = [CharacterInScene.model_validate(character) for character in characters]
-            print(f"🚀 Loaded {len(characters)} characters from existing file.")
+            self.event_bus.publish(CacheHit(stage="extract_characters", path=self.run_manifest.db_path, message=f"🚀 Loaded {len(characters)} characters from the run manifest."))
         else:
             characters = await self.character_extractor.extract_characters(script)
-            with open(save_path, "w", encoding="utf-8") as f:
-                json.dump([character.model_dump() for character in characters], f, ensure_ascii=False, indent=4)
-            print(f"✅ Extracted {len(characters)} characters from script and saved to {save_path}.")
+            self.run_manifest.put_output(
+                "characters",
+                stage="extract_characters",
+                data=[character.model_dump() for character in characters],
+                legacy_path="characters.json",
+            )
+            self.event_bus.publish(ArtifactReady(stage="extract_characters", path=self.run_manifest.db_path, message=f"✅ Extracted {len(characters)} characters from script and saved to the run manifest."))
 
         for character in characters:
             self.character_portrait_events[character.idx] = asyncio.Event()
@@ -463,14 +673,8 @@ class Script2VideoPipeline:
         character_portraits_registry: Optional[Dict[str, Dict[str, Dict[str, str]]]],
         style: str,
     ):
-        character_portraits_registry_path = os.path.join(self.working_dir, "character_portraits_registry.json")
         if character_portraits_registry is None:
-            if os.path.exists(character_portraits_registry_path):
-                with open(character_portraits_registry_path, 'r', encoding='utf-8') as f:
-                    character_portraits_registry = json.load(f)
-            else:
-                character_portraits_registry = {}
-
+            character_portraits_registry = self.load_character_portraits_registry()
 
         tasks = [
             self.generate_portraits_for_single_character(character, style)
@@ -479,13 +683,20 @@ class Script2VideoPipeline:
         ]
         if tasks:
             for future in asyncio.as_completed(tasks):
-                character_portraits_registry.update(await future)
-                with open(character_portraits_registry_path, 'w', encoding='utf-8') as f:
-                    json.dump(character_portraits_registry, f, ensure_ascii=False, indent=4)
+                registry_item = await future
+                character_portraits_registry.update(registry_item)
+                # one row per character, so finishing a character does not rewrite the others
+                for identifier_in_scene in registry_item:
+                    self.run_manifest.put_output(
+                        f"character_portraits/{identifier_in_scene}",
+                        stage="generate_character_portraits",
+                        data={identifier_in_scene: registry_item[identifier_in_scene]},
+                        legacy_path="character_portraits_registry.json",
+                    )
 
-            print(f"✅ Completed character portrait generation for {len(characters)} characters.")
+            self.event_bus.publish(StageFinished(stage="generate_character_portraits", message=f"✅ Completed character portrait generation for {len(characters)} characters."))
         else:
-            print("🚀 All characters already have portraits, skipping portrait generation.")
+            self.event_bus.publish(CacheHit(stage="generate_character_portraits", path=self.run_manifest.db_path, message="🚀 All characters already have portraits, skipping portrait generation."))
         return character_portraits_registry
 
 
@@ -498,30 +709,33 @@ class Script2VideoPipeline:
         os.makedirs(character_dir, exist_ok=True)
 
         front_portrait_path = os.path.join(character_dir, "front.png")
-        if os.path.exists(front_portrait_path):
+        if self.run_manifest.artifact_is_complete(front_portrait_path, stage="generate_character_portraits"):
             pass
         else:
             front_portrait_output = await self.character_portraits_generator.generate_front_portrait(character, style)
             front_portrait_output.save(front_portrait_path)
+            self.run_manifest.record_artifact(front_portrait_path, stage="generate_character_portraits")
 
 
         side_portrait_path = os.path.join(character_dir, "side.png")
-        if os.path.exists(side_portrait_path):
+        if self.run_manifest.artifact_is_complete(side_portrait_path, stage="generate_character_portraits"):
             pass
         else:
             side_portrait_output = await self.character_portraits_generator.generate_side_portrait(character, front_portrait_path)
             side_portrait_output.save(side_portrait_path)
+            self.run_manifest.record_artifact(side_portrait_path, stage="generate_character_portraits")
 
         back_portrait_path = os.path.join(character_dir, "back.png")
-        if os.path.exists(back_portrait_path):
+        if self.run_manifest.artifact_is_complete(back_portrait_path, stage="generate_character_portraits"):
             pass
         else:
             back_portrait_output = await self.character_portraits_generator.generate_back_portrait(character, front_portrait_path)
             back_portrait_output.save(back_portrait_path)
+            self.run_manifest.record_artifact(back_portrait_path, stage="generate_character_portraits")
 
         self.character_portrait_events[character.idx].set()
 
-        print(f"☑️ Completed character portrait generation for {character.identifier_in_scene}.")
+        self.event_bus.publish(StageProgress(stage="generate_character_portraits", attributes={"character": character.identifier_in_scene}, message=f"☑️ Completed character portrait generation for {character.identifier_in_scene}."))
 
         return {
             character.identifier_in_scene: {
@@ -548,23 +762,25 @@ class Script2VideoPipeline:
         characters: List[CharacterInScene],
         user_requirement: str,
     ):
-        storyboard_path = os.path.join(self.working_dir, "storyboard.json")
-        if os.path.exists(storyboard_path):
-            with open(storyboard_path, 'r', encoding='utf-8') as f:
-                storyboard = json.load(f)
+        storyboard = self.run_manifest.get_output("storyboard", stage="design_storyboard", legacy_path="storyboard.json")
+        if storyboard is not None:
             storyboard = [ShotBriefDescription.model_validate(shot) for shot in storyboard]
-            print(f"🚀 Loaded {len(storyboard)} shot brief descriptions from existing file.")
+            self.event_bus.publish(CacheHit(stage="design_storyboard", path=self.run_manifest.db_path, message=f"🚀 Loaded {len(storyboard)} shot brief descriptions from the run manifest."))
         else:
-            print(f"🔍 Designing storyboard...")
+            self.event_bus.publish(StageStarted(stage="design_storyboard", message=f"🔍 Designing storyboard..."))
             storyboard = await self.storyboard_artist.design_storyboard(
                 script=script,
                 characters=characters,
                 user_requirement=user_requirement,
                 retry_timeout=150,
             )
-            with open(storyboard_path, 'w', encoding='utf-8') as f:
-                json.dump([shot.model_dump() for shot in storyboard], f, ensure_ascii=False, indent=4)
-            print(f"✅ Designed storyboard and saved to {storyboard_path}.")
+            self.run_manifest.put_output(
+                "storyboard",
+                stage="design_storyboard",
+                data=[shot.model_dump() for shot in storyboard],
+                legacy_path="storyboard.json",
+            )
+            self.event_bus.publish(ArtifactReady(stage="design_storyboard", path=self.run_manifest.db_path, message=f"✅ Designed storyboard and saved to the run manifest."))
 
         for shot_brief_description in storyboard:
             self.shot_desc_events[shot_brief_description.idx] = asyncio.Event()
@@ -592,22 +808,32 @@ class Script2VideoPipeline:
         shot_brief_description: ShotBriefDescription,
         characters: List[CharacterInScene],
     ):
-        shot_description_path = os.path.join(self.working_dir, "shots", f"{shot_brief_description.idx}", "shot_description.json")
-        os.makedirs(os.path.dirname(shot_description_path), exist_ok=True)
-
-        if os.path.exists(shot_description_path):
-            with open(shot_description_path, 'r', encoding='utf-8') as f:
-                shot_description = ShotDescription.model_validate(json.load(f))
-            print(f"🚀 Loaded shot {shot_brief_description.idx} description from existing file.")
+        shot_idx = shot_brief_description.idx
+        os.makedirs(os.path.join(self.working_dir, "shots", f"{shot_idx}"), exist_ok=True)
+
+        shot_description = self.run_manifest.get_output(
+            f"shot_description/{shot_idx}",
+            stage="decompose_visual_descriptions",
+            shot_idx=shot_idx,
+            legacy_path=f"shots/{shot_idx}/shot_description.json",
+        )
+        if shot_description is not None:
+            shot_description = ShotDescription.model_validate(shot_description)
+            self.event_bus.publish(CacheHit(stage="decompose_visual_descriptions", path=self.run_manifest.db_path, attributes={"shot_idx": shot_idx}, message=f"🚀 Loaded shot {shot_idx} description from the run manifest."))
         else:
             shot_description = await self.storyboard_artist.decompose_visual_description(
                 shot_brief_desc=shot_brief_description,
                 characters=characters,
                 retry_timeout=120,
             )
-            with open(shot_description_path, 'w', encoding='utf-8') as f:
-                json.dump(shot_description.model_dump(), f, ensure_ascii=False, indent=4)
-            print(f"✅ Decomposed visual description for shot {shot_brief_description.idx} and saved to {shot_description_path}.")
+            self.run_manifest.put_output(
+                f"shot_description/{shot_idx}",
+                stage="decompose_visual_descriptions",
+                data=shot_description.model_dump(),
+                shot_idx=shot_idx,
+                legacy_path=f"shots/{shot_idx}/shot_description.json",
+            )
+            self.event_bus.publish(ArtifactReady(stage="decompose_visual_descriptions", path=self.run_manifest.db_path, attributes={"shot_idx": shot_idx}, message=f"✅ Decomposed visual description for shot {shot_idx} and saved to the run manifest."))
 
         self.shot_desc_events[shot_brief_description.idx].set()
 
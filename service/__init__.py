@@ -0,0 +1,6 @@
+from .app import PipelineService, create_app
+
+__all__ = [
+    "PipelineService",
+    "create_app",
+]
@@ -0,0 +1,371 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from jobs.queue import Job, JobQueue
+from jobs.worker import Worker
+from utils.event_bus import EventBus
+from utils.metrics import CONTENT_TYPE_LATEST, PipelineMetrics
+from utils.run_manifest import MANIFEST_FILE_NAME
+from utils.artifacts import is_temp_path
+
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+EVENTS_FILE_NAME = "events.jsonl"
+
+
+def artifact_stage(relative_path: str) -> Optional[str]:
+    """Map an artifact in a working_dir to the pipeline stage that produced it."""
+    parts = relative_path.split("/")
+    name = parts[-1]
+    if name == "story.txt":
+        return "develop_story"
+    if name == "script.json":
+        return "write_script"
+    if name == "characters.json":
+        return "extract_characters"
+    if "character_portraits" in parts[:-1] or name == "character_portraits_registry.json":
+        return "generate_character_portraits"
+    if name == "storyboard.json":
+        return "design_storyboard"
+    if name == "shot_description.json":
+        return "decompose_visual_descriptions"
+    if name == "camera_tree.json":
+        return "construct_camera_tree"
+    if name in ("first_frame.png", "last_frame.png"):
+        return "generate_frame"
+    if name == "video.mp4":
+        return "generate_video"
+    if name == "final_video.mp4":
+        return "concatenate_videos"
+    if name == MANIFEST_FILE_NAME:
+        return "run_manifest"
+    return None
+
+
+def list_artifacts(working_dir: str) -> Dict[str, Dict]:
+    """Return {relative_path: {"size", "mtime"}} for the finished files in the working_dir."""
+    artifacts = {}
+    if not os.path.isdir(working_dir):
+        return artifacts
+    for root, _, files in os.walk(working_dir):
+        for file in files:
+            if is_temp_path(file) or file.endswith(("-wal", "-shm", "-journal")) or file == EVENTS_FILE_NAME:
+                continue
+            path = os.path.join(root, file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            relative_path = os.path.relpath(path, working_dir).replace(os.sep, "/")
+            artifacts[relative_path] = {"size": stat.st_size, "mtime": stat.st_mtime}
+    return artifacts
+
+
+def read_events(path: str, offset: int) -> Tuple[List[Dict], int]:
+    """Read the complete lines appended to an events.jsonl since `offset`. Returns the events and the new offset."""
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return events, offset + end
+
+
+class PipelineService:
+    """
+    A long-running HTTP front-end for Idea2Video and Script2Video.
+
+    Jobs are stored in a JobQueue and run by in-process workers that share one warm pipeline per
+    pipeline type: the chat model, the generators (with their provider stats, circuit breakers and
+    connection pools) and the agents are built once and reused for every job, only the working_dir
+    changes. The workers run in their own event loop on a background thread, so the blocking calls of
+    the pipelines (video encoding, downloads, sqlite) do not stall the HTTP requests and event streams. Workers started with `main_jobs.py work` on the same queue can run jobs as well; the
+    progress stream only relies on the job record and the files in its working_dir, including the
+    events.jsonl the workers write the pipeline events of a job to.
+
+    Routes:
+        POST /jobs                                  submit a job: {"pipeline": ..., "params": {...}}
+        GET  /jobs                                  list jobs
+        GET  /jobs/{job_id}                         job status and its artifacts
+        POST /jobs/{job_id}/cancel                  cancel a job
+        GET  /jobs/{job_id}/events                  server-sent events with status changes, pipeline events and new artifacts
+        GET  /jobs/{job_id}/artifacts/{path}        download an artifact from the working_dir
+        GET  /metrics                               Prometheus metrics, if enabled
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        config_paths: Dict[str, str],
+        num_workers: int = 2,
+        scan_interval: float = 1.0,
+        keepalive_interval: float = 15.0,
+        worker_kwargs: Optional[Dict] = None,
+        metrics: Optional[PipelineMetrics] = None,
+    ):
+        """
+        Args:
+            config_paths:
+            The config file of every pipeline the service accepts, e.g. {"script2video": "configs/script2video.yaml"}.
+
+            num_workers:
+            The number of jobs run at the same time in this process. Set to 0 to leave running jobs to external workers.
+
+            scan_interval:
+            How often the event stream looks for status changes and new artifacts, in seconds.
+
+            metrics:
+            Served on /metrics, see utils.metrics.enable_metrics. The job queue is tracked by it.
+        """
+        self.queue = queue
+        self.config_paths = config_paths
+        self.num_workers = num_workers
+        self.scan_interval = scan_interval
+        self.keepalive_interval = keepalive_interval
+        self.worker_kwargs = worker_kwargs or {}
+        self.metrics = metrics
+        if self.metrics is not None:
+            self.metrics.track_job_queue(self.queue)
+
+        self.pipeline_templates = {}
+        self.worker_tasks: List[asyncio.Task] = []
+        self.worker_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.worker_thread: Optional[threading.Thread] = None
+
+
+    def get_pipeline_template(self, pipeline_name: str, config_path: str):
+        key = (pipeline_name, config_path)
+        if key not in self.pipeline_templates:
+            if pipeline_name == "idea2video":
+                from pipelines.idea2video_pipeline import Idea2VideoPipeline
+                self.pipeline_templates[key] = Idea2VideoPipeline.init_from_config(config_path=config_path)
+            elif pipeline_name == "script2video":
+                from pipelines.script2video_pipeline import Script2VideoPipeline
+                self.pipeline_templates[key] = Script2VideoPipeline.init_from_config(config_path=config_path)
+            else:
+                raise ValueError(f"Unknown pipeline: {pipeline_name}")
+        return self.pipeline_templates[key]
+
+
+    def build_pipeline(self, job: Job, event_bus: EventBus):
+        return self.get_pipeline_template(job.pipeline, job.config_path).with_working_dir(job.working_dir, event_bus=event_bus)
+
+
+    async def run_workers(self) -> None:
+        """Run the workers until they are cancelled. Runs in the worker loop, where the pipeline templates are built and used."""
+        for i in range(self.num_workers):
+            worker = Worker(
+                queue=self.queue,
+                worker_id=f"service-{os.getpid()}-{i}",
+                pipeline_factory=self.build_pipeline,
+                **self.worker_kwargs,
+            )
+            self.worker_tasks.append(asyncio.create_task(worker.run()))
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+
+
+    def _cancel_worker_tasks(self) -> None:
+        for task in self.worker_tasks:
+            task.cancel()
+
+
+    async def start_workers(self, app: web.Application) -> None:
+        if self.num_workers <= 0:
+            return
+        self.worker_loop = asyncio.new_event_loop()
+        self.worker_thread = threading.Thread(
+            target=self.worker_loop.run_until_complete,
+            args=(self.run_workers(),),
+            name="pipeline-workers",
+            daemon=True,
+        )
+        self.worker_thread.start()
+
+
+    async def stop_workers(self, app: web.Application) -> None:
+        if self.worker_thread is None:
+            return
+        # the workers stop their pipelines and put the running jobs back into the queue
+        self.worker_loop.call_soon_threadsafe(self._cancel_worker_tasks)
+        await asyncio.to_thread(self.worker_thread.join)
+        self.worker_loop.close()
+        self.worker_loop = None
+        self.worker_thread = None
+        self.worker_tasks = []
+
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post("/jobs", self.handle_submit),
+            web.get("/jobs", self.handle_list),
+            web.get("/jobs/{job_id}", self.handle_get),
+            web.post("/jobs/{job_id}/cancel", self.handle_cancel),
+            web.get("/jobs/{job_id}/events", self.handle_events),
+            web.get("/jobs/{job_id}/artifacts/{path:.+}", self.handle_artifact),
+            web.get("/metrics", self.handle_metrics),
+        ])
+        app.on_startup.append(self.start_workers)
+        app.on_cleanup.append(self.stop_workers)
+        return app
+
+
+    def _get_job_or_404(self, request: web.Request) -> Job:
+        job = self.queue.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(reason=f"Job {request.match_info['job_id']} not found")
+        return job
+
+
+    @staticmethod
+    def _artifact_url(job_id: str, relative_path: str) -> str:
+        return f"/jobs/{job_id}/artifacts/{relative_path}"
+
+
+    def _job_to_dict(self, job: Job) -> Dict:
+        data = job.model_dump(exclude={"params", "config_path"})
+        if job.result is not None:
+            data["result_url"] = self._artifact_url(job.id, os.path.relpath(job.result, job.working_dir).replace(os.sep, "/"))
+        return data
+
+
+    async def handle_submit(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(reason="The request body must be JSON")
+
+        pipeline_name = body.get("pipeline")
+        params = body.get("params")
+        if pipeline_name not in self.config_paths:
+            raise web.HTTPBadRequest(reason=f"Unknown pipeline: {pipeline_name}. Available: {list(self.config_paths)}")
+        if not isinstance(params, dict):
+            raise web.HTTPBadRequest(reason="'params' must be an object with the keyword arguments of the pipeline call")
+
+        job_id = self.queue.submit(pipeline=pipeline_name, config_path=self.config_paths[pipeline_name], params=params)
+        return web.json_response(self._job_to_dict(self.queue.get(job_id)), status=201)
+
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        status = request.query.get("status")
+        jobs = self.queue.list_jobs(status=status)
+        return web.json_response([self._job_to_dict(job) for job in jobs])
+
+
+    async def handle_get(self, request: web.Request) -> web.Response:
+        job = self._get_job_or_404(request)
+        artifacts = await asyncio.to_thread(list_artifacts, job.working_dir)
+        data = self._job_to_dict(job)
+        data["artifacts"] = [
+            {"path": path, "url": self._artifact_url(job.id, path), "stage": artifact_stage(path), **info}
+            for path, info in sorted(artifacts.items())
+        ]
+        return web.json_response(data)
+
+
+    async def handle_cancel(self, request: web.Request) -> web.Response:
+        job = self._get_job_or_404(request)
+        if not self.queue.cancel(job.id):
+            raise web.HTTPConflict(reason=f"Job {job.id} already finished")
+        return web.json_response(self._job_to_dict(self.queue.get(job.id)))
+
+
+    async def handle_artifact(self, request: web.Request) -> web.StreamResponse:
+        job = self._get_job_or_404(request)
+        working_dir = os.path.abspath(job.working_dir)
+        path = os.path.abspath(os.path.join(working_dir, request.match_info["path"]))
+        if not path.startswith(working_dir + os.sep) or not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        if self.metrics is None:
+            raise web.HTTPNotFound(reason="Metrics are not enabled")
+        body = await asyncio.to_thread(self.metrics.generate_latest)
+        return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+    async def handle_events(self, request: web.Request) -> web.StreamResponse:
+        """
+        Stream the progress of a job as server-sent events. On connect, the current status and all existing
+        artifacts are replayed, so a client that reconnects does not miss anything.
+
+        Events:
+            status      {"id", "status", "attempts", "error", "result_url", ...}
+            progress    a pipeline event, {"event_type", "stage", "message", "context", ...} (see utils.event_bus)
+            artifact    {"path", "url", "stage", "size", "mtime"}
+            end         sent once the job reached a terminal status, then the stream is closed
+        """
+        job = self._get_job_or_404(request)
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+        await response.prepare(request)
+
+        async def send(event: str, data: Dict) -> None:
+            await response.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        seen_artifacts = {}
+        events_offset = 0
+        last_status = None
+        loop = asyncio.get_running_loop()
+        last_write = loop.time()
+        try:
+            while True:
+                job = self.queue.get(job.id)
+                if job.status != last_status:
+                    await send("status", self._job_to_dict(job))
+                    last_status = job.status
+                    last_write = loop.time()
+
+                events, events_offset = await asyncio.to_thread(read_events, os.path.join(job.working_dir, EVENTS_FILE_NAME), events_offset)
+                for event in events:
+                    if event.get("event_type") == "ArtifactReady" and event.get("path"):
+                        event["url"] = self._artifact_url(job.id, os.path.relpath(event["path"], job.working_dir).replace(os.sep, "/"))
+                    await send("progress", event)
+                    last_write = loop.time()
+
+                artifacts = await asyncio.to_thread(list_artifacts, job.working_dir)
+                for path, info in sorted(artifacts.items()):
+                    if seen_artifacts.get(path) != info:
+                        seen_artifacts[path] = info
+                        await send("artifact", {"path": path, "url": self._artifact_url(job.id, path), "stage": artifact_stage(path), **info})
+                        last_write = loop.time()
+
+                if job.status in TERMINAL_STATUSES:
+                    await send("end", {"id": job.id, "status": job.status})
+                    break
+
+                if loop.time() - last_write > self.keepalive_interval:
+                    await response.write(b": keep-alive\n\n")
+                    last_write = loop.time()
+                await asyncio.sleep(self.scan_interval)
+        except ConnectionResetError:
+            logging.info(f"Event stream of job {job.id} closed by the client.")
+
+        return response
+
+
+def create_app(
+    db_path: str,
+    config_paths: Dict[str, str],
+    num_workers: int = 2,
+    **kwargs,
+) -> web.Application:
+    service = PipelineService(queue=JobQueue(db_path), config_paths=config_paths, num_workers=num_workers, **kwargs)
+    return service.create_app()
@@ -2,10 +2,15 @@
 from .image_generator_doubao_seedream_yunwu_api import ImageGeneratorDoubaoSeedreamYunwuAPI
 from .image_generator_nanobanana_google_api import ImageGeneratorNanobananaGoogleAPI
 from .image_generator_nanobanana_yunwu_api import ImageGeneratorNanobananaYunwuAPI
+from .image_generator_hedged import ImageGeneratorHedged
+from .image_generator_router import ImageGeneratorRouter
 
 
 # reranker for rag
+from .reranker_base import Reranker
 from .reranker_bge_silicon_api import RerankerBgeSiliconapi
+from .reranker_bm25_local import RerankerBM25Local
+from .reranker_cross_encoder_onnx import RerankerCrossEncoderOnnx
 
 
 # video generator
@@ -13,15 +18,22 @@ from .video_generator_doubao_seedance_yunwu_api import VideoGeneratorDoubaoSeeda
 from .video_generator_veo_google_api import VideoGeneratorVeoGoogleAPI
 from .video_generator_veo_yunwu_api import VideoGeneratorVeoYunwuAPI
 from .video_generator_doubao_seedance_official_api import VideoGeneratorDoubaoSeedanceOfficialAPI
+from .video_generator_router import VideoGeneratorRouter
 
 
 __all__ = [
     "ImageGeneratorDoubaoSeedreamYunwuAPI",
     "ImageGeneratorNanobananaGoogleAPI",
     "ImageGeneratorNanobananaYunwuAPI",
+    "ImageGeneratorHedged",
+    "ImageGeneratorRouter",
+    "Reranker",
     "RerankerBgeSiliconapi",
+    "RerankerBM25Local",
+    "RerankerCrossEncoderOnnx",
     "VideoGeneratorDoubaoSeedanceYunwuAPI",
     "VideoGeneratorVeoGoogleAPI",
     "VideoGeneratorVeoYunwuAPI",
     "VideoGeneratorDoubaoSeedanceOfficialAPI",
+    "VideoGeneratorRouter",
 ]
@@ -3,8 +3,9 @@
 import logging
 import aiohttp
 from typing import List, Optional
-from tenacity import retry, stop_after_attempt
+from tenacity import retry, stop_after_attempt, retry_if_not_exception_type
 from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError
 from utils.image import image_path_to_b64
 from interfaces.image_output import ImageOutput
 
@@ -19,9 +20,10 @@ class ImageGeneratorDoubaoSeedreamYunwuAPI:
         self.api_key = api_key
         self.base_url = "https://yunwu.ai/v1/images/generations"
         self.model = model
+        self.circuit_breaker = get_circuit_breaker(self.base_url)
 
 
-    @retry(stop=stop_after_attempt(3), after=after_func)
+    @retry(stop=stop_after_attempt(3), retry=retry_if_not_exception_type(CircuitBreakerOpenError), after=after_func)
     async def generate_single_image(
         self,
         prompt: str,
@@ -58,9 +60,10 @@ class ImageGeneratorDoubaoSeedreamYunwuAPI:
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.base_url, json=payload, headers=headers) as response:
-                    response_json = await response.json()
+            with self.circuit_breaker:
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(self.base_url, json=payload, headers=headers) as response:
+                        response_json = await response.json()
         except Exception as e:
             logging.error(f"Error occurred while generating image: {e}")
             raise e
@@ -0,0 +1,113 @@
+import time
+import asyncio
+import logging
+from typing import List, Optional, Union, Dict, Any
+from interfaces.image_output import ImageOutput
+from utils.config import init_from_class_path
+from utils.latency import LatencyTracker
+
+
+class ImageGeneratorHedged:
+    """
+    Hedged requests on top of one or two image generators.
+
+    The call goes to the primary generator first. If it has not returned after the
+    hedge delay (a percentile of the recently observed latencies), a duplicate call is
+    fired to the secondary generator (or to the primary again if no secondary is given).
+    Whichever returns first wins and the other call is cancelled.
+
+    The hedge budget bounds the extra spend: at most `hedge_budget` of all requests
+    (e.g. 0.1 -> 10%) may be duplicated.
+
+    Both generators can be given as instances or as {class_path, init_args} config items.
+    """
+
+    def __init__(
+        self,
+        primary: Union[Dict[str, Any], object],
+        secondary: Optional[Union[Dict[str, Any], object]] = None,
+        hedge_percentile: float = 95,
+        hedge_budget: float = 0.1,
+        min_samples: int = 10,
+        window_size: int = 100,
+        initial_hedge_delay: Optional[float] = None,
+    ):
+        self.primary = init_from_class_path(primary) if isinstance(primary, dict) else primary
+        if isinstance(secondary, dict):
+            secondary = init_from_class_path(secondary)
+        self.secondary = secondary
+
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.initial_hedge_delay = initial_hedge_delay
+        self.latency_tracker = LatencyTracker(window_size=window_size)
+
+        self.num_requests = 0
+        self.num_hedges = 0
+
+
+    def get_hedge_delay(self) -> Optional[float]:
+        if len(self.latency_tracker) < self.min_samples:
+            return self.initial_hedge_delay
+        return self.latency_tracker.percentile(self.hedge_percentile)
+
+
+    def can_hedge(self) -> bool:
+        return self.num_hedges < max(1, self.hedge_budget * self.num_requests)
+
+
+    async def _timed_call(
+        self,
+        image_generator,
+        record_latency: bool,
+        **kwargs,
+    ) -> ImageOutput:
+        start_time = time.monotonic()
+        try:
+            image_output = await image_generator.generate_single_image(**kwargs)
+        except asyncio.CancelledError:
+            # a primary is cancelled when it is slower than the hedge, so it took at least this long; dropping it
+            # would remove the slow tail and pull the hedge delay down; the lower bound keeps the estimate honest
+            if record_latency:
+                self.latency_tracker.record(time.monotonic() - start_time)
+            raise
+        if record_latency:
+            self.latency_tracker.record(time.monotonic() - start_time)
+        return image_output
+
+
+    async def generate_single_image(
+        self,
+        prompt: str,
+        reference_image_paths: List[str] = [],
+        **kwargs,
+    ) -> ImageOutput:
+        self.num_requests += 1
+        kwargs.update(prompt=prompt, reference_image_paths=reference_image_paths)
+
+        tasks = {asyncio.create_task(self._timed_call(self.primary, record_latency=True, **kwargs))}
+        try:
+            hedge_delay = self.get_hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done and self.can_hedge():
+                    self.num_hedges += 1
+                    hedge_generator = self.secondary if self.secondary is not None else self.primary
+                    logging.info(f"Image generation exceeded the hedge delay of {hedge_delay:.1f}s, firing a hedged request ({self.num_hedges}/{self.num_requests}).")
+                    tasks.add(asyncio.create_task(self._timed_call(hedge_generator, record_latency=False, **kwargs)))
+
+            last_exception = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_exception = task.exception()
+                    logging.warning(f"Hedged image generation call failed: {last_exception}")
+            raise last_exception
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -5,9 +5,10 @@ from PIL import Image
 from typing import List, Optional
 from google import genai
 from google.genai import types
-from tenacity import retry, stop_after_attempt
+from tenacity import retry, stop_after_attempt, retry_if_not_exception_type
 from interfaces.image_output import ImageOutput
 from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError
 
 
 class ImageGeneratorNanobananaGoogleAPI:
@@ -24,8 +25,9 @@ class ImageGeneratorNanobananaGoogleAPI:
                 api_version="v1beta",
             ),
         )
+        self.circuit_breaker = get_circuit_breaker(f"{base_url}/{self.model}")
 
-    @retry(stop=stop_after_attempt(3), after=after_func)
+    @retry(stop=stop_after_attempt(3), retry=retry_if_not_exception_type(CircuitBreakerOpenError), after=after_func)
     async def generate_single_image(
         self,
         prompt: str,
@@ -42,16 +44,17 @@ class ImageGeneratorNanobananaGoogleAPI:
 
         reference_images = [Image.open(path) for path in reference_image_paths]
 
-        response = await self.client.aio.models.generate_content(
-            model=self.model,
-            contents=reference_images + [prompt],
-            config=types.GenerateContentConfig(
-                response_modalities=["IMAGE"],
-                image_config=types.ImageConfig(
-                    aspect_ratio=aspect_ratio,
+        with self.circuit_breaker:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=reference_images + [prompt],
+                config=types.GenerateContentConfig(
+                    response_modalities=["IMAGE"],
+                    image_config=types.ImageConfig(
+                        aspect_ratio=aspect_ratio,
+                    ),
                 ),
-            ),
-        )
+            )
 
         image = None
         text = ""
@@ -0,0 +1,32 @@
+from typing import List, Dict, Any
+from interfaces.image_output import ImageOutput
+from utils.provider_router import ProviderRouter
+
+
+class ImageGeneratorRouter:
+    """
+    Composite image generator that load-balances over a weighted list of image generators
+    and fails over when one of them errors or degrades. See ProviderRouter for the policy.
+    """
+
+    def __init__(
+        self,
+        providers: List[Dict[str, Any]],
+        **router_kwargs,
+    ):
+        self.router = ProviderRouter(providers=providers, **router_kwargs)
+
+
+    async def generate_single_image(
+        self,
+        prompt: str,
+        reference_image_paths: List[str] = [],
+        **kwargs,
+    ) -> ImageOutput:
+        return await self.router.call(
+            "generate_single_image",
+            num_reference_images=len(reference_image_paths),
+            prompt=prompt,
+            reference_image_paths=reference_image_paths,
+            **kwargs,
+        )
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from utils.rerank_cache import RerankScoreCache
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Reranker:
+    """
+    The interface of the rerankers used for retrieval-augmented generation.
+
+    Subclasses must override `_score` (blocking, e.g. a model on the CPU, run in a thread) or `_ascore`
+    (async, e.g. an HTTP API), which score a batch of documents against one query; a subclass that overrides
+    neither is rejected when it is defined. The base class adds:
+    - a score cache keyed on (query hash, document hash), in memory and optionally in a SQLite database
+      (`cache_path`), so a chunk is scored against the same query only once, also across runs;
+    - `score_batch`/`rerank_batch`, which take many (query, documents) requests at once and send only the
+      uncached pairs to the backend, grouped by query;
+    - with `batch_window` > 0, coalescing of concurrent `score` calls arriving within the window into one
+      `score_batch`;
+    - the `__call__` signature shared by all rerankers.
+
+    Rerankers are picked in configs by class path (see utils.config.init_from_class_path), e.g.
+        rerank_model:
+          class_path: tools.RerankerBM25Local
+          init_args:
+            cache_path: .cache/rerank_scores.db
+    """
+
+    # scores at or above it count as relevant; depends on the score scale of the backend
+    relevance_threshold: float = 0.7
+
+    def __init__(
+        self,
+        cache_size: int = 100000,
+        relevance_threshold: Optional[float] = None,
+        cache_path: Optional[str] = None,
+        batch_window: float = 0.0,
+        max_batch_size: int = 256,
+        max_concurrency: int = 10,
+    ):
+        """
+        Args:
+            cache_size:
+            The number of (query, document) scores kept in memory. 0 disables the cache.
+
+            cache_path:
+            The SQLite database scores are persisted to. None keeps them in memory only.
+
+            batch_window:
+            Seconds a `score` call waits for other calls to join its batch. 0 disables coalescing.
+
+            max_batch_size:
+            The number of documents at which pending calls are flushed before the window ends.
+
+            max_concurrency:
+            The number of queries scored concurrently by the default `_ascore_batch`.
+        """
+        self.cache_size = cache_size
+        if relevance_threshold is not None:
+            self.relevance_threshold = relevance_threshold
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.persistent_cache = RerankScoreCache(cache_path) if cache_path else None
+
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self._pending: List[Tuple[str, List[str], asyncio.Future]] = []
+        self._pending_documents = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._early_flush_tasks = set()
+
+
+    @property
+    def cache_namespace(self) -> str:
+        """Identifies the scoring function in the persistent cache. Subclasses add the model and any parameter the scores depend on."""
+        return type(self).__name__
+
+
+    def enable_persistent_cache(self, cache_path: str) -> None:
+        """Persist scores to `cache_path` unless a cache was configured already."""
+        if self.persistent_cache is None:
+            self.persistent_cache = RerankScoreCache(cache_path)
+
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls._score is Reranker._score and cls._ascore is Reranker._ascore:
+            raise TypeError(f"{cls.__name__} must override _score or _ascore")
+
+
+    def _score(self, query: str, documents: List[str]) -> List[float]:
+        raise NotImplementedError
+
+
+    async def _ascore(self, query: str, documents: List[str]) -> List[float]:
+        return await asyncio.to_thread(self._score, query, documents)
+
+
+    async def _ascore_batch(self, requests: List[Tuple[str, List[str]]]) -> List[List[float]]:
+        """Score several queries, each against its own documents. Backends with a native batch API override it."""
+        sem = asyncio.Semaphore(self.max_concurrency)
+
+        async def score_one(query, documents):
+            async with sem:
+                return await self._ascore(query, documents)
+
+        return list(await asyncio.gather(*[score_one(query, documents) for query, documents in requests]))
+
+
+    def clear_cache(self) -> None:
+        """Clear the in-memory scores. Persisted scores are kept, as they are keyed by `cache_namespace`."""
+        with self._cache_lock:
+            self._cache.clear()
+
+
+    async def score_batch(self, requests: List[Tuple[str, List[str]]]) -> List[List[float]]:
+        """
+        Return the relevance scores of the documents of every (query, documents) request. Pairs found in the
+        memory or persistent cache are not scored again, and the remaining ones are deduplicated and scored
+        with one `_ascore_batch` call.
+        """
+        keys = [[(_digest(query), _digest(document)) for document in documents] for query, documents in requests]
+
+        found: Dict[Tuple[str, str], float] = {}
+        with self._cache_lock:
+            for request_keys in keys:
+                for key in request_keys:
+                    if key in self._cache:
+                        found[key] = self._cache[key]
+                        self._cache.move_to_end(key)
+
+        if self.persistent_cache is not None:
+            missing_keys = [key for request_keys in keys for key in request_keys if key not in found]
+            if missing_keys:
+                persisted = await asyncio.to_thread(self.persistent_cache.get_many, self.cache_namespace, missing_keys)
+                found.update(persisted)
+                self._remember(persisted)
+
+        # the uncached documents of every distinct query, each once
+        missing: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        for (query, documents), request_keys in zip(requests, keys):
+            for document, key in zip(documents, request_keys):
+                if key not in found:
+                    missing.setdefault(query, {})[document] = key
+
+        if missing:
+            missing_requests = [(query, list(documents)) for query, documents in missing.items()]
+            missing_scores = await self._ascore_batch(missing_requests)
+            scored = {}
+            for (query, documents), scores in zip(missing_requests, missing_scores):
+                for document, score in zip(documents, scores):
+                    scored[missing[query][document]] = score
+            found.update(scored)
+            self._remember(scored)
+            if self.persistent_cache is not None:
+                await asyncio.to_thread(self.persistent_cache.put_many, self.cache_namespace, scored)
+
+        return [[found[key] for key in request_keys] for request_keys in keys]
+
+
+    def _remember(self, scores: Dict[Tuple[str, str], float]) -> None:
+        if self.cache_size <= 0 or not scores:
+            return
+        with self._cache_lock:
+            self._cache.update(scores)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+    async def score(self, query: str, documents: List[str]) -> List[float]:
+        """Return the relevance score of every document for the query, scoring only those not cached."""
+        if self.batch_window <= 0:
+            return (await self.score_batch([(query, documents)]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, documents, future))
+        self._pending_documents += len(documents)
+        if self._pending_documents >= self.max_batch_size:
+            # the event loop only keeps weak references to tasks
+            task = asyncio.create_task(self._flush())
+            self._early_flush_tasks.add(task)
+            task.add_done_callback(self._early_flush_tasks.discard)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+        return await future
+
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.batch_window)
+        await self._flush()
+
+
+    async def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self._pending_documents = 0
+        if self._flush_task is asyncio.current_task():
+            self._flush_task = None
+        if not pending:
+            return
+
+        try:
+            results = await self.score_batch([(query, documents) for query, documents, _ in pending])
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), scores in zip(pending, results):
+            if not future.done():
+                future.set_result(scores)
+
+
+    async def rerank_batch(
+        self,
+        requests: List[Tuple[str, List[str]]],
+        top_n: int,
+    ) -> List[List[Tuple[str, float]]]:
+        """Like `__call__` for every (query, documents) request, scored with one `score_batch`."""
+        results = await self.score_batch(requests)
+        return [
+            sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)[:top_n]
+            for (_, documents), scores in zip(requests, results)
+        ]
+
+
+    async def __call__(
+        self,
+        documents: List[str],
+        query: str,
+        top_n: int,
+    ) -> List[Tuple[str, float]]:
+        """Return the `top_n` most relevant documents with their scores, most relevant first."""
+        if not documents:
+            return []
+        scores = await self.score(query, documents)
+        document_score_pairs = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)
+        return document_score_pairs[:top_n]
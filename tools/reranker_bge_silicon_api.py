@@ -1,43 +1,68 @@
-import requests
-from typing import List
+from typing import List, Optional
 import aiohttp
 import asyncio
 from tenacity import retry, stop_after_attempt
 import logging
+from tools.reranker_base import Reranker
 
 
-class RerankerBgeSiliconapi:
+class RerankerBgeSiliconapi(Reranker):
     def __init__(
         self,
         api_key: str,
         base_url: str,
         model: str = "BAAI/bge-reranker-v2-m3",
+        **kwargs,
     ):
+        super().__init__(**kwargs)
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
         # return_documents: bool = True,
 
+        # one connection pool for all requests of the instance, created in the event loop that uses it
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
+
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{type(self).__name__}:{self.model}"
+
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession()
+            self._session_loop = loop
+        return self._session
+
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
 
     @retry(
         stop=stop_after_attempt(3),
         after=lambda retry_state: logging.warning(f"Retrying SiliconReranker due to error: {retry_state.outcome.exception()}"),
     )
-    async def __call__(
+    async def _ascore(
         self,
-        documents: List[str],
         query: str,
-        top_n: int,
-    ) -> List[str]:
+        documents: List[str],
+    ) -> List[float]:
         
         url = f"{self.base_url}/rerank"
 
+        # every document is scored so that the scores can be cached; the top_n cut is done by Reranker.__call__
         payload = {
             "model": self.model,
             "query": query,
             "documents": documents,
-            "top_n": top_n,
-            "return_documents": True,
+            "top_n": len(documents),
+            "return_documents": False,
         }
 
 
@@ -47,9 +72,9 @@ class RerankerBgeSiliconapi:
             'Content-Type': 'application/json'
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as resp:
-                response = await resp.json()
+        async with self._get_session().post(url, json=payload, headers=headers) as resp:
+            resp.raise_for_status()
+            response = await resp.json()
 
 
         """
@@ -71,9 +96,9 @@ class RerankerBgeSiliconapi:
         } 
         """
 
-        results = []
+        scores = [0.0] * len(documents)
 
         for result in response["results"]:
-            results.append((result["document"]["text"], result["relevance_score"]))
+            scores[result["index"]] = result["relevance_score"]
 
-        return results
\ No newline at end of file
+        return scores
@@ -0,0 +1,114 @@
+import re
+import math
+import hashlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from tools.reranker_base import Reranker
+
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[\u3400-\u9fff\uf900-\ufaff]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words for alphabetic scripts; characters and character bigrams for Chinese, which has no spaces."""
+    tokens = []
+    for match in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(match):
+            tokens.extend(match)
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+    return tokens
+
+
+class RerankerBM25Local(Reranker):
+    """
+    A lexical reranker scoring documents with BM25. It needs no model files, no GPU and no network.
+
+    Scores are normalized to [0, 1) by the score of a document that matches every query term with an
+    unbounded term frequency, so they mean roughly "the weighted share of the query found in the document".
+    Without a corpus (see `fit`) every term has the same weight and document lengths are not normalized;
+    after fitting, term weights (IDF) and the average document length come from the corpus. Either way
+    the score of a (query, document) pair does not depend on the other documents of the batch.
+    """
+
+    relevance_threshold: float = 0.3
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        corpus: Optional[Iterable[str]] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            corpus:
+            The documents the term statistics are computed from, e.g. all chunks of the knowledge base. See `fit`.
+        """
+        super().__init__(**kwargs)
+        self.k1 = k1
+        self.b = b
+        self.idf: Dict[str, float] = {}
+        self.default_idf = 1.0
+        self.avg_document_length: Optional[float] = None
+        self.corpus_digest: Optional[str] = None
+        if corpus is not None:
+            self.fit(corpus)
+
+
+    @property
+    def cache_namespace(self) -> str:
+        # the scores depend on the term statistics, so every fitted corpus has its own namespace
+        return f"{type(self).__name__}:k1={self.k1}:b={self.b}:corpus={self.corpus_digest}"
+
+
+    def fit(self, corpus: Iterable[str]) -> "RerankerBM25Local":
+        """Compute the IDF of every term and the average document length over the corpus. Clears the score cache."""
+        document_frequencies = Counter()
+        num_documents = 0
+        total_length = 0
+        corpus_hash = hashlib.sha256()
+        for document in corpus:
+            corpus_hash.update(hashlib.sha256(document.encode("utf-8")).digest())
+            tokens = tokenize(document)
+            document_frequencies.update(set(tokens))
+            num_documents += 1
+            total_length += len(tokens)
+
+        self.idf = {
+            term: math.log(1 + (num_documents - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequencies.items()
+        }
+        # terms that never occur in the corpus are as rare as possible
+        self.default_idf = math.log(1 + (num_documents + 0.5) / 0.5) if num_documents else 1.0
+        self.avg_document_length = total_length / num_documents if num_documents else None
+        self.corpus_digest = corpus_hash.hexdigest()[:16]
+        self.clear_cache()
+        return self
+
+
+    def _score(self, query: str, documents: List[str]) -> List[float]:
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return [0.0] * len(documents)
+
+        weights = [self.idf.get(term, self.default_idf) if self.idf else 1.0 for term in query_terms]
+        max_score = sum(weight * (self.k1 + 1) for weight in weights)
+
+        scores = []
+        for document in documents:
+            tokens = tokenize(document)
+            term_frequencies = Counter(tokens)
+            if self.avg_document_length:
+                length_norm = 1 - self.b + self.b * len(tokens) / self.avg_document_length
+            else:
+                length_norm = 1.0
+            score = 0.0
+            for term, weight in zip(query_terms, weights):
+                tf = term_frequencies.get(term, 0)
+                if tf:
+                    score += weight * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+            scores.append(min(score / max_score, 1.0))
+        return scores
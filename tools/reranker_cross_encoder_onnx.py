@@ -0,0 +1,115 @@
+import os
+import logging
+import numpy as np
+from typing import Iterable, List, Optional
+from tools.reranker_base import Reranker
+from tools.reranker_bm25_local import RerankerBM25Local
+
+
+class RerankerCrossEncoderOnnx(Reranker):
+    """
+    A cross-encoder reranker (e.g. BAAI/bge-reranker-v2-m3 or a MiniLM cross-encoder exported to ONNX) run
+    locally with onnxruntime on the CPU.
+
+    `model_dir` must contain `model.onnx` and the `tokenizer.json` of the model, e.g. as written by
+    `optimum-cli export onnx --task text-classification`. Nothing is downloaded. Requires onnxruntime and
+    tokenizers (`pip install onnxruntime tokenizers`); if they or the model files are missing, the reranker
+    falls back to BM25 scoring (RerankerBM25Local) with a warning unless `fallback_to_bm25` is False.
+
+    Scores are the sigmoid of the model logits, on the same [0, 1] scale as the hosted bge reranker.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        max_length: int = 512,
+        batch_size: int = 16,
+        num_threads: Optional[int] = None,
+        fallback_to_bm25: bool = True,
+        **kwargs,
+    ):
+        """
+        Args:
+            batch_size:
+            The number of (query, document) pairs run through the model at once.
+
+            num_threads:
+            The intra-op threads of onnxruntime. Defaults to onnxruntime's choice (all physical cores).
+        """
+        super().__init__(**kwargs)
+        self.model_dir = model_dir
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+        self.session = None
+        self.tokenizer = None
+        self.fallback = None
+        try:
+            self._load_model(num_threads)
+        except (ImportError, FileNotFoundError) as e:
+            if not fallback_to_bm25:
+                raise
+            logging.warning(f"Cross-encoder in {model_dir} is not available ({e}), falling back to BM25 reranking.")
+            self.fallback = RerankerBM25Local(cache_size=0)
+            self.relevance_threshold = self.fallback.relevance_threshold
+
+
+    @property
+    def cache_namespace(self) -> str:
+        if self.fallback is not None:
+            return self.fallback.cache_namespace
+        return f"{type(self).__name__}:{os.path.abspath(self.model_dir)}:max_length={self.max_length}"
+
+
+    def fit(self, corpus: Iterable[str]) -> "RerankerCrossEncoderOnnx":
+        """Fit the BM25 fallback on the corpus, if the reranker fell back to it. The cross-encoder needs no fitting."""
+        if self.fallback is not None:
+            self.fallback.fit(corpus)
+            # the cached scores were computed with the fallback's previous corpus statistics
+            self.clear_cache()
+        return self
+
+
+    def _load_model(self, num_threads: Optional[int]) -> None:
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(self.model_dir, "model.onnx")
+        tokenizer_path = os.path.join(self.model_dir, "tokenizer.json")
+        for path in (model_path, tokenizer_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+
+    def _score(self, query: str, documents: List[str]) -> List[float]:
+        if self.fallback is not None:
+            return self.fallback._score(query, documents)
+
+        scores = []
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([(query, document) for document in batch])
+            inputs = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            }
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+            logits = self.session.run(None, inputs)[0]
+            if logits.ndim == 2 and logits.shape[1] == 2:
+                # two-class heads: the sigmoid of the logit difference is the softmax probability of the positive class
+                logits = logits[:, 1] - logits[:, 0]
+            elif logits.ndim == 2:
+                logits = logits[:, 0]
+            scores.extend((1 / (1 + np.exp(-logits))).tolist())
+        return scores
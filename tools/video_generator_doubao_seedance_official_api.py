@@ -3,8 +3,12 @@ from typing import List, Literal
 import asyncio
 import aiohttp
 
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
+
 from interfaces.video_output import VideoOutput
 from utils.image import image_path_to_b64
+from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError, EndpointHTTPError
 
 
 class VideoGeneratorDoubaoSeedanceOfficialAPI:
@@ -31,13 +35,23 @@ class VideoGeneratorDoubaoSeedanceOfficialAPI:
         ff2v_model: str = "doubao-seedance-1-0-pro-fast-251015",
         flf2v_model: str = "doubao-seedance-1-0-pro-fast-251015",
         base_url: str = "https://ark.cn-beijing.volces.com/api/v3/contents/generations",
+        max_query_errors: int = 10,
     ):
         self.api_key = api_key
         self.t2v_model = t2v_model
         self.ff2v_model = ff2v_model
         self.flf2v_model = flf2v_model
         self.base_url = base_url.rstrip("/")
+        self.max_query_errors = max_query_errors
+        self.circuit_breaker = get_circuit_breaker(self.base_url)
 
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, max=30),
+        retry=retry_if_not_exception_type(CircuitBreakerOpenError),
+        after=after_func,
+        reraise=True,
+    )
     async def create_video_generation_task(
         self,
         prompt: str,
@@ -121,31 +135,30 @@ class VideoGeneratorDoubaoSeedanceOfficialAPI:
         }
 
         url = f"{self.base_url}/tasks"
-        while True:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    last_err_text = None
-                    for attempt_payload in candidate_payloads:
-                        async with session.post(url, headers=headers, json=attempt_payload) as resp:
-                            if 200 <= resp.status < 300:
-                                response_json = await resp.json()
-                                task_id = response_json.get("id")
-                                if not task_id:
-                                    logging.error(f"Unexpected response (missing id): {response_json}")
-                                    raise ValueError("Failed to create video task: missing id")
-                                logging.info(f"Video generation task created successfully. Task ID: {task_id}")
-                                return task_id
-                            else:
-                                text = await resp.text()
-                                last_err_text = f"HTTP {resp.status} body={text}"
-                                logging.error(f"Ark task create failed with payload size {len(attempt_payload.get('content', []))}: {last_err_text}")
-                                # Try next simplified payload
-                                continue
-                    # All candidates failed this round; raise to trigger retry sleep
-                    raise RuntimeError(f"Ark task create failed for all payload variants. Last error: {last_err_text}")
-            except Exception as e:
-                logging.error(f"Error creating Ark video task: {e}. Retrying in 1s...")
-                await asyncio.sleep(1)
+        with self.circuit_breaker:
+            async with aiohttp.ClientSession() as session:
+                last_err_text = None
+                last_status = None
+                for attempt_payload in candidate_payloads:
+                    async with session.post(url, headers=headers, json=attempt_payload) as resp:
+                        if 200 <= resp.status < 300:
+                            response_json = await resp.json()
+                            task_id = response_json.get("id")
+                            if not task_id:
+                                logging.error(f"Unexpected response (missing id): {response_json}")
+                                raise ValueError("Failed to create video task: missing id")
+                            logging.info(f"Video generation task created successfully. Task ID: {task_id}")
+                            return task_id
+                        else:
+                            text = await resp.text()
+                            last_err_text = f"HTTP {resp.status} body={text}"
+                            last_status = resp.status
+                            logging.error(f"Ark task create failed with payload size {len(attempt_payload.get('content', []))}: {last_err_text}")
+                            # Try next simplified payload
+                            continue
+                # All candidates failed this round; raise to trigger a retry with backoff
+                # (the status decides whether the circuit breaker counts it against the endpoint)
+                raise EndpointHTTPError(last_status, f"Ark task create failed for all payload variants. Last error: {last_err_text}")
 
     async def query_video_generation_task(self, task_id: str) -> str:
         """
@@ -157,13 +170,25 @@ class VideoGeneratorDoubaoSeedanceOfficialAPI:
         }
         url = f"{self.base_url}/tasks/{task_id}"
 
+        num_query_errors = 0
         while True:
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, headers=headers) as resp:
-                        resp.raise_for_status()
-                        response_json = await resp.json()
+                with self.circuit_breaker:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.get(url, headers=headers) as resp:
+                            resp.raise_for_status()
+                            response_json = await resp.json()
+                num_query_errors = 0
+            except CircuitBreakerOpenError as e:
+                # the task keeps running on the provider side; wait for the endpoint instead of giving it up
+                logging.warning(f"{e}. Polling task {task_id} again then.")
+                await asyncio.sleep(max(e.retry_after, 2))
+                continue
             except Exception as e:
+                num_query_errors += 1
+                if num_query_errors >= self.max_query_errors:
+                    logging.error(f"Error querying Ark video task {task_id}: {e}. Giving up after {num_query_errors} consecutive errors.")
+                    raise
                 logging.error(f"Error querying Ark video task: {e}. Retrying in 2s...")
                 await asyncio.sleep(2)
                 continue
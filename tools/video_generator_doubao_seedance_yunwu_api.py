@@ -2,8 +2,11 @@ import logging
 from typing import List, Literal
 import asyncio
 import aiohttp
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
 from interfaces.video_output import VideoOutput
 from utils.image import image_path_to_b64
+from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError
 
 
 class VideoGeneratorDoubaoSeedanceYunwuAPI:
@@ -13,13 +16,23 @@ class VideoGeneratorDoubaoSeedanceYunwuAPI:
         t2v_model: str = "doubao-seedance-1-0-lite-t2v-250428",
         ff2v_model: str = "doubao-seedance-1-0-lite-i2v-250428",
         flf2v_model: str = "doubao-seedance-1-0-lite-i2v-250428",
+        max_query_errors: int = 10,
     ):
         self.api_key = api_key
         self.t2v_model = t2v_model
         self.ff2v_model = ff2v_model
         self.flf2v_model = flf2v_model
+        self.max_query_errors = max_query_errors
+        self.circuit_breaker = get_circuit_breaker("https://yunwu.ai/volc/v1/contents/generations")
 
 
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, max=30),
+        retry=retry_if_not_exception_type(CircuitBreakerOpenError),
+        after=after_func,
+        reraise=True,
+    )
     async def create_video_generation_task(
         self,
         prompt: str,
@@ -90,18 +103,12 @@ class VideoGeneratorDoubaoSeedanceYunwuAPI:
             'Content-Type': 'application/json'
         }
 
-        while True:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(url, headers=headers, json=payload) as response:
-                        response_json = await response.json()
-                        logging.debug(f"Response: {response_json}")
-                        task_id = response_json["id"]
-            except Exception as e:
-                logging.error(f"Error occurred while creating video generation task.\nRetrying in 1 seconds...")
-                await asyncio.sleep(1)
-                continue
-            break
+        with self.circuit_breaker:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, headers=headers, json=payload) as response:
+                    response_json = await response.json()
+                    logging.debug(f"Response: {response_json}")
+                    task_id = response_json["id"]
 
         logging.info(f"Video generation task created successfully. Task ID: {task_id}")
         return task_id
@@ -124,13 +131,25 @@ class VideoGeneratorDoubaoSeedanceYunwuAPI:
             'Authorization': f'Bearer {self.api_key}',
         }
 
+        num_query_errors = 0
         while True:
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, headers=headers) as response:
-                        response_json = await response.json()
-
+                with self.circuit_breaker:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.get(url, headers=headers) as response:
+                            response_json = await response.json()
+                num_query_errors = 0
+
+            except CircuitBreakerOpenError as e:
+                # the task keeps running on the provider side; wait for the endpoint instead of giving it up
+                logging.warning(f"{e}. Polling task {task_id} again then.")
+                await asyncio.sleep(max(e.retry_after, 2))
+                continue
             except Exception as e:
+                num_query_errors += 1
+                if num_query_errors >= self.max_query_errors:
+                    logging.error(f"Error occurred while querying video generation task: {e}. Giving up after {num_query_errors} consecutive errors.")
+                    raise
                 logging.error(f"Error occurred while querying video generation task: {e}. Retrying in 1 seconds...")
                 await asyncio.sleep(1)
                 continue
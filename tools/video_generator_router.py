@@ -0,0 +1,35 @@
+from typing import List, Dict, Any
+from interfaces.video_output import VideoOutput
+from utils.provider_router import ProviderRouter
+
+
+class VideoGeneratorRouter:
+    """
+    Composite video generator that load-balances over a weighted list of video generators
+    and fails over when one of them errors or degrades. See ProviderRouter for the policy.
+
+    Set `max_reference_images` on a provider (0, 1 or 2) to keep first/last-frame requests
+    away from models that cannot take them.
+    """
+
+    def __init__(
+        self,
+        providers: List[Dict[str, Any]],
+        **router_kwargs,
+    ):
+        self.router = ProviderRouter(providers=providers, **router_kwargs)
+
+
+    async def generate_single_video(
+        self,
+        prompt: str,
+        reference_image_paths: List[str] = [],
+        **kwargs,
+    ) -> VideoOutput:
+        return await self.router.call(
+            "generate_single_video",
+            num_reference_images=len(reference_image_paths),
+            prompt=prompt,
+            reference_image_paths=reference_image_paths,
+            **kwargs,
+        )
@@ -3,8 +3,11 @@ from typing import List, Optional
 from PIL import Image
 import asyncio
 import aiohttp
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
 from interfaces.video_output import VideoOutput
 from utils.image import image_path_to_b64
+from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError
 
 
 class VideoGeneratorVeoYunwuAPI:
@@ -14,6 +17,7 @@ class VideoGeneratorVeoYunwuAPI:
         t2v_model: str = "veo3.1-fast",  # text to video
         ff2v_model: str = "veo3.1-fast",   # first frame to video
         flf2v_model: str = "veo2-fast-frames",  # first and last frame to video
+        max_query_errors: int = 10,
     ):
         """
         all models:
@@ -36,26 +40,23 @@ class VideoGeneratorVeoYunwuAPI:
         self.t2v_model = t2v_model
         self.ff2v_model = ff2v_model
         self.flf2v_model = flf2v_model
+        self.max_query_errors = max_query_errors
+        self.circuit_breaker = get_circuit_breaker(f"{self.base_url}/v1/video")
 
-    async def generate_single_video(
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, max=30),
+        retry=retry_if_not_exception_type(CircuitBreakerOpenError),
+        after=after_func,
+        reraise=True,
+    )
+    async def create_video_generation_task(
         self,
-        prompt: str = "",
-        reference_image_paths: List[Image.Image] = [],
+        model: str,
+        prompt: str,
+        reference_image_paths: List[str],
         aspect_ratio: str = "16:9",
-        **kwargs,
-    ) -> VideoOutput:
-        if len(reference_image_paths) == 0:
-            model = self.t2v_model
-        elif len(reference_image_paths) == 1:
-            model = self.ff2v_model
-        elif len(reference_image_paths) == 2:
-            model = self.flf2v_model
-        else:
-            raise ValueError("The number of reference images must be no more than 2")
-
-        logging.info(f"Calling {model} to generate video...")
-
-        # 1. Create video generation task
+    ) -> str:
         payload = {
             "prompt": prompt,
             "model": model,
@@ -72,49 +73,83 @@ class VideoGeneratorVeoYunwuAPI:
             "Content-Type": "application/json",
         }
 
-
-        url = f"https://yunwu.ai/v1/video/create"
-        while True:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(url, headers=headers, json=payload) as response:
-                        response = await response.json()
-                        logging.debug(f"Response: {response}")
-                        task_id = response["id"]
-                        logging.info(f"Video generation task created successfully. Task ID: {task_id}")
-            except Exception as e:
-                logging.error(f"Error occurred while creating video generation task: {e}. Retrying in 1 second...")
-                await asyncio.sleep(1)
-                continue
-            break
+        url = f"{self.base_url}/v1/video/create"
+        with self.circuit_breaker:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, headers=headers, json=payload) as response:
+                    response = await response.json()
+                    logging.debug(f"Response: {response}")
+                    task_id = response["id"]
+        logging.info(f"Video generation task created successfully. Task ID: {task_id}")
+        return task_id
 
 
-        # 2. Query the video generation task until the video generation is completed
+    async def query_video_generation_task(
+        self,
+        task_id: str,
+    ) -> str:
         headers = {
             'Accept': 'application/json',
             'Authorization': f'Bearer {self.api_key}',
         }
 
+        num_query_errors = 0
         while True:
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"{self.base_url}/v1/video/query?id={task_id}", headers=headers) as response:
-                        payload = await response.json()
-                        logging.debug(f"Response: {payload}")
-                        status = payload["status"]
+                with self.circuit_breaker:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.get(f"{self.base_url}/v1/video/query?id={task_id}", headers=headers) as response:
+                            payload = await response.json()
+                            logging.debug(f"Response: {payload}")
+                            status = payload["status"]
+                num_query_errors = 0
+            except CircuitBreakerOpenError as e:
+                # the task keeps running on the provider side; wait for the endpoint instead of giving it up
+                logging.warning(f"{e}. Polling task {task_id} again then.")
+                await asyncio.sleep(max(e.retry_after, 2))
+                continue
             except Exception as e:
+                num_query_errors += 1
+                if num_query_errors >= self.max_query_errors:
+                    logging.error(f"Error occurred while querying video generation task: {e}. Giving up after {num_query_errors} consecutive errors.")
+                    raise
                 logging.error(f"Error occurred while querying video generation task: {e}. Retrying in 1 second...")
                 await asyncio.sleep(1)
                 continue
 
             if status == "completed":
                 logging.info(f"Video generation completed successfully")
-                video_url = payload["video_url"]
-                return VideoOutput(fmt="url", ext="mp4", data=video_url)
+                return payload["video_url"]
             elif status == "failed":
                 logging.error(f"Video generation failed: \n{payload}")
-                break
+                raise ValueError("Video generation failed.")
             else:
                 logging.info(f"Video generation status: {status}, waiting 1 second...")
                 await asyncio.sleep(1)
                 continue
+
+
+    async def generate_single_video(
+        self,
+        prompt: str = "",
+        reference_image_paths: List[Image.Image] = [],
+        aspect_ratio: str = "16:9",
+        **kwargs,
+    ) -> VideoOutput:
+        if len(reference_image_paths) == 0:
+            model = self.t2v_model
+        elif len(reference_image_paths) == 1:
+            model = self.ff2v_model
+        elif len(reference_image_paths) == 2:
+            model = self.flf2v_model
+        else:
+            raise ValueError("The number of reference images must be no more than 2")
+
+        logging.info(f"Calling {model} to generate video...")
+
+        # 1. Create video generation task
+        task_id = await self.create_video_generation_task(model, prompt, reference_image_paths, aspect_ratio)
+
+        # 2. Query the video generation task until the video generation is completed
+        video_url = await self.query_video_generation_task(task_id)
+        return VideoOutput(fmt="url", ext="mp4", data=video_url)
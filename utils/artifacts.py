@@ -0,0 +1,174 @@
+import os
+import json
+import uuid
+import struct
+import shutil
+import logging
+from contextlib import contextmanager
+from PIL import Image
+
+
+TEMP_MARKER = ".tmp"
+
+
+def temp_path_for(path: str) -> str:
+    """
+    A unique temporary path next to `path`, e.g. 'video.3f2a9c1d.tmp.mp4' for 'video.mp4'. The extension is
+    kept so that writers which pick the format from it (PIL, cv2, moviepy) still work.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{uuid.uuid4().hex[:8]}{TEMP_MARKER}{ext}"
+
+
+def is_temp_path(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(TEMP_MARKER) or f"{TEMP_MARKER}." in name
+
+
+def _fsync_dir(dir_path: str) -> None:
+    # makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_path(path: str):
+    """
+    Yield a temporary path to write `path` through. When the block succeeds, the temporary file is fsynced
+    and renamed to `path`, so `path` either does not exist or is complete. On failure it is removed.
+
+    Usage:
+        with atomic_path(save_path) as tmp_path:
+            image.save(tmp_path)
+    """
+    dir_path = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dir_path, exist_ok=True)
+    tmp_path = temp_path_for(path)
+    try:
+        yield tmp_path
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(dir_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = "wb", **kwargs):
+    """Like open(path, mode) for writing, but through atomic_path."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            f.flush()
+
+
+def link_artifact(src: str, dst: str) -> None:
+    """
+    Make `dst` a hardlink of `src`, replacing `dst` atomically if it exists. Where hardlinks are not
+    possible (another filesystem, or no support for them) `dst` is an atomic copy instead. Linked files
+    share their content, so they must not be modified in place.
+    """
+    dir_path = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(dir_path, exist_ok=True)
+    tmp_path = temp_path_for(dst)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        with atomic_path(dst) as tmp_copy_path:
+            shutil.copyfile(src, tmp_copy_path)
+        return
+    try:
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _mp4_is_complete(path: str) -> bool:
+    # walk the top-level boxes: a truncated file ends inside a box, and a file cut before its moov has none
+    size = os.path.getsize(path)
+    box_types = set()
+    offset = 0
+    with open(path, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            box_size, box_type = struct.unpack(">I4s", header)
+            if box_size == 1:
+                large_size = f.read(8)
+                if len(large_size) < 8:
+                    return False
+                box_size = struct.unpack(">Q", large_size)[0]
+            elif box_size == 0:
+                # the last box extends to the end of the file
+                box_size = size - offset
+            if box_size < 8:
+                return False
+            box_types.add(box_type)
+            offset += box_size
+    return offset == size and b"moov" in box_types
+
+
+def _image_is_complete(path: str) -> bool:
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        if ext == ".png":
+            f.seek(-12, os.SEEK_END)
+            return f.read(12)[4:8] == b"IEND"
+        if ext in (".jpg", ".jpeg"):
+            f.seek(-2, os.SEEK_END)
+            return f.read(2) == b"\xff\xd9"
+    with Image.open(path) as image:
+        image.verify()
+    return True
+
+
+def validate_artifact(path: str) -> bool:
+    """
+    A fast structural check that a file was written completely, without decoding it: the trailer of a
+    PNG/JPEG image and the box structure of an MP4 video. Other files only have to be non-empty.
+    """
+    try:
+        if os.path.getsize(path) == 0:
+            return False
+        ext = os.path.splitext(path)[1].lower()
+        if ext in (".mp4", ".mov", ".m4v"):
+            return _mp4_is_complete(path)
+        if ext in (".png", ".jpg", ".jpeg", ".webp", ".bmp"):
+            return _image_is_complete(path)
+        return True
+    except Exception as e:
+        logging.warning(f"Failed to validate {path}: {e}")
+        return False
+
+
+def prepare_checkpoint_dir(checkpoint_dir: str, inputs_digest: str) -> None:
+    """
+    Make `checkpoint_dir` a directory of checkpoints of the inputs with `inputs_digest`. The digest is recorded in
+    checkpoint_dir/inputs.json; checkpoints recorded for other inputs, or without a digest, are removed, so a
+    resumed computation never reuses the intermediate results of different inputs.
+    """
+    inputs_path = os.path.join(checkpoint_dir, "inputs.json")
+    if os.path.exists(checkpoint_dir):
+        recorded_digest = None
+        if os.path.exists(inputs_path) and validate_artifact(inputs_path):
+            with open(inputs_path, "r", encoding="utf-8") as f:
+                recorded_digest = json.load(f).get("digest")
+        if recorded_digest == inputs_digest:
+            return
+        logging.warning(f"The checkpoints in {checkpoint_dir} are of other inputs, discarding them.")
+        shutil.rmtree(checkpoint_dir)
+    with atomic_open(inputs_path, "w", encoding="utf-8") as f:
+        json.dump({"digest": inputs_digest}, f)
@@ -0,0 +1,207 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from typing import Dict, Optional, Tuple
+from utils.event_bus import ProviderLatency, publish_event
+
+
+# start times of the calls currently inside a breaker, per task (breakers are shared by concurrent calls)
+_call_start_times: contextvars.ContextVar[Tuple[float, ...]] = contextvars.ContextVar("circuit_breaker_call_start_times", default=())
+
+
+class CircuitBreakerOpenError(RuntimeError):
+    """Raised instead of calling an endpoint whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker for {name} is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class EndpointHTTPError(RuntimeError):
+    """An error response of an endpoint, for the calls that check the status themselves."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    # aiohttp.ClientResponseError and EndpointHTTPError have `status`, httpx/openai errors `status_code`,
+    # requests.HTTPError has it on its `response`, google api errors have `code`
+    for attr in ("status", "status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and not isinstance(value, bool) and 100 <= value < 600:
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    return None
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    Whether `error` means the endpoint is unhealthy: a timeout, a connection error or a 5xx response.
+    Errors of the request itself (4xx, content policy, a malformed response) say nothing about the endpoint.
+    """
+    if isinstance(error, CircuitBreakerOpenError):
+        return False
+    status = _status_of(error)
+    if status is not None:
+        return status >= 500
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    try:
+        import aiohttp
+        if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+            return True
+    except ImportError:
+        pass
+    try:
+        import requests
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    closed:    calls go through; `failure_threshold` consecutive failures open the circuit. Only timeouts,
+               connection errors and 5xx responses are failures (see is_endpoint_failure); other
+               errors count as neither a failure nor a success.
+    open:      calls fail fast with CircuitBreakerOpenError for `recovery_timeout` seconds.
+    half_open: up to `half_open_max_calls` probe calls go through; a success closes the
+               circuit, a failure opens it again.
+
+    Usage:
+        with breaker:
+            await call_the_endpoint()
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+        self.last_error: Optional[BaseException] = None
+        self.in_flight = 0
+
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe call through (0 if calls are allowed now)."""
+        with self._lock:
+            if self._current_state() != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+        raise CircuitBreakerOpenError(self.name, self.retry_after())
+
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info(f"Circuit breaker for {self.name} closed.")
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._half_open_calls = 0
+
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.last_error = error
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                logging.error(f"Circuit breaker for {self.name} opened after {self._consecutive_failures} consecutive failures. Last error: {error}")
+
+
+    def __enter__(self):
+        self.before_call()
+        _call_start_times.set(_call_start_times.get() + (time.monotonic(),))
+        with self._lock:
+            self.in_flight += 1
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._lock:
+            self.in_flight -= 1
+        start_times = _call_start_times.get()
+        if start_times:
+            _call_start_times.set(start_times[:-1])
+            publish_event(ProviderLatency(provider=self.name, duration=time.monotonic() - start_times[-1], success=exc_type is None))
+
+        if exc_type is None:
+            self.record_success()
+        elif isinstance(exc_val, Exception) and is_endpoint_failure(exc_val):
+            self.record_failure(exc_val)
+        elif self._state == self.HALF_OPEN:
+            # the probe was cancelled or failed for its own reasons, give the slot back
+            with self._lock:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+        return False
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for an endpoint, creating it on first use."""
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name=name, **kwargs)
+        return _circuit_breakers[name]
+
+
+def get_all_circuit_breakers() -> Dict[str, CircuitBreaker]:
+    with _circuit_breakers_lock:
+        return dict(_circuit_breakers)
@@ -0,0 +1,10 @@
+import importlib
+from typing import Any, Dict
+
+
+def init_from_class_path(config: Dict[str, Any]):
+    """Instantiate an object from a config item of the form ``{"class_path": ..., "init_args": {...}}``."""
+    module_name, cls_name = config["class_path"].rsplit(".", 1)
+    cls = getattr(importlib.import_module(module_name), cls_name)
+    init_args = config.get("init_args") or {}
+    return cls(**init_args)
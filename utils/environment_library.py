@@ -0,0 +1,94 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from interfaces.environment import EnvironmentInScene
+from utils.artifacts import atomic_open, link_artifact, validate_artifact
+
+
+def normalize_slugline(slugline: str) -> str:
+    """
+    The key of a location: the slugline in upper case, with the dash and whitespace variants written by the
+    model unified, e.g. 'int.  Coffee shop – night' and 'INT. COFFEE SHOP - NIGHT' share a key.
+    """
+    slugline = slugline.upper().replace("–", "-").replace("—", "-")
+    slugline = re.sub(r"\s*-\s*", " - ", slugline)
+    slugline = re.sub(r"\s+", " ", slugline)
+    return slugline.strip(" .-")
+
+
+class EnvironmentLibrary:
+    """
+    Establishing images ("plates") of the locations of a story, keyed by normalized slugline, so that later
+    scenes at a location are generated with a reference of how it looked before.
+
+    The images are hardlinked into `root_dir` and listed in `root_dir/environment_library.json`, so the
+    library survives reruns and the scene working_dirs they come from may be cleaned up.
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+    ):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.index_path = os.path.join(self.root_dir, "environment_library.json")
+        self._lock = threading.Lock()
+
+        self.plates: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.plates = json.load(f)
+            # plates whose image is missing or truncated are generated again
+            self.plates = {
+                key: plate for key, plate in self.plates.items()
+                if os.path.exists(plate["path"]) and validate_artifact(plate["path"])
+            }
+
+
+    def get(self, environment: EnvironmentInScene) -> Optional[Dict[str, str]]:
+        """The plate of the location of `environment` ({"slugline", "description", "path"}), or None."""
+        return self.plates.get(normalize_slugline(environment.slugline))
+
+
+    def reference_image_path_and_text_pairs(self, environment: EnvironmentInScene) -> List[Tuple[str, str]]:
+        """The plate of the location as (path, description) pairs, as taken by ReferenceImageSelector."""
+        plate = self.get(environment)
+        if plate is None:
+            return []
+        return [(
+            plate["path"],
+            f"An establishing frame of the location {plate['slugline']} from an earlier scene: {plate['description'].rstrip('.')}. "
+            f"Use it as the reference for the setting (architecture, props, lighting and colors) to keep the location consistent. "
+            f"The characters in it and their positions are not those of this frame.",
+        )]
+
+
+    def add(
+        self,
+        environment: EnvironmentInScene,
+        image_path: str,
+    ) -> bool:
+        """
+        Add `image_path` as the plate of the location of `environment` unless the location has one already.
+        Returns whether it was added.
+        """
+        key = normalize_slugline(environment.slugline)
+        with self._lock:
+            if key in self.plates:
+                return False
+            # sluglines in other scripts reduce to an empty or shared ASCII name, the digest keeps them apart
+            file_name = re.sub(r"[^0-9A-Za-z]+", "_", key).strip("_").lower()
+            file_name = f"{file_name}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}".lstrip("_")
+            plate_path = os.path.join(self.root_dir, file_name + os.path.splitext(image_path)[1])
+            link_artifact(image_path, plate_path)
+            self.plates[key] = {
+                "slugline": environment.slugline,
+                "description": environment.description,
+                "path": plate_path,
+            }
+            with atomic_open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(self.plates, f, ensure_ascii=False, indent=4)
+        return True
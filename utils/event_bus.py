@@ -0,0 +1,231 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+
+@dataclass(kw_only=True)
+class PipelineEvent:
+    message: str = ""
+    timestamp: float = field(default_factory=time.time)
+    context: Dict[str, Any] = field(default_factory=dict)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def event_type(self) -> str:
+        return type(self).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"event_type": self.event_type, **asdict(self)}
+
+
+@dataclass(kw_only=True)
+class StageStarted(PipelineEvent):
+    stage: str
+
+
+@dataclass(kw_only=True)
+class StageProgress(PipelineEvent):
+    stage: str
+
+
+@dataclass(kw_only=True)
+class StageFinished(PipelineEvent):
+    stage: str
+    duration: Optional[float] = None
+
+
+@dataclass(kw_only=True)
+class ArtifactReady(PipelineEvent):
+    stage: str
+    path: str
+
+
+@dataclass(kw_only=True)
+class CacheHit(PipelineEvent):
+    stage: str
+    path: Optional[str] = None
+
+
+@dataclass(kw_only=True)
+class Retry(PipelineEvent):
+    target: str
+    attempt: int
+    error: str
+
+
+@dataclass(kw_only=True)
+class ProviderLatency(PipelineEvent):
+    provider: str
+    duration: float
+    success: bool
+
+
+@dataclass(kw_only=True)
+class BytesTransferred(PipelineEvent):
+    direction: str  # "upload" or "download"
+    channel: str  # e.g. the host a file was downloaded from, or "artifact_store"
+    num_bytes: int
+
+
+EVENT_TYPES: Dict[str, Type[PipelineEvent]] = {
+    cls.__name__: cls
+    for cls in [StageStarted, StageProgress, StageFinished, ArtifactReady, CacheHit, Retry, ProviderLatency, BytesTransferred]
+}
+
+
+Sink = Callable[[PipelineEvent], None]
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for pipeline progress.
+
+    Pipelines publish typed events instead of printing; sinks (console, JSONL file, metrics, web
+    streams) subscribe to them. A child bus adds its context (e.g. job_id, scene_idx) to every event
+    and forwards it to its parent after its own sinks, so process-wide sinks only have to be
+    registered on the default bus. Sinks run synchronously in the publishing thread and must be cheap;
+    a failing sink is logged and does not affect the pipeline.
+    """
+
+    def __init__(
+        self,
+        sinks: Optional[List[Sink]] = None,
+        parent: Optional["EventBus"] = None,
+        context: Optional[Dict[str, Any]] = None,
+    ):
+        self.sinks: List[Sink] = list(sinks or [])
+        self.parent = parent
+        self.context = dict(context or {})
+
+
+    def subscribe(self, sink: Sink) -> Sink:
+        self.sinks.append(sink)
+        return sink
+
+
+    def unsubscribe(self, sink: Sink) -> None:
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+
+    def child(self, sinks: Optional[List[Sink]] = None, **context) -> "EventBus":
+        return EventBus(sinks=sinks, parent=self, context=context)
+
+
+    def publish(self, event: PipelineEvent) -> None:
+        event.context = {**self.context, **event.context}
+        for sink in list(self.sinks):
+            try:
+                sink(event)
+            except Exception as e:
+                logging.error(f"Event sink {sink!r} failed on {event.event_type}: {e}")
+        if self.parent is not None:
+            self.parent.publish(event)
+
+
+class ConsoleSink:
+    """Print the message of every event, which reproduces the console output of the pipelines."""
+
+    def __init__(
+        self,
+        event_types: Optional[Tuple[Type[PipelineEvent], ...]] = (StageStarted, StageProgress, StageFinished, ArtifactReady, CacheHit),
+    ):
+        """
+        Args:
+            event_types:
+            Only events of these types are printed. None prints everything.
+        """
+        self.event_types = event_types
+
+    def __call__(self, event: PipelineEvent) -> None:
+        if not event.message:
+            return
+        if self.event_types is not None and not isinstance(event, self.event_types):
+            return
+        print(event.message)
+
+
+class JsonlSink:
+    """
+    Append every event as one JSON line to a file.
+
+    Finished stages and ready artifacts are flushed right away; other events are buffered and flushed
+    with the first write at least `flush_interval` seconds after the last flush, or on close().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, "a", encoding="utf-8")
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, event: PipelineEvent) -> None:
+        line = json.dumps(event.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval or isinstance(event, (StageFinished, ArtifactReady)):
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class AsyncQueueSink:
+    """Forward events to an asyncio.Queue, e.g. to stream them to a web client. Safe to call from other threads."""
+
+    def __init__(
+        self,
+        queue: asyncio.Queue,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.queue = queue
+        self.loop = loop or asyncio.get_running_loop()
+
+    def __call__(self, event: PipelineEvent) -> None:
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            self.queue.put_nowait(event)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+def event_from_dict(data: Dict[str, Any]) -> PipelineEvent:
+    data = dict(data)
+    cls = EVENT_TYPES[data.pop("event_type")]
+    return cls(**data)
+
+
+_default_event_bus: Optional[EventBus] = None
+
+
+def get_default_event_bus() -> EventBus:
+    """The process-wide bus. It prints to the console unless replaced with set_default_event_bus."""
+    global _default_event_bus
+    if _default_event_bus is None:
+        _default_event_bus = EventBus(sinks=[ConsoleSink()])
+    return _default_event_bus
+
+
+def set_default_event_bus(event_bus: EventBus) -> None:
+    global _default_event_bus
+    _default_event_bus = event_bus
+
+
+def publish_event(event: PipelineEvent) -> None:
+    """Publish to the default bus, for code that is shared across pipelines such as tool adapters."""
+    get_default_event_bus().publish(event)
@@ -2,22 +2,42 @@ import logging
 import requests
 import base64
 import mimetypes
-from tenacity import retry
+from urllib.parse import urlparse
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
+from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError
+from utils.event_bus import BytesTransferred, publish_event
+from utils.artifacts import atomic_open
 from io import BytesIO
 import cv2
+from PIL import Image
 
 
-@retry
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, max=30),
+    retry=retry_if_not_exception_type(CircuitBreakerOpenError),
+    after=after_func,
+    reraise=True,
+)
 def download_image(url, save_path):
     try:
         logging.info(f"Downloading image from {url} to {save_path}")
 
-        response = requests.get(url, stream=True)
-        response.raise_for_status() # Check for HTTP errors
-
-        with open(save_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=1024):
-                file.write(chunk)
+        with get_circuit_breaker(urlparse(url).netloc):
+            response = requests.get(url, stream=True, timeout=60)
+            response.raise_for_status() # Check for HTTP errors
+
+            # written through a temporary file, so an interrupted download never leaves a truncated file at save_path
+            num_bytes = 0
+            with atomic_open(save_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=1024):
+                    file.write(chunk)
+                    num_bytes += len(chunk)
+                content_length = response.headers.get("Content-Length")
+                if content_length is not None and int(content_length) != num_bytes:
+                    raise IOError(f"Incomplete download from {url}: got {num_bytes} of {content_length} bytes")
+        publish_event(BytesTransferred(direction="download", channel=urlparse(url).netloc, num_bytes=num_bytes))
         logging.info(f"Image downloaded successfully to {save_path}")
 
     except Exception as e:
@@ -27,7 +47,10 @@ def download_image(url, save_path):
 
 def image_path_to_b64(image_path, mime: bool = True) -> str:
     with open(image_path, 'rb') as image_file:
-        b64 = base64.b64encode(image_file.read()).decode('utf-8')
+        data = image_file.read()
+    b64 = base64.b64encode(data).decode('utf-8')
+    # the encoded image is sent to a provider as a reference image
+    publish_event(BytesTransferred(direction="upload", channel="reference_image", num_bytes=len(data)))
 
     if mime:
         mime_type, _ = mimetypes.guess_type(image_path)
@@ -57,3 +80,12 @@ def save_base64_image(b64_string, save_path):
     with open(save_path, 'wb') as image_file:
         image_file.write(base64.b64decode(b64_string))
 
+
+
+def make_thumbnail(image_path, save_path, max_size: int = 512) -> str:
+    """Save a downscaled copy of the image (longest side <= max_size) and return its path."""
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        image.thumbnail((max_size, max_size))
+        image.save(save_path)
+    return save_path
@@ -0,0 +1,222 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from typing import List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from utils.artifacts import atomic_open
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class NovelKnowledgeBase:
+    """
+    A FAISS index over the chunks of a novel, persisted with save_local/load_local so that resuming a run
+    does not embed and index the whole novel again.
+
+    An index directory is kept per splitter configuration and embedding model (see `index_key`). Its
+    meta.json records the hash of the indexed text and the id of every chunk. When the text is unchanged the
+    index is loaded as is; when it changed (typically text appended to the novel), only the chunks that
+    differ from the indexed ones are removed or embedded and added. meta.json is written last, so an
+    interrupted update leaves the previous index usable.
+
+    `build` indexes a text held in memory. A novel that is read as a stream is indexed with `start_build`,
+    `add_chunks` for each batch of chunks as they are produced, and `finish_build`.
+    """
+
+    META_FILE_NAME = "meta.json"
+
+    def __init__(
+        self,
+        root_dir: str,
+        embeddings: Embeddings,
+        chunk_size: int = 512,
+        chunk_overlap: int = 128,
+        embedding_model: Optional[str] = None,
+    ):
+        """
+        Args:
+            embedding_model:
+            The name of the embedding model, part of the index key. Defaults to the `model` attribute of the embeddings.
+        """
+        self.root_dir = root_dir
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embedding_model = embedding_model or getattr(embeddings, "model", type(embeddings).__name__)
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+        )
+
+        self.vector_store: Optional[FAISS] = None
+        self.chunks: List[str] = []
+
+
+    @property
+    def index_key(self) -> str:
+        return _sha256(json.dumps({
+            "splitter": "RecursiveCharacterTextSplitter",
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model": self.embedding_model,
+        }, sort_keys=True))[:16]
+
+
+    @property
+    def index_dir(self) -> str:
+        return os.path.join(self.root_dir, f"faiss_{self.index_key}")
+
+
+    def _load_meta(self) -> Optional[dict]:
+        path = os.path.join(self.index_dir, self.META_FILE_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+    def start_build(self) -> None:
+        """
+        Start building the index from chunks passed to `add_chunks`, e.g. as a novel is read. The existing index
+        is loaded, so chunks it already holds are not embedded again.
+        """
+        self._meta = self._load_meta()
+        self._indexed_ids = set()
+        self._chunk_ids: List[str] = []
+        self._num_added = 0
+        self.vector_store = None
+        self.chunks = []
+
+        if self._meta is not None:
+            try:
+                self.vector_store = FAISS.load_local(
+                    self.index_dir,
+                    self.embeddings,
+                    index_name=self._meta["index_name"],
+                    # the index was written by this class into the working_dir
+                    allow_dangerous_deserialization=True,
+                )
+                self._indexed_ids = set(self._meta["chunk_ids"])
+            except Exception as e:
+                logging.warning(f"Failed to load the knowledge base index in {self.index_dir}, rebuilding it: {e}")
+                self.vector_store = None
+
+
+    def add_chunks(self, chunks: List[str]) -> None:
+        """Add the next chunks of the text, in order. Only chunks missing from the loaded index are embedded."""
+        # the position is part of the id, so a chunk that occurs twice is stored twice like in FAISS.from_texts
+        chunk_ids = [f"{len(self._chunk_ids) + idx}-{_sha256(chunk)[:16]}" for idx, chunk in enumerate(chunks)]
+        self._chunk_ids.extend(chunk_ids)
+
+        new_pairs = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in self._indexed_ids]
+        if new_pairs:
+            texts = [chunk for _, chunk in new_pairs]
+            ids = [chunk_id for chunk_id, _ in new_pairs]
+            if self.vector_store is None:
+                self.vector_store = FAISS.from_texts(texts=texts, embedding=self.embeddings, ids=ids)
+            else:
+                self.vector_store.add_texts(texts=texts, ids=ids)
+            self._num_added += len(new_pairs)
+
+        # reused chunks refer to the text held by the docstore rather than keeping a second copy
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            if chunk_id in self._indexed_ids:
+                chunk = self.vector_store.docstore.search(chunk_id).page_content
+            self.chunks.append(chunk)
+
+
+    def finish_build(self, text_hash: str, text_length: int) -> Tuple[FAISS, bool]:
+        """
+        Remove the chunks of the loaded index that are no longer part of the text and save the index.
+
+        Returns:
+            The vector store and whether it was loaded without changes.
+        """
+        meta = self._meta
+        current_ids = set(self._chunk_ids)
+        stale_ids = [chunk_id for chunk_id in meta["chunk_ids"] if chunk_id not in current_ids] if meta is not None and self._indexed_ids else []
+
+        if self._indexed_ids and self._num_added == 0 and not stale_ids and meta["text_hash"] == text_hash:
+            return self.vector_store, True
+
+        if self.vector_store is None:
+            raise ValueError("Cannot build a knowledge base without any chunk.")
+        if stale_ids:
+            self.vector_store.delete(ids=stale_ids)
+        if self._indexed_ids:
+            logging.info(f"Updated the knowledge base index: {self._num_added} chunks added, {len(stale_ids)} removed, {len(self._chunk_ids) - self._num_added} reused.")
+
+        version = 0 if meta is None else meta["version"] + 1
+        index_name = f"index_{version}"
+        self.vector_store.save_local(self.index_dir, index_name=index_name)
+        with atomic_open(os.path.join(self.index_dir, self.META_FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": version,
+                "index_name": index_name,
+                "text_hash": text_hash,
+                "text_length": text_length,
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "embedding_model": self.embedding_model,
+                "chunk_ids": self._chunk_ids,
+            }, f, ensure_ascii=False, indent=4)
+
+        # the files of the previous version are only removed once meta.json points to the new one
+        if meta is not None and meta["index_name"] != index_name:
+            for ext in (".faiss", ".pkl"):
+                old_path = os.path.join(self.index_dir, meta["index_name"] + ext)
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+        return self.vector_store, False
+
+
+    def build(self, text: str) -> Tuple[FAISS, bool]:
+        """
+        Load the index of `text`, updating or creating it if needed.
+
+        Returns:
+            The vector store and whether it was loaded without changes.
+        """
+        self.start_build()
+        self.add_chunks(self.splitter.split_text(text))
+        return self.finish_build(_sha256(text), len(text))
+
+
+    def batch_search(
+        self,
+        queries: List[str],
+        k: int = 10,
+    ) -> List[List[str]]:
+        """
+        Return the texts of the `k` nearest chunks of every query, like similarity_search(query, k) for each
+        of them, but with one embedding call for all queries and one FAISS search with the query matrix.
+        """
+        if self.vector_store is None:
+            raise RuntimeError("The knowledge base is not built, call build() first.")
+        if not queries:
+            return []
+
+        # embed_documents batches the queries and goes through the embedding cache
+        query_matrix = np.asarray(self.embeddings.embed_documents(queries), dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True).clip(min=1e-12)
+
+        _, indices = self.vector_store.index.search(query_matrix, k)
+
+        results = []
+        for row in indices:
+            texts = []
+            for i in row:
+                if i == -1:
+                    continue
+                document = self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[i])
+                texts.append(document.page_content)
+            results.append(texts)
+        return results
@@ -0,0 +1,32 @@
+import math
+from collections import deque
+from typing import Optional
+
+
+class LatencyTracker:
+    """Keeps a sliding window of recent latencies (in seconds) and answers percentile queries."""
+
+    def __init__(
+        self,
+        window_size: int = 100,
+    ):
+        self.samples = deque(maxlen=window_size)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile, q in [0, 100]. Returns None when no sample is recorded."""
+        if len(self.samples) == 0:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(1, math.ceil(q / 100 * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def mean(self) -> Optional[float]:
+        if len(self.samples) == 0:
+            return None
+        return sum(self.samples) / len(self.samples)
@@ -0,0 +1,255 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+from utils.event_bus import (
+    EventBus,
+    PipelineEvent,
+    StageStarted,
+    StageFinished,
+    ArtifactReady,
+    CacheHit,
+    Retry,
+    ProviderLatency,
+    BytesTransferred,
+    get_default_event_bus,
+)
+from utils.circuit_breaker import CircuitBreaker, get_all_circuit_breakers
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, start_http_server, CONTENT_TYPE_LATEST
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    CollectorRegistry = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# image and video APIs take from seconds to many minutes
+PROVIDER_LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+STAGE_DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+CIRCUIT_BREAKER_STATES = (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+
+
+def metrics_available() -> bool:
+    return CollectorRegistry is not None
+
+
+class PipelineMetrics:
+    """
+    Prometheus metrics of the pipelines and the providers they call.
+
+    An instance is an event bus sink: provider latencies, retries, cache hits, transferred bytes and
+    stage durations are derived from the pipeline events. In-flight calls and circuit breaker states
+    are read from the circuit breakers, and queue depths from the tracked queues, when scraped.
+
+    Requires prometheus_client (`pip install prometheus_client`).
+    """
+
+    def __init__(
+        self,
+        registry=None,
+        namespace: str = "vimax",
+        max_pending_stages: int = 10000,
+    ):
+        """
+        Args:
+            registry:
+            The prometheus_client CollectorRegistry to register the metrics in. A new one is created by default.
+
+            max_pending_stages:
+            The number of started stages remembered to compute their durations. The oldest are dropped first,
+            e.g. those of a pipeline that crashed before finishing them.
+        """
+        if not metrics_available():
+            raise ImportError("prometheus_client is required for metrics. Install it with `pip install prometheus_client`.")
+
+        self.registry = registry if registry is not None else CollectorRegistry()
+        self.namespace = namespace
+        self.max_pending_stages = max_pending_stages
+
+        self.provider_latency = Histogram(
+            "provider_latency_seconds",
+            "Latency of the calls to image, video and download endpoints, by circuit breaker (endpoint and model).",
+            labelnames=("provider", "success"),
+            buckets=PROVIDER_LATENCY_BUCKETS,
+            namespace=namespace,
+            registry=self.registry,
+        )
+        self.retries = Counter(
+            "retries",
+            "Retried calls, by retried function.",
+            labelnames=("target",),
+            namespace=namespace,
+            registry=self.registry,
+        )
+        self.cache_lookups = Counter(
+            "cache_lookups",
+            "Artifacts looked up in the working_dir, by stage. A hit skips the stage, a miss produces a new artifact.",
+            labelnames=("stage", "result"),
+            namespace=namespace,
+            registry=self.registry,
+        )
+        self.transferred_bytes = Counter(
+            "transferred_bytes",
+            "Bytes uploaded and downloaded, by channel.",
+            labelnames=("direction", "channel"),
+            namespace=namespace,
+            registry=self.registry,
+        )
+        self.stage_duration = Histogram(
+            "stage_duration_seconds",
+            "Duration of the pipeline stages.",
+            labelnames=("stage",),
+            buckets=STAGE_DURATION_BUCKETS,
+            namespace=namespace,
+            registry=self.registry,
+        )
+
+        self.job_queues = []
+        self.work_queues = []
+        self.registry.register(_StateCollector(self))
+
+        self._pending_stages: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def track_job_queue(self, queue) -> None:
+        """Report the number of jobs per status of a jobs.JobQueue."""
+        self.job_queues.append(queue)
+
+
+    def track_work_queue(self, queue) -> None:
+        """Report the number of work units per status of a distributed.WorkQueue."""
+        self.work_queues.append(queue)
+
+
+    @staticmethod
+    def _stage_key(event: PipelineEvent) -> Hashable:
+        # stages of different shots, frames or scenes run concurrently; their context and attributes tell them apart
+        return (
+            event.stage,
+            json.dumps(event.context, sort_keys=True, default=str),
+            json.dumps(event.attributes, sort_keys=True, default=str),
+        )
+
+
+    def _observe_stage(self, event: PipelineEvent) -> None:
+        key = self._stage_key(event)
+        with self._lock:
+            if isinstance(event, StageStarted):
+                self._pending_stages[key] = event.timestamp
+                self._pending_stages.move_to_end(key)
+                while len(self._pending_stages) > self.max_pending_stages:
+                    self._pending_stages.popitem(last=False)
+                return
+            start_time = self._pending_stages.pop(key, None)
+
+        duration = getattr(event, "duration", None)
+        if duration is None and start_time is not None:
+            duration = event.timestamp - start_time
+        if duration is not None:
+            self.stage_duration.labels(stage=event.stage).observe(duration)
+
+
+    def __call__(self, event: PipelineEvent) -> None:
+        if isinstance(event, ProviderLatency):
+            self.provider_latency.labels(provider=event.provider, success=str(event.success).lower()).observe(event.duration)
+        elif isinstance(event, Retry):
+            self.retries.labels(target=event.target).inc()
+        elif isinstance(event, BytesTransferred):
+            self.transferred_bytes.labels(direction=event.direction, channel=event.channel).inc(event.num_bytes)
+        elif isinstance(event, CacheHit):
+            self.cache_lookups.labels(stage=event.stage, result="hit").inc()
+        elif isinstance(event, ArtifactReady):
+            self.cache_lookups.labels(stage=event.stage, result="miss").inc()
+            self._observe_stage(event)
+        elif isinstance(event, (StageStarted, StageFinished)):
+            self._observe_stage(event)
+
+
+    def generate_latest(self) -> bytes:
+        """The metrics in the Prometheus text format, for serving them from an existing web server."""
+        return generate_latest(self.registry)
+
+
+class _StateCollector:
+    """Collects the gauges that are read at scrape time instead of being derived from events."""
+
+    def __init__(self, metrics: PipelineMetrics):
+        self.metrics = metrics
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        prefix = self.metrics.namespace + "_" if self.metrics.namespace else ""
+
+        in_flight = GaugeMetricFamily(f"{prefix}provider_in_flight", "Calls currently in flight, by circuit breaker.", labels=["provider"])
+        breaker_state = GaugeMetricFamily(f"{prefix}circuit_breaker_state", "1 for the current state of every circuit breaker.", labels=["provider", "state"])
+        for name, breaker in get_all_circuit_breakers().items():
+            in_flight.add_metric([name], breaker.in_flight)
+            state = breaker.state
+            for candidate in CIRCUIT_BREAKER_STATES:
+                breaker_state.add_metric([name, candidate], 1 if candidate == state else 0)
+        yield in_flight
+        yield breaker_state
+
+        yield self._queue_depth(f"{prefix}job_queue_depth", "Jobs in the job queue, by status.", self.metrics.job_queues, ("queued", "running"))
+        yield self._queue_depth(f"{prefix}work_queue_depth", "Work units in the shot work queue, by status.", self.metrics.work_queues, ("pending", "running"))
+
+    @staticmethod
+    def _queue_depth(name: str, documentation: str, queues: List, statuses) -> "GaugeMetricFamily":
+        gauge = GaugeMetricFamily(name, documentation, labels=["status"])
+        counts: Dict[str, int] = {status: 0 for status in statuses}
+        for queue in queues:
+            for status in statuses:
+                try:
+                    counts[status] += queue.count(status)
+                except Exception as e:
+                    logging.warning(f"Failed to read the depth of {queue!r}: {e}")
+        if queues:
+            for status, count in counts.items():
+                gauge.add_metric([status], count)
+        return gauge
+
+
+_metrics: Optional[PipelineMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Optional[PipelineMetrics]:
+    """The metrics enabled with enable_metrics, or None."""
+    return _metrics
+
+
+def enable_metrics(
+    event_bus: Optional[EventBus] = None,
+    port: Optional[int] = None,
+    addr: str = "0.0.0.0",
+) -> Optional[PipelineMetrics]:
+    """
+    Collect the metrics of this process by subscribing a PipelineMetrics to the event bus (the default bus
+    by default). Calling it again returns the same instance.
+
+    Args:
+        port:
+        Serve the metrics on http://<addr>:<port>/metrics from a background thread. None only collects them,
+        e.g. for a service that exposes them on its own route.
+
+    Returns:
+        The PipelineMetrics, or None if prometheus_client is not installed.
+    """
+    global _metrics
+    if not metrics_available():
+        logging.warning("prometheus_client is not installed, metrics are disabled.")
+        return None
+
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = PipelineMetrics()
+            (event_bus or get_default_event_bus()).subscribe(_metrics)
+            if port is not None:
+                start_http_server(port, addr=addr, registry=_metrics.registry)
+                logging.info(f"Serving metrics on {addr}:{port}")
+    return _metrics
@@ -0,0 +1,105 @@
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Tuple
+from langchain_text_splitters import TextSplitter
+
+
+class NovelTextStream:
+    """
+    Reads a text file in blocks of about `block_size` characters, so that a novel of any size is never held
+    in memory at once. Blocks end at a line break when there is one, which keeps paragraphs whole for the
+    splitters. The sha256 and length of the text are computed while it is read and are complete once the
+    stream is exhausted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_size: int = 1024 * 1024,
+        encoding: str = "utf-8",
+    ):
+        self.path = path
+        self.block_size = block_size
+        self.encoding = encoding
+        self._sha256 = hashlib.sha256()
+        self.length = 0
+
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+
+    def __iter__(self) -> Iterator[str]:
+        carry = ""
+        with open(self.path, "r", encoding=self.encoding) as f:
+            while True:
+                data = f.read(self.block_size)
+                if not data:
+                    break
+                text = carry + data
+                cut = text.rfind("\n") + 1
+                if cut <= 0:
+                    cut = len(text)
+                block, carry = text[:cut], text[cut:]
+                if block:
+                    yield self._count(block)
+        if carry:
+            yield self._count(carry)
+
+
+    def _count(self, block: str) -> str:
+        self._sha256.update(block.encode("utf-8"))
+        self.length += len(block)
+        return block
+
+
+class IncrementalSplitter:
+    """
+    Applies a text splitter to text that arrives piece by piece. Complete chunks are returned as soon as
+    the text after them is known; the last (possibly incomplete) chunk is kept and split again together
+    with the next piece, so its overlap with the previous chunk is preserved. The buffer never grows
+    beyond one chunk plus one piece.
+    """
+
+    def __init__(
+        self,
+        splitter: TextSplitter,
+    ):
+        self.splitter = splitter
+        self.buffer = ""
+
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        chunks = self.splitter.split_text(self.buffer)
+        if len(chunks) < 2:
+            return []
+        # split_text strips whitespace, so the kept chunk is located in the buffer rather than sliced by length
+        start = self.buffer.rfind(chunks[-1])
+        self.buffer = self.buffer[start:] if start >= 0 else chunks[-1]
+        return chunks[:-1]
+
+
+    def flush(self) -> List[str]:
+        chunks = self.splitter.split_text(self.buffer)
+        self.buffer = ""
+        return chunks
+
+
+def iter_shared_chunks(
+    blocks: Iterable[str],
+    splitters: Dict[str, TextSplitter],
+) -> Iterator[Tuple[str, str]]:
+    """
+    Split the text of `blocks` with several splitters in one pass over it, e.g. large chunks for the
+    compression and small ones for the knowledge base. Yields (splitter name, chunk) pairs as the chunks
+    are produced, in the order of the text for each splitter.
+    """
+    incremental_splitters = {name: IncrementalSplitter(splitter) for name, splitter in splitters.items()}
+    for block in blocks:
+        for name, incremental_splitter in incremental_splitters.items():
+            for chunk in incremental_splitter.feed(block):
+                yield name, chunk
+    for name, incremental_splitter in incremental_splitters.items():
+        for chunk in incremental_splitter.flush():
+            yield name, chunk
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import logging
+from typing import List, Optional, Dict, Any
+from utils.config import init_from_class_path
+from utils.latency import LatencyTracker
+from utils.circuit_breaker import CircuitBreaker
+
+
+class RoutedProvider:
+    """A generator adapter plus the live statistics the router uses to pick it."""
+
+    def __init__(
+        self,
+        generator,
+        name: Optional[str] = None,
+        weight: float = 1.0,
+        max_reference_images: Optional[int] = None,
+        window_size: int = 50,
+    ):
+        self.generator = generator
+        self.name = name or type(generator).__name__
+        self.weight = weight
+        # None means the provider has no limit on the number of reference images
+        self.max_reference_images = max_reference_images if max_reference_images is not None else getattr(generator, "max_reference_images", None)
+
+        # adapters expose the circuit breaker of their endpoint, an open circuit means the provider is down
+        self.circuit_breaker = getattr(generator, "circuit_breaker", None)
+
+        self.in_flight = 0
+        self.latency_tracker = LatencyTracker(window_size=window_size)
+        self.error_rate = 0.0
+        self.cooldown_until = 0.0
+
+    def supports(self, num_reference_images: int) -> bool:
+        return self.max_reference_images is None or num_reference_images <= self.max_reference_images
+
+    def is_degraded(self) -> bool:
+        if self.circuit_breaker is not None and self.circuit_breaker.state == CircuitBreaker.OPEN:
+            return True
+        return time.monotonic() < self.cooldown_until
+
+
+class ProviderRouter:
+    """
+    Routes each call to one of several providers and fails over to the next one on error.
+
+    Providers are ranked by weight / ((in_flight + 1) * mean_latency * (1 + error_penalty * error_rate)),
+    so a provider with a long queue, slow responses or recent failures gets less traffic.
+    A provider whose error rate exceeds the threshold, or whose circuit breaker is open, is
+    only used when no healthy provider is left.
+    """
+
+    def __init__(
+        self,
+        providers: List[Dict[str, Any]],
+        error_rate_threshold: float = 0.5,
+        error_rate_decay: float = 0.2,
+        error_penalty: float = 4.0,
+        cooldown: float = 60.0,
+    ):
+        """
+        Args:
+            providers:
+            A list of items like {"generator": {class_path, init_args} or instance, "weight": 1.0, "max_reference_images": 2, "name": "..."}.
+        """
+        if len(providers) == 0:
+            raise ValueError("At least one provider is required")
+
+        self.providers: List[RoutedProvider] = []
+        for item in providers:
+            item = dict(item)
+            generator = item.pop("generator")
+            if isinstance(generator, dict):
+                generator = init_from_class_path(generator)
+            self.providers.append(RoutedProvider(generator=generator, **item))
+
+        self.error_rate_threshold = error_rate_threshold
+        self.error_rate_decay = error_rate_decay
+        self.error_penalty = error_penalty
+        self.cooldown = cooldown
+
+
+    def score(self, provider: RoutedProvider) -> float:
+        latency = provider.latency_tracker.mean()
+        if latency is None:
+            # optimistic guess for providers without samples: the average of the others
+            known_latencies = [p.latency_tracker.mean() for p in self.providers if len(p.latency_tracker) > 0]
+            latency = sum(known_latencies) / len(known_latencies) if known_latencies else 1.0
+        latency = max(latency, 1e-3)
+        return provider.weight / ((provider.in_flight + 1) * latency * (1 + self.error_penalty * provider.error_rate))
+
+
+    def rank_providers(self, num_reference_images: int) -> List[RoutedProvider]:
+        eligible = [p for p in self.providers if p.supports(num_reference_images)]
+        if len(eligible) == 0:
+            raise ValueError(f"No provider supports {num_reference_images} reference images")
+        healthy = sorted([p for p in eligible if not p.is_degraded()], key=self.score, reverse=True)
+        degraded = sorted([p for p in eligible if p.is_degraded()], key=self.score, reverse=True)
+        return healthy + degraded
+
+
+    def record_success(self, provider: RoutedProvider, latency: float) -> None:
+        provider.latency_tracker.record(latency)
+        provider.error_rate = (1 - self.error_rate_decay) * provider.error_rate
+
+
+    def record_failure(self, provider: RoutedProvider) -> None:
+        provider.error_rate = (1 - self.error_rate_decay) * provider.error_rate + self.error_rate_decay
+        if provider.error_rate >= self.error_rate_threshold and not provider.is_degraded():
+            provider.cooldown_until = time.monotonic() + self.cooldown
+            logging.warning(f"Provider {provider.name} is degraded (error rate {provider.error_rate:.2f}), cooling down for {self.cooldown}s.")
+
+
+    async def call(
+        self,
+        method_name: str,
+        num_reference_images: int,
+        **kwargs,
+    ):
+        errors = []
+        for provider in self.rank_providers(num_reference_images):
+            provider.in_flight += 1
+            start_time = time.monotonic()
+            try:
+                result = await getattr(provider.generator, method_name)(**kwargs)
+                if result is None:
+                    raise ValueError(f"{provider.name}.{method_name} returned no result")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.record_failure(provider)
+                errors.append(f"{provider.name}: {e}")
+                logging.warning(f"Provider {provider.name} failed on {method_name}: {e}. Failing over to the next provider...")
+                continue
+            finally:
+                provider.in_flight -= 1
+
+            self.record_success(provider, time.monotonic() - start_time)
+            return result
+
+        raise RuntimeError(f"All providers failed on {method_name}: {errors}")
@@ -0,0 +1,95 @@
+import os
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+
+class RerankScoreCache:
+    """
+    Reranker scores persisted in a SQLite database, keyed by (namespace, query hash, document hash).
+
+    The namespace identifies the scoring function (backend, model and anything else the scores depend on),
+    so one database can be shared by several rerankers and a changed model never returns stale scores.
+    Scores are written with INSERT OR REPLACE in one transaction per batch, so concurrent processes
+    (e.g. several workers on the same working_dir) may share the file.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+    ):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scores (
+                    namespace TEXT NOT NULL,
+                    query_hash TEXT NOT NULL,
+                    document_hash TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, query_hash, document_hash)
+                )
+                """
+            )
+
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+    def get_many(
+        self,
+        namespace: str,
+        keys: Iterable[Tuple[str, str]],
+    ) -> Dict[Tuple[str, str], float]:
+        """Return the stored scores of the (query hash, document hash) keys; missing keys are left out."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self.connect() as conn:
+            # one query per query hash keeps the number of bound parameters small
+            document_hashes_by_query: Dict[str, List[str]] = {}
+            for query_hash, document_hash in keys:
+                document_hashes_by_query.setdefault(query_hash, []).append(document_hash)
+            for query_hash, document_hashes in document_hashes_by_query.items():
+                for start in range(0, len(document_hashes), 500):
+                    batch = document_hashes[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT document_hash, score FROM scores WHERE namespace = ? AND query_hash = ? AND document_hash IN ({', '.join('?' * len(batch))})",
+                        (namespace, query_hash, *batch),
+                    ).fetchall()
+                    for document_hash, score in rows:
+                        found[(query_hash, document_hash)] = score
+        return found
+
+
+    def put_many(
+        self,
+        namespace: str,
+        scores: Dict[Tuple[str, str], float],
+    ) -> None:
+        if not scores:
+            return
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (namespace, query_hash, document_hash, score, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, query_hash, document_hash, score, now) for (query_hash, document_hash), score in scores.items()],
+            )
+            conn.execute("COMMIT")
+
+
+    def clear(self, namespace: str) -> None:
+        with self.connect() as conn:
+            conn.execute("DELETE FROM scores WHERE namespace = ?", (namespace,))
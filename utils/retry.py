@@ -1,9 +1,11 @@
 import tenacity
 import traceback
 import logging
+from utils.event_bus import Retry, publish_event
 
 def after_func(retry_state: tenacity.RetryCallState) -> None:
     if retry_state.outcome.failed:
         exc = retry_state.outcome.exception()
         logging.warning(f"Retrying {retry_state.fn.__name__} due to {repr(exc)} (Attempt {retry_state.attempt_number})")
         logging.debug(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        publish_event(Retry(target=retry_state.fn.__name__, attempt=retry_state.attempt_number, error=repr(exc)))
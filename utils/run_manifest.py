@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Literal, Optional
+from utils.artifacts import atomic_open, validate_artifact
+
+
+ArtifactStatus = Literal["complete", "invalid"]
+
+MANIFEST_FILE_NAME = "run_manifest.db"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class RunManifest:
+    """
+    The state of one pipeline run, kept in a SQLite database in its working_dir.
+
+    Stage outputs (characters, storyboard, shot descriptions, reference selections, ...) are stored as
+    JSON rows keyed by name, e.g. 'storyboard' or 'shot_description/3'. A row is written in its own
+    transaction, so incremental updates (one character's portraits, one shot's description) only touch
+    that row. Artifacts (frames, videos, portraits) are recorded with their size and sha256, which makes
+    resume queries such as "which shots lack a video" a single SELECT.
+
+    Every output row remembers the legacy JSON file it used to be written to. get_output falls back to
+    that file for working_dirs created before the manifest, and export_legacy_layout writes the files
+    back for tools that still read them. Rows sharing a legacy file (e.g. the portraits of every
+    character) are merged into one JSON object on export.
+
+    Artifact paths are stored relative to the working_dir, so the records survive moving a working_dir.
+    Outputs are stored as given: paths inside them (e.g. the portraits of a registry, which other
+    working_dirs refer to) stay as the pipeline wrote them.
+    """
+
+    def __init__(
+        self,
+        working_dir: str,
+        db_name: str = MANIFEST_FILE_NAME,
+    ):
+        self.working_dir = working_dir
+        self.db_path = os.path.join(working_dir, db_name)
+        os.makedirs(working_dir, exist_ok=True)
+
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outputs (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    shot_idx INTEGER,
+                    data TEXT NOT NULL,
+                    legacy_path TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    path TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    shot_idx INTEGER,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_stage ON outputs (stage, shot_idx)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_stage ON artifacts (stage, shot_idx, status)")
+
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+    def _relative_path(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.working_dir)).replace(os.sep, "/")
+
+
+    def _absolute_path(self, relative_path: str) -> str:
+        return os.path.join(self.working_dir, *relative_path.split("/"))
+
+
+    def put_output(
+        self,
+        key: str,
+        stage: str,
+        data: Any,
+        shot_idx: Optional[int] = None,
+        legacy_path: Optional[str] = None,
+    ) -> None:
+        """
+        Store a JSON-serializable stage output, replacing the previous value of the key.
+
+        Args:
+            legacy_path:
+            The JSON file the output used to be written to, relative to the working_dir, e.g. 'shots/3/shot_description.json'.
+        """
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO outputs (key, stage, shot_idx, data, legacy_path, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, shot_idx, json.dumps(data, ensure_ascii=False), legacy_path, time.time()),
+            )
+
+
+    def get_output(
+        self,
+        key: str,
+        stage: Optional[str] = None,
+        shot_idx: Optional[int] = None,
+        legacy_path: Optional[str] = None,
+    ) -> Optional[Any]:
+        """
+        Return the stored output, or None. If the key is missing and `legacy_path` exists in the working_dir,
+        the legacy file is imported under `key` (which then requires `stage`) and returned.
+        """
+        with self.connect() as conn:
+            row = conn.execute("SELECT data FROM outputs WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return json.loads(row["data"])
+
+        if legacy_path is not None and os.path.exists(self._absolute_path(legacy_path)):
+            with open(self._absolute_path(legacy_path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.put_output(key, stage=stage, data=data, shot_idx=shot_idx, legacy_path=legacy_path)
+            return data
+        return None
+
+
+    def get_outputs(self, stage: str) -> Dict[str, Any]:
+        """Return {key: output} of every output of a stage."""
+        with self.connect() as conn:
+            rows = conn.execute("SELECT key, data FROM outputs WHERE stage = ? ORDER BY key", (stage,)).fetchall()
+        return {row["key"]: json.loads(row["data"]) for row in rows}
+
+
+    def record_artifact(
+        self,
+        path: str,
+        stage: str,
+        shot_idx: Optional[int] = None,
+        sha256: Optional[str] = None,
+        status: ArtifactStatus = "complete",
+    ) -> None:
+        """
+        Record a file produced by a stage. The checksum is computed unless given; recording an unchanged
+        file again (same size and mtime) does not read it.
+        """
+        relative_path = self._relative_path(path)
+        stat = os.stat(path)
+        if sha256 is None:
+            with self.connect() as conn:
+                row = conn.execute("SELECT size, mtime, sha256, status FROM artifacts WHERE path = ?", (relative_path,)).fetchone()
+            if row is not None and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime and row["status"] == status:
+                return
+            sha256 = file_sha256(path)
+
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (path, stage, shot_idx, size, mtime, sha256, status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (relative_path, stage, shot_idx, stat.st_size, stat.st_mtime, sha256, status, time.time()),
+            )
+
+
+    def artifact_is_complete(
+        self,
+        path: str,
+        stage: str,
+        shot_idx: Optional[int] = None,
+    ) -> bool:
+        """
+        Whether a resumed run can reuse the file at `path`.
+
+        A file that matches its record (same size and mtime) is trusted without reading it. Any other file
+        gets a structural check (see utils.artifacts.validate_artifact) and is recorded if it passes. A file
+        that fails it, e.g. a video truncated by a crash during its download, is recorded as invalid and
+        removed so that it is generated again.
+        """
+        if not os.path.exists(path):
+            return False
+
+        record = self.get_artifact(path)
+        stat = os.stat(path)
+        if record is not None and record["status"] == "complete" and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime:
+            return True
+
+        if validate_artifact(path):
+            self.record_artifact(path, stage=stage, shot_idx=shot_idx)
+            return True
+
+        logging.warning(f"Artifact {path} is incomplete or corrupted, it will be generated again.")
+        self.record_artifact(path, stage=stage, shot_idx=shot_idx, status="invalid")
+        os.remove(path)
+        return False
+
+
+    def get_artifact(self, path: str) -> Optional[Dict[str, Any]]:
+        """Return the record of an artifact ({"path", "stage", "shot_idx", "size", "mtime", "sha256", "status"}), or None."""
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM artifacts WHERE path = ?", (self._relative_path(path),)).fetchone()
+        return dict(row) if row is not None else None
+
+
+    def list_artifacts(self, stage: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self.connect() as conn:
+            if stage is None:
+                rows = conn.execute("SELECT * FROM artifacts ORDER BY path").fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM artifacts WHERE stage = ? ORDER BY path", (stage,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+    def shot_idxs(self) -> List[int]:
+        """The shots of the run, i.e. those with a decomposed visual description."""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT shot_idx FROM outputs WHERE stage = 'decompose_visual_descriptions' AND shot_idx IS NOT NULL ORDER BY shot_idx"
+            ).fetchall()
+        return [row["shot_idx"] for row in rows]
+
+
+    def shots_missing(
+        self,
+        stage: str = "generate_video",
+        shot_idxs: Optional[Iterable[int]] = None,
+    ) -> List[int]:
+        """
+        Return the shots without a complete artifact of the stage, e.g. the shots that lack a video.
+
+        Args:
+            shot_idxs:
+            The shots to check. Defaults to all shots of the run.
+        """
+        shot_idxs = list(shot_idxs) if shot_idxs is not None else self.shot_idxs()
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT shot_idx FROM artifacts WHERE stage = ? AND status = 'complete' AND shot_idx IS NOT NULL",
+                (stage,),
+            ).fetchall()
+        done = {row["shot_idx"] for row in rows}
+        return [shot_idx for shot_idx in shot_idxs if shot_idx not in done]
+
+
+    def export_legacy_layout(self, target_dir: Optional[str] = None) -> List[str]:
+        """
+        Write the outputs to the JSON files of the legacy working_dir layout (characters.json, storyboard.json,
+        shots/<idx>/shot_description.json, ...). Returns the written paths.
+
+        Args:
+            target_dir:
+            Where to write the files. Defaults to the working_dir.
+        """
+        target_dir = target_dir or self.working_dir
+        with self.connect() as conn:
+            rows = conn.execute("SELECT legacy_path, data FROM outputs WHERE legacy_path IS NOT NULL ORDER BY legacy_path, key").fetchall()
+
+        files: Dict[str, Any] = {}
+        for row in rows:
+            data = json.loads(row["data"])
+            if row["legacy_path"] in files:
+                files[row["legacy_path"]].update(data)
+            else:
+                files[row["legacy_path"]] = data
+
+        written = []
+        for legacy_path, data in files.items():
+            path = os.path.join(target_dir, *legacy_path.split("/"))
+            with atomic_open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            written.append(path)
+        return written
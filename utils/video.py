@@ -1,22 +1,64 @@
 import logging
 import requests
-from tenacity import retry
+from typing import List
+from moviepy import VideoFileClip, concatenate_videoclips
+from urllib.parse import urlparse
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
+from utils.retry import after_func
+from utils.circuit_breaker import get_circuit_breaker, CircuitBreakerOpenError
+from utils.event_bus import BytesTransferred, publish_event
+from utils.artifacts import atomic_open, atomic_path
 
 
-@retry
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, max=30),
+    retry=retry_if_not_exception_type(CircuitBreakerOpenError),
+    after=after_func,
+    reraise=True,
+)
 def download_video(url, save_path):
     try:
         logging.info(f"Downloading video from {url} to {save_path}")
 
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # 检查请求是否成功
-    
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        with get_circuit_breaker(urlparse(url).netloc):
+            response = requests.get(url, stream=True, timeout=60)
+            response.raise_for_status()  # 检查请求是否成功
+
+            # written through a temporary file, so an interrupted download never leaves a truncated file at save_path
+            num_bytes = 0
+            with atomic_open(save_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    f.write(chunk)
+                    num_bytes += len(chunk)
+                content_length = response.headers.get("Content-Length")
+                if content_length is not None and int(content_length) != num_bytes:
+                    raise IOError(f"Incomplete download from {url}: got {num_bytes} of {content_length} bytes")
+        publish_event(BytesTransferred(direction="download", channel=urlparse(url).netloc, num_bytes=num_bytes))
 
         logging.info(f"Video downloaded successfully to {save_path}")
     
     except Exception as e:
         logging.error(f"Error downloading video: {e}")
         raise e
+
+
+def concatenate_video_files(video_paths: List[str], save_path: str, **write_kwargs) -> None:
+    """
+    Concatenate the videos at `video_paths` into `save_path`, written atomically. Encoding blocks for minutes,
+    so pipelines call it through asyncio.to_thread. The clips are closed afterwards, which releases their
+    ffmpeg reader processes.
+    """
+    video_clips = []
+    try:
+        for video_path in video_paths:
+            video_clips.append(VideoFileClip(video_path))
+        final_video = concatenate_videoclips(video_clips)
+        try:
+            with atomic_path(save_path) as tmp_path:
+                final_video.write_videofile(tmp_path, **write_kwargs)
+        finally:
+            final_video.close()
+    finally:
+        for video_clip in video_clips:
+            video_clip.close()